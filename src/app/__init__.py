@@ -1,8 +1,18 @@
 '''
 Docstring
 '''
+from contextlib import asynccontextmanager
+from functools import partial
 from fastapi import FastAPI
-from app.routers import Northbound_apis
+from app.routers import Northbound_apis, admin_apis, metrics_apis
+from app.helpers.pcf_http2_requests import close_pcf_pool
+from app.helpers.callback import notification_dispatcher
+from app.services.db import SUBSCRIPTION_STORE
+from app.services.qos_catalogue import qos_catalogue
+from app.services.change_feed import change_feed
+from app.services.teardown import teardown_manager
+from app.services.Northbound_apis_svc import resume_teardowns
+from app.utils.metrics import RouteMetricsMiddleware, event_loop_lag_monitor
 
 # FastAPI object customization
 FASTAPI_TITLE = "AsSessionWithQoS"
@@ -11,10 +21,40 @@ FASTAPI_VERSION = "0.109.0"
 FASTAPI_OPEN_API_URL = "/"
 FASTAPI_DOCS_URL = "/docs"
 
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Rebuild subscriptions from the snapshot and write-ahead log (no-op for the memory backend)
+    await SUBSCRIPTION_STORE.open()
+    notification_dispatcher.start()
+    qos_catalogue.start()
+    # Asynchronous deletes left unfinished by a restart are resumed from the store
+    teardown_manager.resume = partial(resume_teardowns, SUBSCRIPTION_STORE)
+    teardown_manager.start()
+    event_loop_lag_monitor.start()
+    yield
+    await event_loop_lag_monitor.stop()
+    # End open watch streams so the server does not wait on them
+    change_feed.close()
+    # Before the dispatcher: finished teardowns still queue SESSION_TERMINATION callbacks
+    await teardown_manager.stop()
+    await qos_catalogue.stop()
+    await notification_dispatcher.stop()
+    # Close the pooled HTTP/2 connections towards the PCF
+    await close_pcf_pool()
+    await SUBSCRIPTION_STORE.close()
+
+
 _app = FastAPI(title=FASTAPI_TITLE,
               description=FASTAPI_DESCRIPTION,
               version=FASTAPI_VERSION,
               docs_url=FASTAPI_DOCS_URL,
-              openapi_url=FASTAPI_OPEN_API_URL)
+              openapi_url=FASTAPI_OPEN_API_URL,
+              lifespan=lifespan)
+
+_app.include_router(Northbound_apis.router, prefix="/3gpp-as-session-with-qos/v1")
+_app.include_router(admin_apis.router, prefix="/admin")
+_app.include_router(metrics_apis.router)
 
-_app.include_router(Northbound_apis.router, prefix="/3gpp-as-session-with-qos/v1")
\ No newline at end of file
+# Latency histograms per route and status, served on /metrics
+_app.add_middleware(RouteMetricsMiddleware)
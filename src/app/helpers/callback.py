@@ -1,35 +1,444 @@
+import asyncio
+import json
+import os
+import random
+import threading
+import time
 import httpx
+from collections import deque
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Deque, Dict, List, Optional, Tuple
 from app.utils.log import get_app_logger
-from uuid import uuid4
+from app.utils.metrics import CALLBACK_SECONDS, CALLBACK_FAILURES, CALLBACK_DEAD_LETTERS
 from app.schemas.qos_models import UserPlaneNotificationData, UserPlaneEvent, UserPlaneEventReport
-from app.utils.app_config import NEF_BASE_URL
+from app.utils.app_config import (
+    NEF_BASE_URL,
+    CALLBACK_QUEUE_SIZE,
+    CALLBACK_WORKERS,
+    CALLBACK_MAX_PER_ORIGIN,
+    CALLBACK_TIMEOUT,
+    CALLBACK_COALESCE_WINDOW,
+    CALLBACK_MAX_EVENTS_PER_NOTIFICATION,
+    CALLBACK_MAX_ATTEMPTS,
+    CALLBACK_RETRY_BASE_DELAY,
+    CALLBACK_RETRY_MAX_DELAY,
+    CALLBACK_MAX_PENDING_RETRIES,
+    CALLBACK_DEAD_LETTER_FILE,
+)
 
 
 logger = get_app_logger()
 
+_DELIVERED = CALLBACK_SECONDS.labels("delivered")
+_REJECTED = CALLBACK_SECONDS.labels("rejected")
+_UNREACHABLE = CALLBACK_SECONDS.labels("unreachable")
+_FAILED_TRANSPORT = CALLBACK_FAILURES.labels("transport")
+_FAILED_4XX = CALLBACK_FAILURES.labels("status_4xx")
+_FAILED_5XX = CALLBACK_FAILURES.labels("status_5xx")
+_DEAD_LETTERED = CALLBACK_DEAD_LETTERS.labels()
 
-async def send_callback_to_as(notification_destination: str, scsAsId, subscriptionId, event: UserPlaneEvent):
-    """Callback back to AS with bearer event information."""
-    
-    transaction_url = f"{NEF_BASE_URL}/3gpp-as-session-with-qos/v1/{scsAsId}/subscriptions/{subscriptionId}"
+
+def transaction_url(scsAsId, subscriptionId) -> str:
+    return f"{NEF_BASE_URL}/3gpp-as-session-with-qos/v1/{scsAsId}/subscriptions/{subscriptionId}"
+
+
+def build_notification(transaction: str, events: List[UserPlaneEvent]) -> bytes:
+    """UserPlaneNotificationData body carrying one report per bearer event, in order."""
     payload = UserPlaneNotificationData(
-        transaction=transaction_url,
-        eventReports=[
-            UserPlaneEventReport(event=event)
-        ]
+        transaction=transaction,
+        eventReports=[UserPlaneEventReport(event=event) for event in events]
     )
-    
-    payload_json = payload.model_dump_json()
-    
+    return payload.model_dump_json().encode("utf-8")
+
+
+def destination_origin(notification_destination: str) -> str:
+    """scheme://host:port of a notificationDestination, the unit of connection reuse."""
+    url = httpx.URL(notification_destination)
+    port = url.port or (443 if url.scheme == "https" else 80)
+    return f"{url.scheme}://{url.host}:{port}"
+
+
+# AF answers worth retrying; any other 4xx is treated as permanent
+RETRYABLE_STATUS_CODES = {408, 425, 429, 500, 502, 503, 504}
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Retry-After as delay-seconds or HTTP-date, in seconds from now."""
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
     try:
-        async with httpx.AsyncClient() as client:
-            response = await client.post(
-                str(notification_destination),
-                content=payload_json,
-                headers={"Content-Type": "application/json"}
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=timezone.utc)
+    return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+
+
+class DeadLetterSpool:
+    """Append-only NDJSON file holding notifications that ran out of delivery attempts."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def append(self, entries: List[dict]):
+        lines = "".join(json.dumps(entry) + "\n" for entry in entries)
+        with self._lock:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with open(self.path, "a", encoding="utf-8") as spool:
+                spool.write(lines)
+                spool.flush()
+                os.fsync(spool.fileno())
+
+    def count(self) -> int:
+        with self._lock:
+            if not os.path.exists(self.path):
+                return 0
+            with open(self.path, encoding="utf-8") as spool:
+                return sum(1 for line in spool if line.strip())
+
+    def take_all(self) -> List[dict]:
+        """Read and remove every spooled entry."""
+        with self._lock:
+            if not os.path.exists(self.path):
+                return []
+            with open(self.path, encoding="utf-8") as spool:
+                entries = [json.loads(line) for line in spool if line.strip()]
+            os.remove(self.path)
+            return entries
+
+
+class _Delivery:
+    """One notification on its way to the AF, with the number of attempts made so far."""
+
+    __slots__ = ("notification_destination", "body", "attempts")
+
+    def __init__(self, notification_destination: str, body: bytes, attempts: int = 0):
+        self.notification_destination = notification_destination
+        self.body = body
+        self.attempts = attempts
+
+
+class NotificationDispatcher:
+    """
+    Delivers AF notifications in the background.
+
+    Northbound handlers only submit an event. Events for the same transaction
+    (subscription) and destination that arrive within `coalesce_window`
+    seconds are batched into one UserPlaneNotificationData, which then goes on
+    a bounded queue; a pool of worker tasks POSTs it using one keep-alive
+    httpx client per notificationDestination origin, with at most
+    `max_per_origin` requests in flight towards the same origin. A worker
+    never waits for a busy origin: it parks the notification with that
+    origin, where the next worker to finish a delivery there picks it up,
+    and goes on with the queue, so a slow or dead AF only ties up
+    `max_per_origin` workers while the others keep serving the rest.
+
+    Failed deliveries are re-queued after an exponential backoff with full
+    jitter, or after the AF's Retry-After. Waiting retries are plain timers,
+    never a held worker or Northbound request, and at most
+    `max_pending_retries` may wait at once. Notifications that exhaust
+    `max_attempts`, fail permanently or find no retry slot go to the
+    dead-letter spool, from which they can be replayed.
+    """
+
+    def __init__(self, queue_size: int, workers: int, max_per_origin: int, timeout: float,
+                 coalesce_window: float = 0.0, max_events: int = CALLBACK_MAX_EVENTS_PER_NOTIFICATION,
+                 max_attempts: int = CALLBACK_MAX_ATTEMPTS, retry_base_delay: float = CALLBACK_RETRY_BASE_DELAY,
+                 retry_max_delay: float = CALLBACK_RETRY_MAX_DELAY,
+                 max_pending_retries: int = CALLBACK_MAX_PENDING_RETRIES,
+                 dead_letter_file: str = CALLBACK_DEAD_LETTER_FILE,
+                 transport: Optional[httpx.AsyncBaseTransport] = None):
+        self.queue_size = queue_size
+        self.workers = max(1, workers)
+        self.max_per_origin = max(1, max_per_origin)
+        self.timeout = timeout
+        self.coalesce_window = coalesce_window
+        self.max_events = max(1, max_events)
+        self.max_attempts = max(1, max_attempts)
+        self.retry_base_delay = retry_base_delay
+        self.retry_max_delay = retry_max_delay
+        self.max_pending_retries = max_pending_retries
+        self.dead_letters = DeadLetterSpool(dead_letter_file)
+        self._retry_timers: Dict[_Delivery, asyncio.TimerHandle] = {}
+        self._transport = transport
+        self._pending: Dict[Tuple[str, str], List[UserPlaneEvent]] = {}
+        self._flush_timers: Dict[Tuple[str, str], asyncio.TimerHandle] = {}
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker_tasks: List[asyncio.Task] = []
+        self._clients: Dict[str, httpx.AsyncClient] = {}
+        self._origin_in_flight: Dict[str, int] = {}
+        self._parked: Dict[str, Deque[_Delivery]] = {}
+        self._parked_count = 0
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def start(self):
+        """Create the queue and the workers on the running event loop (idempotent)."""
+        loop = asyncio.get_running_loop()
+        if loop is self._loop:
+            return
+        self._loop = loop
+        self._pending = {}
+        self._flush_timers = {}
+        self._retry_timers = {}
+        self._queue = asyncio.Queue(maxsize=self.queue_size)
+        self._clients = {}
+        self._origin_in_flight = {}
+        self._parked = {}
+        self._parked_count = 0
+        self._worker_tasks = [loop.create_task(self._worker()) for _ in range(self.workers)]
+        logger.info("Started notification dispatcher with %s workers", self.workers)
+
+    async def stop(self, drain_timeout: float = 5.0):
+        """Give queued notifications a chance to go out, then stop the workers and close the clients.
+
+        Whatever is still waiting for a retry or undelivered in the queue is dead-lettered.
+        """
+        if self._loop is None:
+            return
+        for key in list(self._pending):
+            self._flush(key)
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout=drain_timeout)
+        except asyncio.TimeoutError:
+            logger.warning("%s notifications undelivered on shutdown", self._queue.qsize())
+        for task in self._worker_tasks:
+            task.cancel()
+        await asyncio.gather(*self._worker_tasks, return_exceptions=True)
+        leftovers = list(self._retry_timers)
+        for timer in self._retry_timers.values():
+            timer.cancel()
+        self._retry_timers = {}
+        for parked in self._parked.values():
+            leftovers.extend(parked)
+        self._parked = {}
+        self._parked_count = 0
+        while not self._queue.empty():
+            leftovers.append(self._queue.get_nowait())
+        if leftovers:
+            logger.warning("Dead-lettering %s undelivered notifications on shutdown", len(leftovers))
+            _DEAD_LETTERED.inc(len(leftovers))
+            await asyncio.to_thread(
+                self.dead_letters.append, [self._dead_letter_entry(d, "shutdown") for d in leftovers]
+            )
+        for client in self._clients.values():
+            await client.aclose()
+        self._worker_tasks = []
+        self._clients = {}
+        self._loop = None
+
+    async def join(self):
+        """Wait until every pending and queued notification has been handled."""
+        if self._queue is None:
+            return
+        for key in list(self._pending):
+            self._flush(key)
+        await self._queue.join()
+
+    def submit(self, notification_destination: str, transaction: str, event: UserPlaneEvent) -> bool:
+        """Add an event to the pending notification for this destination and transaction."""
+        self.start()
+        key = (str(notification_destination), transaction)
+        events = self._pending.get(key)
+        if events is None:
+            if len(self._pending) + self._queue.qsize() + self._parked_count >= self.queue_size:
+                logger.error("Notification queue full, dropping %s callback to %s",
+                             event.value, notification_destination)
+                return False
+            events = self._pending[key] = []
+            if self.coalesce_window > 0:
+                self._flush_timers[key] = self._loop.call_later(self.coalesce_window, self._flush, key)
+        events.append(event)
+        if self.coalesce_window <= 0 or len(events) >= self.max_events:
+            self._flush(key)
+        return True
+
+    def _flush(self, key: Tuple[str, str]):
+        """Turn the pending events of one destination/transaction into a queued notification."""
+        timer = self._flush_timers.pop(key, None)
+        if timer is not None:
+            timer.cancel()
+        events = self._pending.pop(key, None)
+        if not events:
+            return
+        notification_destination, transaction = key
+        self.enqueue(notification_destination, build_notification(transaction, events))
+
+    def enqueue(self, notification_destination: str, body: bytes) -> bool:
+        """Queue a notification without waiting; returns False if it had to be dropped."""
+        self.start()
+        return self._put(_Delivery(str(notification_destination), body))
+
+    def _put(self, delivery: _Delivery) -> bool:
+        # Parked notifications left the queue but still take up its capacity
+        if self._queue.qsize() + self._parked_count < self.queue_size:
+            self._queue.put_nowait(delivery)
+            return True
+        logger.error("Notification queue full, dropping callback to %s", delivery.notification_destination)
+        return False
+
+    @property
+    def pending_retries(self) -> int:
+        return len(self._retry_timers)
+
+    async def replay_dead_letters(self) -> int:
+        """Re-queue every dead-lettered notification with a fresh attempt budget."""
+        self.start()
+        entries = await asyncio.to_thread(self.dead_letters.take_all)
+        replayed = 0
+        rejected = []
+        for entry in entries:
+            if self._put(_Delivery(entry["notificationDestination"], entry["body"].encode("utf-8"))):
+                replayed += 1
+            else:
+                rejected.append(entry)
+        if rejected:
+            await asyncio.to_thread(self.dead_letters.append, rejected)
+        logger.info("Replayed %s dead-lettered notifications, %s left in the spool", replayed, len(rejected))
+        return replayed
+
+    def _client_for(self, origin: str) -> httpx.AsyncClient:
+        client = self._clients.get(origin)
+        if client is None:
+            client = httpx.AsyncClient(
+                timeout=self.timeout,
+                limits=httpx.Limits(
+                    max_connections=self.max_per_origin,
+                    max_keepalive_connections=self.max_per_origin,
+                ),
+                transport=self._transport,
             )
-            response.raise_for_status()
-            logger.info(f"Callback sent successfully to {notification_destination}")
-    except Exception as e:
-        logger.error(f"Failed to send callback to {notification_destination}: {e}")
+            self._clients[origin] = client
+        return client
+
+    async def _worker(self):
+        while True:
+            delivery = await self._queue.get()
+            origin = destination_origin(delivery.notification_destination)
+            in_flight = self._origin_in_flight.get(origin, 0)
+            if in_flight >= self.max_per_origin:
+                self._parked.setdefault(origin, deque()).append(delivery)
+                self._parked_count += 1
+                continue  # task_done() once a worker with a slot at this origin delivers it
+            self._origin_in_flight[origin] = in_flight + 1
+            try:
+                while delivery is not None:
+                    try:
+                        await self._attempt(delivery)
+                    except Exception as e:
+                        logger.error("Failed to send callback to %s: %s", delivery.notification_destination, e)
+                    finally:
+                        self._queue.task_done()
+                    delivery = self._next_parked(origin)
+            finally:
+                in_flight = self._origin_in_flight[origin] - 1
+                if in_flight:
+                    self._origin_in_flight[origin] = in_flight
+                else:
+                    del self._origin_in_flight[origin]
 
+    def _next_parked(self, origin: str) -> Optional[_Delivery]:
+        parked = self._parked.get(origin)
+        if not parked:
+            return None
+        delivery = parked.popleft()
+        if not parked:
+            del self._parked[origin]
+        self._parked_count -= 1
+        return delivery
+
+    async def _attempt(self, delivery: _Delivery):
+        """Deliver once; on failure schedule a retry or dead-letter the notification."""
+        delivery.attempts += 1
+        retry_after = None
+        start = time.perf_counter()
+        try:
+            response = await self._deliver(delivery.notification_destination, delivery.body)
+        except httpx.HTTPError as e:
+            _UNREACHABLE.observe(time.perf_counter() - start)
+            _FAILED_TRANSPORT.inc()
+            reason = f"{type(e).__name__}: {e}"
+            retryable = True
+        else:
+            if response.is_success:
+                _DELIVERED.observe(time.perf_counter() - start)
+                logger.info("Callback sent successfully to %s", delivery.notification_destination)
+                return
+            _REJECTED.observe(time.perf_counter() - start)
+            (_FAILED_5XX if response.status_code >= 500 else _FAILED_4XX).inc()
+            reason = f"HTTP {response.status_code}"
+            retryable = response.status_code in RETRYABLE_STATUS_CODES or response.status_code >= 500
+            retry_after = parse_retry_after(response.headers.get("Retry-After"))
+
+        logger.warning("Callback to %s failed (attempt %s): %s",
+                       delivery.notification_destination, delivery.attempts, reason)
+        if retryable and delivery.attempts < self.max_attempts and self._schedule_retry(delivery, retry_after):
+            return
+        _DEAD_LETTERED.inc()
+        await asyncio.to_thread(self.dead_letters.append, [self._dead_letter_entry(delivery, reason)])
+        logger.error("Dead-lettered callback to %s after %s attempts",
+                     delivery.notification_destination, delivery.attempts)
+
+    def retry_delay(self, attempts: int, retry_after: Optional[float] = None) -> float:
+        """Retry-After if the AF sent one (at most `retry_max_delay`), otherwise full-jitter exponential backoff."""
+        if retry_after is not None:
+            return min(retry_after, self.retry_max_delay)
+        return random.uniform(0, min(self.retry_max_delay, self.retry_base_delay * 2 ** (attempts - 1)))
+
+    def _schedule_retry(self, delivery: _Delivery, retry_after: Optional[float]) -> bool:
+        if len(self._retry_timers) >= self.max_pending_retries:
+            logger.warning("%s callbacks already waiting for a retry", len(self._retry_timers))
+            return False
+        delay = self.retry_delay(delivery.attempts, retry_after)
+        self._retry_timers[delivery] = self._loop.call_later(delay, self._retry, delivery)
+        return True
+
+    def _retry(self, delivery: _Delivery):
+        self._retry_timers.pop(delivery, None)
+        if not self._put(delivery):
+            entry = self._dead_letter_entry(delivery, "notification queue full")
+            _DEAD_LETTERED.inc()
+            self._loop.create_task(asyncio.to_thread(self.dead_letters.append, [entry]))
+
+    @staticmethod
+    def _dead_letter_entry(delivery: _Delivery, reason: str) -> dict:
+        return {
+            "notificationDestination": delivery.notification_destination,
+            "body": delivery.body.decode("utf-8"),
+            "attempts": delivery.attempts,
+            "reason": reason,
+            "failedAt": datetime.now(timezone.utc).isoformat(),
+        }
+
+    async def _deliver(self, notification_destination: str, body: bytes) -> httpx.Response:
+        client = self._client_for(destination_origin(notification_destination))
+        return await client.post(
+            notification_destination,
+            content=body,
+            headers={"Content-Type": "application/json"}
+        )
+
+
+notification_dispatcher = NotificationDispatcher(
+    queue_size=CALLBACK_QUEUE_SIZE,
+    workers=CALLBACK_WORKERS,
+    max_per_origin=CALLBACK_MAX_PER_ORIGIN,
+    timeout=CALLBACK_TIMEOUT,
+    coalesce_window=CALLBACK_COALESCE_WINDOW,
+)
+
+
+def send_callback_to_as(notification_destination: str, scsAsId, subscriptionId, event: UserPlaneEvent) -> bool:
+    """Queue a callback to the AS with bearer event information; delivery happens in the background."""
+    return notification_dispatcher.submit(
+        notification_destination,
+        transaction_url(scsAsId, subscriptionId),
+        event
+    )
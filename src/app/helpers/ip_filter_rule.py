@@ -0,0 +1,104 @@
+import json
+from functools import lru_cache
+from ipaddress import ip_network
+from typing import NamedTuple, Optional, Tuple
+from app.utils.app_config import FLOW_RULE_CACHE_SIZE
+
+# IPFilterRule subset accepted in Flow-Descriptions (3GPP TS 29.214 clause 5.3.8, RFC 6733 IPFilterRule):
+#   permit <in|out> <ip|tcp|udp> from <address>[ <ports>] to <address>[ <ports>]
+#   address: any | IPv4/IPv6 address, optionally /prefix;  ports: <port> | <port>-<port>
+PROTOCOLS = {"ip": None, "tcp": 6, "udp": 17}
+_ADDRESS_CHARS = frozenset("0123456789abcdefABCDEF:.")
+_DIGITS = frozenset("0123456789")  # str.isdigit() also accepts non-ASCII digits such as "٣"
+
+
+class AddressRange(NamedTuple):
+    """A network as an inclusive range of integer addresses."""
+    version: int
+    first: int
+    last: int
+
+
+class IPFilterRule(NamedTuple):
+    """
+    Parsed Flow-Description. `None` means "any" for protocol, addresses and
+    ports. `encoded` is the raw rule as a JSON string, for payload building.
+    """
+    direction: str  # "in" or "out"
+    protocol: Optional[int]  # IANA protocol number; None for "ip" (any)
+    src: Optional[AddressRange]
+    src_ports: Optional[Tuple[int, int]]
+    dst: Optional[AddressRange]
+    dst_ports: Optional[Tuple[int, int]]
+    raw: str
+    encoded: str
+
+
+def _address(token: str) -> Optional[AddressRange]:
+    if token == "any":
+        return None
+    address, _, prefix = token.partition("/")
+    if (not address or not _ADDRESS_CHARS.issuperset(address) or (prefix and not _DIGITS.issuperset(prefix))
+            or token.endswith("/")):
+        raise ValueError(f"invalid address '{token}'")
+    try:
+        network = ip_network(token, strict=False)
+    except ValueError as e:
+        raise ValueError(f"invalid address '{token}'") from e
+    return AddressRange(network.version, int(network.network_address), int(network.broadcast_address))
+
+
+def _port(token: str) -> int:
+    if not token or not _DIGITS.issuperset(token) or (len(token) > 1 and token[0] == "0") or int(token) > 65535:
+        raise ValueError(f"invalid port '{token}'")
+    return int(token)
+
+
+def _ports(token: str) -> Tuple[int, int]:
+    low, dash, high = token.partition("-")
+    if not dash:
+        port = _port(token)
+        return port, port
+    first, last = _port(low), _port(high)
+    if first > last:
+        raise ValueError(f"invalid port range '{token}'")
+    return first, last
+
+
+@lru_cache(maxsize=FLOW_RULE_CACHE_SIZE)
+def parse_ip_filter_rule(rule: str) -> IPFilterRule:
+    """
+    Parse a Flow-Description into an IPFilterRule; raises ValueError if it is not one.
+
+    Results are cached by the raw string, so validation, conflict checks and
+    payload building share one parsed object for the rules AFs keep sending.
+    """
+    tokens = rule.split(" ")
+    if len(tokens) < 7 or tokens[0] != "permit" or tokens[1] not in ("in", "out") or tokens[3] != "from":
+        raise ValueError("expected 'permit in|out <protocol> from <address> ... to <address> ...'")
+    if tokens[2] not in PROTOCOLS:
+        raise ValueError(f"unsupported protocol '{tokens[2]}'")
+
+    position = 5
+    src_ports = None
+    if tokens[position] != "to":
+        src_ports = _ports(tokens[position])
+        position += 1
+    if position >= len(tokens) or tokens[position] != "to" or position + 1 >= len(tokens):
+        raise ValueError("expected 'to <address>'")
+    dst_ports = None
+    if position + 2 < len(tokens):
+        dst_ports = _ports(tokens[position + 2])
+    if position + 3 < len(tokens):
+        raise ValueError(f"unexpected '{' '.join(tokens[position + 3:])}'")
+
+    return IPFilterRule(
+        direction=tokens[1],
+        protocol=PROTOCOLS[tokens[2]],
+        src=_address(tokens[4]),
+        src_ports=src_ports,
+        dst=_address(tokens[position + 1]),
+        dst_ports=dst_ports,
+        raw=rule,
+        encoded=json.dumps(rule, ensure_ascii=False),
+    )
@@ -1,118 +1,675 @@
+import asyncio
 import json
-import socket
+import logging
+import os
+import time
+from typing import Dict, List, Optional, Tuple
+from h2.config import H2Configuration
 from h2.connection import H2Connection
-from h2.events import ResponseReceived, DataReceived, StreamEnded
-from app.utils.app_config import PCF_BASE_URL, PCF_PORT
+from h2.events import (
+    ConnectionTerminated,
+    DataReceived,
+    PingAckReceived,
+    RemoteSettingsChanged,
+    ResponseReceived,
+    StreamEnded,
+    StreamReset,
+    WindowUpdated,
+)
+from h2.errors import ErrorCodes
+from h2.exceptions import ProtocolError
+from app.utils.app_config import (
+    PCF_BASE_URL,
+    PCF_PORT,
+    PCF_POOL_SIZE,
+    PCF_MAX_STREAMS_PER_CONNECTION,
+    PCF_PING_INTERVAL,
+    PCF_MAX_IN_FLIGHT,
+    PCF_MIN_IN_FLIGHT,
+    PCF_INITIAL_IN_FLIGHT,
+    PCF_LATENCY_TOLERANCE,
+    PCF_BREAKER_WINDOW,
+    PCF_BREAKER_MIN_CALLS,
+    PCF_BREAKER_FAILURE_RATIO,
+    PCF_BREAKER_OPEN_SECONDS,
+    PCF_BREAKER_PROBES,
+    PCF_CONNECT_TIMEOUT,
+    PCF_READ_TIMEOUT,
+    PCF_TOTAL_TIMEOUT,
+)
 from app.utils.log import get_app_logger
+from app.utils.limiter import AdaptiveConcurrencyLimiter, CircuitBreaker, CircuitOpen, ConcurrencyLimiter
+from app.utils.metrics import REGISTRY, Gauge, PCF_REQUEST_SECONDS, ADMISSION_REJECTIONS
 
 logger = get_app_logger()
 
-def pcf_post_request(payload):
-    """http2 POST request to PCF for creating QoS App Session."""
-    path = '/npcf-policyauthorization/v1/app-sessions'
-    body = json.dumps(payload).encode("utf-8")
+APP_SESSIONS_PATH = '/npcf-policyauthorization/v1/app-sessions'
 
-    # Open TCP socket connection
-    sock = socket.create_connection((PCF_BASE_URL, PCF_PORT))
 
-    # Create and initiate HTTP/2 connection
-    conn = H2Connection()
-    conn.initiate_connection()
-    sock.sendall(conn.data_to_send())
+class PCFError(Exception):
+    """Base class for every southbound failure towards the PCF.
 
-    # Send HTTP/2 headers
-    stream_id = conn.get_next_available_stream_id()
-    conn.send_headers(
-        stream_id=stream_id,
-        headers=[
-            (':method', 'POST'),
-            (':scheme', 'http'),
-            (':authority', PCF_BASE_URL),
-            (':path', path),
-            ('content-type', 'application/json'),
-            ('accept', 'application/json'),
-            ('content-length', str(len(body))),
-        ]
-    )
-    conn.send_data(stream_id, body, end_stream=True)
-    sock.sendall(conn.data_to_send())
+    `retryable` is set when the PCF never processed the stream (refused
+    connection, GOAWAY before our stream id, ...), so it is safe to resend it.
+    """
 
-    # Receive response
-    response_ended = False
-    session_id = None
-    status_code = None
+    def __init__(self, message: str, retryable: bool = False):
+        super().__init__(message)
+        self.retryable = retryable
+
+
+class PCFConnectionError(PCFError):
+    """Raised when a request could not be carried over a PCF connection."""
+
+
+class PCFConnectFailedError(PCFConnectionError):
+    """The TCP connection to the PCF could not be opened, so nothing was sent."""
+
+
+class PCFTimeoutError(PCFError):
+    """Raised when the PCF did not answer within one of the request deadlines."""
+
+
+class PCFConnectTimeoutError(PCFTimeoutError):
+    """Opening the TCP connection to the PCF took longer than PCF_CONNECT_TIMEOUT."""
+
+
+class PCFReadTimeoutError(PCFTimeoutError):
+    """The PCF sent nothing on the stream for longer than PCF_READ_TIMEOUT."""
+
+
+class PCFServerError(PCFError):
+    """The PCF answered with a 5xx status: it could not do what was asked, but may later."""
+
+    def __init__(self, message: str, status_code: int):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class PCFRejectedError(PCFError):
+    """The PCF answered with a 4xx status: it refused the request, and would refuse it again as is."""
+
+    def __init__(self, message: str, status_code: int):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class PCFOverloadedError(PCFError):
+    """Refused before reaching the PCF: PCF_MAX_IN_FLIGHT requests are already in flight."""
+
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message, retryable=True)
+        self.retry_after = retry_after
+
+
+class PCFCircuitOpenError(PCFOverloadedError):
+    """Refused before reaching the PCF: the circuit breaker is open after too many failures."""
+
+
+class PCFResponse:
+    """Status, headers and body of a single HTTP/2 response from the PCF."""
+
+    __slots__ = ("status_code", "headers", "body")
+
+    def __init__(self, status_code: int, headers: Dict[str, str], body: bytes):
+        self.status_code = status_code
+        self.headers = headers
+        self.body = body
+
+    @property
+    def location(self) -> Optional[str]:
+        return self.headers.get('location')
+
+
+class _Stream:
+    """Per-stream receive state, completed by the connection read loop."""
+
+    __slots__ = ("status_code", "headers", "body", "done", "last_activity")
+
+    def __init__(self, loop: asyncio.AbstractEventLoop):
+        self.status_code: Optional[int] = None
+        self.headers: Dict[str, str] = {}
+        self.body = bytearray()
+        self.done: asyncio.Future = loop.create_future()
+        self.last_activity = loop.time()
+
+
+class PCFConnection:
+    """One long-lived h2c connection to the PCF multiplexing many concurrent streams."""
+
+    def __init__(self, host: str, port: int, max_streams: int, ping_interval: float,
+                 connect_timeout: float = PCF_CONNECT_TIMEOUT, read_timeout: float = PCF_READ_TIMEOUT,
+                 on_closed=None):
+        self.host = host
+        self.port = port
+        self.authority = f'{host}:{port}'
+        self._max_streams = max_streams
+        self._ping_interval = ping_interval
+        self._connect_timeout = connect_timeout
+        self._read_timeout = read_timeout
+        self._on_closed = on_closed
+        self._h2: Optional[H2Connection] = None
+        self._reader: Optional[asyncio.StreamReader] = None
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self._streams: Dict[int, _Stream] = {}
+        self._reserved = 0
+        self._window_open = asyncio.Event()
+        self._reader_task: Optional[asyncio.Task] = None
+        self._ping_task: Optional[asyncio.Task] = None
+        self._ping_outstanding = False
+        self._goaway = False
+        self._closed = False
+
+    async def connect(self):
+        """Open the TCP socket and send the HTTP/2 preface and SETTINGS."""
+        try:
+            self._reader, self._writer = await asyncio.wait_for(
+                asyncio.open_connection(self.host, self.port), timeout=self._connect_timeout
+            )
+        except asyncio.TimeoutError:
+            raise PCFConnectTimeoutError(
+                f"Connecting to PCF {self.authority} timed out after {self._connect_timeout}s"
+            ) from None
+        self._h2 = H2Connection(H2Configuration(client_side=True, header_encoding='utf-8'))
+        self._h2.initiate_connection()
+        self._flush()
+        self._reader_task = asyncio.create_task(self._read_loop())
+        if self._ping_interval > 0:
+            self._ping_task = asyncio.create_task(self._keepalive())
+        logger.info("Opened HTTP/2 connection to PCF %s", self.authority)
+
+    @property
+    def usable(self) -> bool:
+        return not self._closed and not self._goaway
+
+    @property
+    def load(self) -> int:
+        return self._reserved
+
+    @property
+    def max_concurrent_streams(self) -> int:
+        return min(self._max_streams, self._h2.remote_settings.max_concurrent_streams)
+
+    def has_capacity(self) -> bool:
+        return self.usable and self._reserved < self.max_concurrent_streams
+
+    def reserve(self):
+        """Claim a stream slot before the stream is actually opened."""
+        self._reserved += 1
+
+    def release(self):
+        self._reserved -= 1
+        if self._goaway and not self._reserved:
+            self.close()
+
+    async def request(self, method: str, path: str, headers: List[Tuple[str, str]], body: bytes = b'') -> PCFResponse:
+        """Send one request on a new stream and wait for its complete response."""
+        if not self.usable:
+            raise PCFConnectionError("PCF connection is not accepting new streams", retryable=True)
+
+        stream_id = self._h2.get_next_available_stream_id()
+        stream = _Stream(asyncio.get_running_loop())
+        self._streams[stream_id] = stream
+        try:
+            request_headers = [
+                (':method', method),
+                (':scheme', 'http'),
+                (':authority', self.authority),
+                (':path', path),
+                *headers,
+                ('content-length', str(len(body))),
+            ]
+            self._h2.send_headers(stream_id, request_headers, end_stream=not body)
+            self._flush()
+            if body:
+                await self._send_body(stream_id, body)
+            await self._writer.drain()
+            await self._wait_response(stream)
+        except (ProtocolError, ConnectionError) as e:
+            raise PCFConnectionError(f"PCF stream {stream_id} failed: {e}") from e
+        finally:
+            self._streams.pop(stream_id, None)
+            if not stream.done.done():
+                # Timed out or cancelled by the caller: tell the PCF we are no longer interested
+                self._cancel_stream(stream_id)
 
-    while not response_ended:
-        data = sock.recv(65535)
-        if not data:
-            break
+        return PCFResponse(stream.status_code, stream.headers, bytes(stream.body))
 
-        events = conn.receive_data(data)
-        for event in events:
-            if isinstance(event, ResponseReceived):
-                logger.info(f"Response headers: {event.headers}")
+    async def _wait_response(self, stream: _Stream):
+        """Wait for the end of the stream, failing if the PCF stays silent for longer than the read timeout."""
+        loop = asyncio.get_running_loop()
+        while True:
+            idle_deadline = stream.last_activity + self._read_timeout
+            try:
+                await asyncio.wait_for(asyncio.shield(stream.done), timeout=max(0.0, idle_deadline - loop.time()))
+                return
+            except asyncio.TimeoutError:
+                if stream.last_activity + self._read_timeout <= loop.time():
+                    raise PCFReadTimeoutError(
+                        f"PCF {self.authority} sent no response data for {self._read_timeout}s"
+                    ) from None
+
+    def _cancel_stream(self, stream_id: int):
+        if self._closed:
+            return
+        try:
+            self._h2.reset_stream(stream_id, ErrorCodes.CANCEL)
+            self._flush()
+        except ProtocolError:
+            pass
+
+    async def _send_body(self, stream_id: int, body: bytes):
+        """Send DATA frames respecting the peer's flow-control windows and frame size."""
+        view = memoryview(body)
+        while view:
+            window = self._h2.local_flow_control_window(stream_id)
+            if window <= 0:
+                if self._streams[stream_id].done.done():
+                    return
+                self._window_open.clear()
+                await self._window_open.wait()
+                continue
+            chunk = min(window, len(view), self._h2.max_outbound_frame_size)
+            self._h2.send_data(stream_id, view[:chunk].tobytes(), end_stream=chunk == len(view))
+            view = view[chunk:]
+            self._flush()
+
+    def _flush(self):
+        data = self._h2.data_to_send()
+        if data and not self._writer.is_closing():
+            self._writer.write(data)
+
+    async def _read_loop(self):
+        error = PCFConnectionError("PCF closed the connection")
+        try:
+            while True:
+                data = await self._reader.read(65535)
+                if not data:
+                    break
+                for event in self._h2.receive_data(data):
+                    self._handle_event(event)
+                self._flush()
+        except asyncio.CancelledError:
+            error = PCFConnectionError("PCF connection closed locally")
+        except (ConnectionError, ProtocolError, OSError) as e:
+            logger.error("HTTP/2 connection to PCF %s failed: %s", self.authority, e)
+            error = PCFConnectionError(f"PCF connection failed: {e}")
+        finally:
+            self._terminate(error)
+
+    def _handle_event(self, event):
+        if isinstance(event, ResponseReceived):
+            stream = self._streams.get(event.stream_id)
+            if stream is not None:
+                stream.last_activity = asyncio.get_running_loop().time()
                 for name, value in event.headers:
-                    if name.lower() == b':status':
-                        status_code = int(value.decode())
-                        logger.info(f"Response status code: {status_code}")
-                    if name.lower() == b'location':
-                        location_url = value.decode()
-                        session_id = location_url.rstrip('/').split('/')[-1]
-                        logger.info(f"Extracted App Session ID: {session_id}")
-            elif isinstance(event, DataReceived):
-                logger.info(f"Response body: {event.data.decode()}")
-            elif isinstance(event, StreamEnded):
-                response_ended = True
+                    if name == ':status':
+                        stream.status_code = int(value)
+                    else:
+                        stream.headers[name.lower()] = value
+        elif isinstance(event, DataReceived):
+            self._h2.acknowledge_received_data(event.flow_controlled_length, event.stream_id)
+            stream = self._streams.get(event.stream_id)
+            if stream is not None:
+                stream.last_activity = asyncio.get_running_loop().time()
+                stream.body += event.data
+        elif isinstance(event, StreamEnded):
+            stream = self._streams.get(event.stream_id)
+            if stream is not None and not stream.done.done():
+                stream.done.set_result(None)
+        elif isinstance(event, StreamReset):
+            self._window_open.set()
+            stream = self._streams.get(event.stream_id)
+            if stream is not None and not stream.done.done():
+                stream.done.set_exception(
+                    PCFConnectionError(f"PCF reset stream {event.stream_id} (error code {event.error_code})")
+                )
+        elif isinstance(event, (WindowUpdated, RemoteSettingsChanged)):
+            self._window_open.set()
+        elif isinstance(event, PingAckReceived):
+            self._ping_outstanding = False
+        elif isinstance(event, ConnectionTerminated):
+            self._handle_goaway(event)
 
-        sock.sendall(conn.data_to_send())
+    def _handle_goaway(self, event: ConnectionTerminated):
+        """Stop opening streams; fail the ones the PCF says it never processed."""
+        logger.warning("PCF %s sent GOAWAY (error code %s, last stream %s)",
+                       self.authority, event.error_code, event.last_stream_id)
+        self._goaway = True
+        last_stream_id = event.last_stream_id or 0
+        for stream_id, stream in list(self._streams.items()):
+            if stream_id > last_stream_id and not stream.done.done():
+                stream.done.set_exception(
+                    PCFConnectionError("PCF sent GOAWAY before processing the stream", retryable=True)
+                )
+        if not self._reserved:
+            self.close()
+        elif self._on_closed:
+            self._on_closed(self)
 
-    sock.close()
-    return session_id, status_code
+    async def _keepalive(self):
+        """Send PING frames while the connection is open; drop it if the previous PING went unanswered."""
+        while True:
+            await asyncio.sleep(self._ping_interval)
+            if self._ping_outstanding:
+                logger.warning("PCF %s did not answer PING, closing connection", self.authority)
+                self.close()
+                return
+            self._ping_outstanding = True
+            self._h2.ping(os.urandom(8))
+            self._flush()
 
+    def _terminate(self, error: PCFError):
+        if self._closed:
+            return
+        self._closed = True
+        for stream in self._streams.values():
+            if not stream.done.done():
+                stream.done.set_exception(error)
+        self._window_open.set()
+        if self._ping_task:
+            self._ping_task.cancel()
+        if self._writer and not self._writer.is_closing():
+            self._writer.close()
+        if self._on_closed:
+            self._on_closed(self)
 
+    def close(self):
+        """Send GOAWAY and close the socket; pending streams fail."""
+        if self._closed:
+            return
+        try:
+            self._h2.close_connection()
+            self._flush()
+        except ProtocolError:
+            pass
+        if self._reader_task:
+            self._reader_task.cancel()
+        self._terminate(PCFConnectionError("PCF connection closed locally"))
+        logger.info("Closed HTTP/2 connection to PCF %s", self.authority)
 
-def pcf_delete_request(session_id):
-    """http2 DELETE request to PCF for deleting QoS App Session."""
 
-    path = (f'/npcf-policyauthorization/v1/app-sessions/{session_id}/delete')  # Replace with correct session ID
+class PCFConnectionPool:
+    """Small pool of long-lived h2c connections to the PCF.
+
+    New streams go to the least loaded connection that still has room under the
+    peer's MAX_CONCURRENT_STREAMS; a new connection is only opened when all of
+    them are full, up to `size` connections.
+    """
+
+    def __init__(self, host: str, port: int, size: int, max_streams: int, ping_interval: float,
+                 connect_timeout: float = PCF_CONNECT_TIMEOUT, read_timeout: float = PCF_READ_TIMEOUT,
+                 total_timeout: float = PCF_TOTAL_TIMEOUT):
+        self.host = host
+        self.port = port
+        self.size = max(1, size)
+        self.max_streams = max_streams
+        self.ping_interval = ping_interval
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.total_timeout = total_timeout
+        self._connections: List[PCFConnection] = []
+        self._connecting = 0
+        self._waiters: List[asyncio.Future] = []
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def _bind_loop(self):
+        """Connections belong to one event loop; start over if we are running on a new one."""
+        loop = asyncio.get_running_loop()
+        if loop is not self._loop:
+            self._loop = loop
+            self._connections = []
+            self._connecting = 0
+            self._waiters = []
+
+    def _wake_waiters(self):
+        waiters, self._waiters = self._waiters, []
+        for waiter in waiters:
+            if not waiter.done():
+                waiter.set_result(None)
+
+    def _connection_closed(self, conn: PCFConnection):
+        if conn in self._connections and not conn.usable:
+            self._connections.remove(conn)
+        self._wake_waiters()
+
+    async def _acquire(self) -> PCFConnection:
+        self._bind_loop()
+        while True:
+            candidates = [c for c in self._connections if c.has_capacity()]
+            if candidates:
+                conn = min(candidates, key=lambda c: c.load)
+                conn.reserve()
+                return conn
+            # Wait for a connection that is still being set up instead of racing it
+            if not self._connecting and len(self._connections) < self.size:
+                break
+            waiter = self._loop.create_future()
+            self._waiters.append(waiter)
+            await waiter
+
+        self._connecting += 1
+        conn = PCFConnection(
+            self.host, self.port, self.max_streams, self.ping_interval,
+            connect_timeout=self.connect_timeout, read_timeout=self.read_timeout,
+            on_closed=self._connection_closed,
+        )
+        try:
+            await conn.connect()
+        except OSError as e:
+            raise PCFConnectFailedError(f"Cannot connect to PCF {self.host}:{self.port}: {e}") from e
+        finally:
+            self._connecting -= 1
+            self._wake_waiters()
+        conn.reserve()
+        self._connections.append(conn)
+        return conn
+
+    def _release(self, conn: PCFConnection):
+        conn.release()
+        self._wake_waiters()
+
+    async def request(self, method: str, path: str, headers: List[Tuple[str, str]], body: bytes = b'') -> PCFResponse:
+        """Run a request on a pooled connection within the total deadline.
+
+        Waiting for a free stream slot, connecting and the (possibly resent) exchange
+        all count against PCF_TOTAL_TIMEOUT. Cancelling the caller resets the stream.
+        """
+        try:
+            return await asyncio.wait_for(self._request(method, path, headers, body), timeout=self.total_timeout)
+        except asyncio.TimeoutError:
+            raise PCFTimeoutError(
+                f"PCF request {method} {path} exceeded the total deadline of {self.total_timeout}s"
+            ) from None
+
+    async def _request(self, method: str, path: str, headers: List[Tuple[str, str]], body: bytes) -> PCFResponse:
+        """Resend the request once on another connection if the PCF refused the stream."""
+        for attempt in range(2):
+            conn = await self._acquire()
+            try:
+                return await conn.request(method, path, headers, body)
+            except PCFError as e:
+                if not e.retryable or attempt:
+                    raise
+                logger.info("Retrying PCF request %s %s on another connection: %s", method, path, e)
+            finally:
+                self._release(conn)
+
+    async def close(self):
+        """Close every pooled connection (used on application shutdown)."""
+        for conn in list(self._connections):
+            conn.close()
+        self._connections = []
+
+
+pcf_pool = PCFConnectionPool(
+    PCF_BASE_URL,
+    PCF_PORT,
+    size=PCF_POOL_SIZE,
+    max_streams=PCF_MAX_STREAMS_PER_CONNECTION,
+    ping_interval=PCF_PING_INTERVAL,
+)
+
+
+# Admission control: a cap on PCF requests in flight that adapts to the PCF's latency, and a circuit breaker
+if PCF_MAX_IN_FLIGHT:
+    pcf_admission = AdaptiveConcurrencyLimiter(PCF_INITIAL_IN_FLIGHT, PCF_MIN_IN_FLIGHT, PCF_MAX_IN_FLIGHT,
+                                               tolerance=PCF_LATENCY_TOLERANCE)
+else:
+    pcf_admission = ConcurrencyLimiter(0)
+pcf_breaker = CircuitBreaker(
+    window=PCF_BREAKER_WINDOW,
+    min_calls=PCF_BREAKER_MIN_CALLS,
+    failure_ratio=PCF_BREAKER_FAILURE_RATIO,
+    open_for=PCF_BREAKER_OPEN_SECONDS,
+    probes=PCF_BREAKER_PROBES,
+)
+_REFUSED = ADMISSION_REJECTIONS.labels("pcf_in_flight")
+_SHORT_CIRCUITED = ADMISSION_REJECTIONS.labels("pcf_circuit_open")
+_BREAKER_STATES = {CircuitBreaker.CLOSED: 0, CircuitBreaker.HALF_OPEN: 1, CircuitBreaker.OPEN: 2}
+
+REGISTRY.register(Gauge("nef_pcf_in_flight_limit", "Current limit on PCF requests in flight",
+                        collect=lambda: {(): pcf_admission.limit}))
+REGISTRY.register(Gauge("nef_pcf_in_flight", "PCF requests in flight",
+                        collect=lambda: {(): pcf_admission.in_flight}))
+REGISTRY.register(Gauge("nef_pcf_circuit_state", "PCF circuit breaker: 0 closed, 1 half-open, 2 open",
+                        collect=lambda: {(): _BREAKER_STATES[pcf_breaker.state]}))
 
-    sock = socket.create_connection((PCF_BASE_URL, PCF_PORT))
-    conn = H2Connection()
-    conn.initiate_connection()
-    sock.sendall(conn.data_to_send())
 
-    stream_id = conn.get_next_available_stream_id()
-    conn.send_headers(
-        stream_id=stream_id,
+def describe_pcf_admission() -> dict:
+    return {"circuitBreaker": pcf_breaker.describe(), "concurrency": pcf_admission.describe()}
+
+
+class _TimedOperation:
+    """
+    PCF round-trip histogram children of one operation, the failure ones bound
+    up front. Requests are refused before being sent (and timed) while the
+    circuit breaker is open or the in-flight limit is reached; timeouts,
+    connection failures and 5xx answers count as failures for the breaker.
+    """
+
+    __slots__ = ("operation", "by_status", "timeout", "error")
+
+    def __init__(self, operation: str):
+        self.operation = operation
+        self.by_status = {}
+        self.timeout = PCF_REQUEST_SECONDS.labels(operation, "timeout")
+        self.error = PCF_REQUEST_SECONDS.labels(operation, "error")
+
+    async def request(self, method: str, path: str, headers: List[Tuple[str, str]], body: bytes = b'') -> PCFResponse:
+        breaker_state = pcf_breaker.state
+        try:
+            probe = pcf_breaker.acquire()
+        except CircuitOpen as e:
+            _SHORT_CIRCUITED.inc()
+            raise PCFCircuitOpenError(f"PCF circuit breaker is open, retry in {e.retry_after:.1f}s",
+                                      retry_after=e.retry_after) from None
+        if pcf_breaker.state != breaker_state:
+            logger.info("PCF circuit breaker half-open, probing the PCF")
+        if not pcf_admission.try_acquire():
+            pcf_breaker.cancel(probe)
+            _REFUSED.inc()
+            raise PCFOverloadedError(
+                f"{pcf_admission.in_flight} PCF requests already in flight (limit {pcf_admission.limit})",
+                retry_after=pcf_admission.retry_after(),
+            )
+        start = time.perf_counter()
+        success = timed_out = None
+        try:
+            response = await pcf_pool.request(method, path, headers=headers, body=body)
+            success = response.status_code < 500
+        except PCFTimeoutError:
+            success, timed_out = False, True
+            self.timeout.observe(time.perf_counter() - start)
+            raise
+        except PCFError:
+            success = False
+            self.error.observe(time.perf_counter() - start)
+            raise
+        finally:
+            pcf_admission.release(time.perf_counter() - start, dropped=bool(timed_out))
+            if success is None:
+                pcf_breaker.cancel(probe)
+            else:
+                breaker_state = pcf_breaker.state
+                pcf_breaker.record(success, probe)
+                if pcf_breaker.state != breaker_state:
+                    if pcf_breaker.state == CircuitBreaker.OPEN:
+                        logger.warning("PCF circuit breaker opened for %ss after failures of %s requests",
+                                       pcf_breaker.open_for, self.operation)
+                    else:
+                        logger.info("PCF circuit breaker closed")
+        child = self.by_status.get(response.status_code)
+        if child is None:
+            child = self.by_status[response.status_code] = PCF_REQUEST_SECONDS.labels(
+                self.operation, str(response.status_code))
+        child.observe(time.perf_counter() - start)
+        return response
+
+
+_CREATE = _TimedOperation("create")
+_UPDATE = _TimedOperation("update")
+_DELETE = _TimedOperation("delete")
+
+
+async def pcf_post_request(payload):
+    """http2 POST request to PCF for creating QoS App Session; payload is the JSON body (bytes) or a dict."""
+    body = payload if isinstance(payload, bytes) else json.dumps(payload).encode("utf-8")
+
+    response = await _CREATE.request(
+        'POST',
+        APP_SESSIONS_PATH,
         headers=[
-            (':method', 'POST'),
-            (':scheme', 'http'),
-            (':authority', f'{PCF_BASE_URL}:{PCF_PORT}'),
-            (':path', path),
+            ('content-type', 'application/json'),
             ('accept', 'application/json'),
-            ('content-length', '0'),
         ],
-        end_stream=True  # No body
+        body=body,
     )
-    sock.sendall(conn.data_to_send())
+    logger.info("PCF create of App Session returned status %s", response.status_code)
 
-    response_ended = False
+    session_id = None
+    if response.location:
+        session_id = response.location.rstrip('/').split('/')[-1]
+        logger.info("Extracted App Session ID: %s", session_id)
+    if response.body and logger.isEnabledFor(logging.DEBUG):
+        logger.debug("Response body: %s", response.body.decode())
 
-    while not response_ended:
-        data = sock.recv(65535)
-        if not data:
-            break
+    return session_id, response.status_code
 
-        events = conn.receive_data(data)
-        for event in events:
-            if isinstance(event, ResponseReceived):
-                print("🔹 Response headers:", event.headers)
-            elif isinstance(event, DataReceived):
-                print("🔹 Response body:", event.data.decode())
-            elif isinstance(event, StreamEnded):
-                response_ended = True
 
-        sock.sendall(conn.data_to_send())
+async def pcf_delete_request(session_id):
+    """http2 DELETE request to PCF for deleting QoS App Session."""
+    path = f'{APP_SESSIONS_PATH}/{session_id}/delete'
+
+    response = await _DELETE.request(
+        'POST',
+        path,
+        headers=[('accept', 'application/json')],
+    )
+    logger.info("PCF delete of App Session %s returned status %s", session_id, response.status_code)
+    if response.body and logger.isEnabledFor(logging.DEBUG):
+        logger.debug("Response body: %s", response.body.decode())
+
+    return response.status_code
+
+
+async def pcf_patch_request(session_id, payload: bytes):
+    """http2 PATCH (JSON merge patch) of an App Session, the Npcf_PolicyAuthorization Update."""
+    response = await _UPDATE.request(
+        'PATCH',
+        f'{APP_SESSIONS_PATH}/{session_id}',
+        headers=[
+            ('content-type', 'application/merge-patch+json'),
+            ('accept', 'application/json'),
+        ],
+        body=payload,
+    )
+    logger.info("PCF update of App Session %s returned status %s", session_id, response.status_code)
+    if response.body and logger.isEnabledFor(logging.DEBUG):
+        logger.debug("Response body: %s", response.body.decode())
+
+    return response.status_code
 
-    sock.close()
 
+async def close_pcf_pool():
+    await pcf_pool.close()
@@ -0,0 +1,85 @@
+import json
+from typing import Dict
+from app.schemas.qos_models import AsSessionWithQosSubscription, FlowStatus, MediaComponent, MediaType, FlowUsage
+
+# Compact JSON for the parts spliced into a template (strings, lists of strings, None)
+_dumps = json.JSONEncoder(separators=(",", ":"), ensure_ascii=False).encode
+
+
+class PayloadTemplate:
+    """
+    Npcf AppSessionContext body for one QoS profile, validated once.
+
+    The QoS part of the media component (medCompN, fStatus, medType,
+    marBwUl, marBwDl) is built and validated with the pydantic models when
+    the template is compiled and kept as serialized JSON. render() only
+    splices in the per-subscription values: ueIpv4, notifUri, suppFeat and
+    the flow descriptions (pre-encoded by the cached IPFilterRule parser). The result is the same document the models would
+    produce, serialized straight to bytes.
+    """
+
+    def __init__(self, qos_reference: str, profile: dict):
+        self.qos_reference = qos_reference
+        try:
+            component = MediaComponent(
+                medCompN=1,  # Always 1, as we request only one qos_profile
+                fStatus=FlowStatus.ENABLED,
+                medType=MediaType[profile["mediaType"]],
+                marBwUl=profile["marBwUl"],
+                marBwDl=profile["marBwDl"],
+                medSubComps={},
+            ).model_dump(mode="json")
+        except (KeyError, TypeError, ValueError) as e:
+            raise ValueError(f"Invalid QoS profile {qos_reference}: {e}") from e
+
+        # Fields before and after medSubComps, in model field order
+        fields = list(component)
+        split = fields.index("medSubComps")
+        self._head = "".join(f"{_dumps(k)}:{_dumps(component[k])}," for k in fields[:split])
+        self._tail = ",".join(f"{_dumps(k)}:{_dumps(component[k])}" for k in fields[split + 1:])
+        self._flow_usage = _dumps(FlowUsage.NO_INFO.value)
+
+    def render(self, subscription: AsSessionWithQosSubscription) -> bytes:
+        """AppSessionContext JSON for a subscription, as bytes ready to send to the PCF."""
+        med_components = "{}"
+        if subscription.flowInfo:
+            # Only one media component is requested, so the last flow wins (as medComponents["1"])
+            flow = subscription.flowInfo[-1]
+            sub_component = (
+                f'{{"fNum":{flow.flowId},"fDescs":[{",".join(r.encoded for r in flow.parsed_flow_descriptions())}],'
+                f'"flowUsage":{self._flow_usage}}}'
+            )
+            med_components = f'{{"1":{{{self._head}"medSubComps":{{"{flow.flowId}":{sub_component}}},{self._tail}}}}}'
+
+        ue_ipv4 = subscription.ueIpv4Addr
+        return (
+            f'{{"ascReqData":{{"medComponents":{med_components},'
+            f'"notifUri":{_dumps(str(subscription.notificationDestination))},'
+            f'"suppFeat":{_dumps(subscription.supportedFeatures)},'
+            f'"ueIpv4":{_dumps(str(ue_ipv4)) if ue_ipv4 is not None else "null"}}}}}'
+        ).encode("utf-8")
+
+
+def compile_templates(qos_mapping: dict) -> Dict[str, PayloadTemplate]:
+    """One validated PayloadTemplate per QoS profile; raises ValueError on an invalid profile."""
+    return {qos_reference: PayloadTemplate(qos_reference, profile) for qos_reference, profile in qos_mapping.items()}
+
+
+_MISSING = object()
+
+
+def merge_patch(old: dict, new: dict) -> dict:
+    """RFC 7396 JSON merge patch that turns `old` into `new`: changed members only, removed ones as null."""
+    patch = {}
+    for key, value in new.items():
+        before = old.get(key, _MISSING)
+        if isinstance(value, dict) and isinstance(before, dict):
+            nested = merge_patch(before, value)
+            if nested:
+                patch[key] = nested
+        elif before != value:
+            patch[key] = value
+    for key in old:
+        if key not in new:
+            patch[key] = None
+    return patch
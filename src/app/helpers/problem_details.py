@@ -25,7 +25,9 @@ def create_problem_details(
         problem["invalidParams"] = invalid_params
     if retry_after:
         problem["retryAfter"] = retry_after
-    return JSONResponse(status_code=status_code, content=problem, media_type="application/problem+json")
+    headers = {"Retry-After": retry_after} if retry_after else None
+    return JSONResponse(status_code=status_code, content=problem, media_type="application/problem+json",
+                        headers=headers)
 
 
 def error_400(request: Request, detail: str, invalid_params: Optional[List[Dict[str, str]]] = None):
@@ -43,9 +45,18 @@ def error_404(request: Request, detail: str = "Not Found"):
 def error_406(request: Request, detail: str = "Not Acceptable"):
     return create_problem_details(406, "Not Acceptable", detail, str(request.url))
 
+def error_409(request: Request, detail: str = "Conflict"):
+    return create_problem_details(409, "Conflict", detail, str(request.url))
+
+def error_410(request: Request, detail: str = "Gone"):
+    return create_problem_details(410, "Gone", detail, str(request.url))
+
 def error_411(request: Request, detail: str = "Length Required"):
     return create_problem_details(411, "Length Required", detail, str(request.url))
 
+def error_412(request: Request, detail: str = "Precondition Failed"):
+    return create_problem_details(412, "Precondition Failed", detail, str(request.url))
+
 def error_413(request: Request, detail: str = "Payload Too Large"):
     return create_problem_details(413, "Payload Too Large", detail, str(request.url))
 
@@ -58,8 +69,11 @@ def error_429(request: Request, detail: str = "Too Many Requests", retry_after:
 def error_500(request: Request, detail: str = "Internal Server Error"):
     return create_problem_details(500, "Internal Server Error", detail, str(request.url))
 
-def error_503(request: Request, detail: str = "Service Unavailable"):
-    return create_problem_details(503, "Service Unavailable", detail, str(request.url))
+def error_503(request: Request, detail: str = "Service Unavailable", retry_after: Optional[str] = None):
+    return create_problem_details(503, "Service Unavailable", detail, str(request.url), retry_after=retry_after)
+
+def error_504(request: Request, detail: str = "Gateway Timeout"):
+    return create_problem_details(504, "Gateway Timeout", detail, str(request.url))
 
 
 # Generate OpenAPI responses from problem_details functions
@@ -72,12 +86,16 @@ def generate_error_responses():
         403: {"title": "Forbidden", "has_invalid_params": False},
         404: {"title": "Not Found", "has_invalid_params": False},
         406: {"title": "Not Acceptable", "has_invalid_params": False},
+        409: {"title": "Conflict", "has_invalid_params": False},
+        410: {"title": "Gone", "has_invalid_params": False},
         411: {"title": "Length Required", "has_invalid_params": False},
+        412: {"title": "Precondition Failed", "has_invalid_params": False},
         413: {"title": "Payload Too Large", "has_invalid_params": False},
         415: {"title": "Unsupported Media Type", "has_invalid_params": False},
         429: {"title": "Too Many Requests", "has_retry_after": True},
         500: {"title": "Internal Server Error", "has_invalid_params": False},
-        503: {"title": "Service Unavailable", "has_invalid_params": False},
+        503: {"title": "Service Unavailable", "has_invalid_params": False, "has_retry_after": True},
+        504: {"title": "Gateway Timeout", "has_invalid_params": False},
     }
     
     responses = {}
@@ -1,18 +1,21 @@
 from fastapi import (
     APIRouter,
     Depends,
+    Header,
     Response,
     status,
     Request
 )
-from typing import List, Dict
+from typing import List, Dict, Optional
 
 from app.schemas.qos_models import (
     AsSessionWithQosSubscription,
     AsSessionWithQosSubscriptionWithSubscriptionId,
     AsSessionWithQosSubscriptionPatch,
-    UserPlaneNotificationData
-    
+    UserPlaneNotificationData,
+    BulkSubscriptionsRequest,
+    BulkDeleteRequest,
+    BulkResult
 )
 from app.helpers.problem_details import generate_error_responses
 from app.utils.log import get_app_logger
@@ -22,9 +25,12 @@ from app.services.Northbound_apis_svc import (
     get_ResponseBody_by_scsAsId_and_subscriptionId,
     put_scsAsId_and_subscriptionId,
     patch_scsAsId_and_subscriptionId,
-    delete_subscriptionId
+    delete_subscriptionId,
+    watch_subscriptions,
+    bulk_create_subscriptions,
+    bulk_delete_subscriptions
 )
-from app.services.db import in_memory_db
+from app.services.db import in_memory_db, SubscriptionStore
 
 
 logger = get_app_logger()
@@ -42,15 +48,23 @@ router = APIRouter()
     tags=["AsSessionWithQoS API SCS/AS level GET Operation"],
     status_code=status.HTTP_200_OK,
     response_model=List[AsSessionWithQosSubscriptionWithSubscriptionId],
-    description="Read all active subscriptions for the SCS/AS",
+    description="Read all active subscriptions for the SCS/AS, optionally filtered by ueIpv4Addr, qosReference "
+                "and notificationHost. Pass limit/cursor for cursor pagination (next page in the Link header) "
+                "or Accept: application/x-ndjson for a streamed listing",
     responses=COMMON_ERROR_RESPONSES
 )
 async def get_all_subsciptions_based_on_SCSAS(
     request: Request,
     scsAsId: str,
-    store: Dict[str, List[AsSessionWithQosSubscriptionWithSubscriptionId]] = Depends(in_memory_db)) -> List[AsSessionWithQosSubscriptionWithSubscriptionId]:
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None,
+    ueIpv4Addr: Optional[str] = None,
+    qosReference: Optional[str] = None,
+    notificationHost: Optional[str] = None,
+    store: SubscriptionStore = Depends(in_memory_db)) -> List[AsSessionWithQosSubscriptionWithSubscriptionId]:
     
-    return await get_subscriptions_based_on_scsAsId(request, scsAsId, store)
+    return await get_subscriptions_based_on_scsAsId(request, scsAsId, store, limit, cursor,
+                                                    ueIpv4Addr, qosReference, notificationHost)
 
 
 @router.post(
@@ -66,10 +80,59 @@ async def create_subscription(
     scsAsId: str,
     initial_model: AsSessionWithQosSubscription,
     response: Response,
-    store: Dict[str, List[AsSessionWithQosSubscriptionWithSubscriptionId]] = Depends(in_memory_db))-> AsSessionWithQosSubscriptionWithSubscriptionId:
+    store: SubscriptionStore = Depends(in_memory_db))-> AsSessionWithQosSubscriptionWithSubscriptionId:
 
     return await create_subscription_for_a_given_scsAsId(request, scsAsId, initial_model, response, store)
 
+# Registered before /{subscriptionId} so "watch" is not taken for a subscriptionId
+@router.get(
+    "/{scsAsId}/subscriptions/watch",
+    tags=["AsSessionWithQoS API SCS/AS level GET Operation"],
+    status_code=status.HTTP_200_OK,
+    description="Stream created/updated/deleted/pcf_result events of the SCS/AS's subscriptions as server-sent "
+                "events (or NDJSON with Accept: application/x-ndjson). Resume with since or Last-Event-ID",
+    responses=COMMON_ERROR_RESPONSES
+)
+async def watch_subscriptions_of_SCSAS(
+    request: Request,
+    scsAsId: str,
+    since: Optional[str] = None,
+    last_event_id: Optional[str] = Header(None)):
+
+    return await watch_subscriptions(request, scsAsId, since, last_event_id)
+
+@router.post(
+    "/{scsAsId}/subscriptions/bulk",
+    tags=["AsSessionWithQoS API Bulk Operations"],
+    status_code=status.HTTP_200_OK,
+    response_model=BulkResult,
+    description="Creates many subscription resources; each item reports its own status",
+    responses=COMMON_ERROR_RESPONSES
+)
+async def bulk_create(
+    request: Request,
+    scsAsId: str,
+    bulk: BulkSubscriptionsRequest,
+    store: SubscriptionStore = Depends(in_memory_db)) -> BulkResult:
+
+    return await bulk_create_subscriptions(request, scsAsId, bulk, store)
+
+@router.post(
+    "/{scsAsId}/subscriptions/bulk-delete",
+    tags=["AsSessionWithQoS API Bulk Operations"],
+    status_code=status.HTTP_200_OK,
+    response_model=BulkResult,
+    description="Deletes many subscription resources; each item reports its own status",
+    responses=COMMON_ERROR_RESPONSES
+)
+async def bulk_delete(
+    request: Request,
+    scsAsId: str,
+    bulk: BulkDeleteRequest,
+    store: SubscriptionStore = Depends(in_memory_db)) -> BulkResult:
+
+    return await bulk_delete_subscriptions(request, scsAsId, bulk, store)
+
 @router.get(
     "/{scsAsId}/subscriptions/{subscriptionId}",
     tags=["AsSessionWithQoS API Subscription level CRUD Operations"],
@@ -82,44 +145,50 @@ async def get_with_scsAsId_and_subscriptionId(
     request: Request,
     scsAsId: str,
     subscriptionId: str,
-    store: Dict[str, List[AsSessionWithQosSubscriptionWithSubscriptionId]] = Depends(in_memory_db)) -> AsSessionWithQosSubscription:
-
-    return await get_ResponseBody_by_scsAsId_and_subscriptionId(request,scsAsId, subscriptionId, store)
-
-
-####### NOTE PUT AND PATCH METHODS ARE COMMENTED OUT CAUSE OPEN5GS DOESNT SUPPORT IT, BUT THEY ARE 3GPP COMPLIANT ########
-# @router.put(
-#     "/{scsAsId}/subscriptions/{subscriptionId}",
-#     tags=["AsSessionWithQoS API Subscription level CRUD Operations"],
-#     status_code=status.HTTP_200_OK,
-#     response_model=AsSessionWithQosSubscription,
-#     description="Updates/replaces an existing subscription resource"
-# )
-# async def update_with_PUT_scsAsId_and_subscriptionId(
-#     request: Request,
-#     scsAsId: str,
-#     subscriptionId: str,
-#     initial_model: AsSessionWithQosSubscription,
-#     store: Dict[str, List[AsSessionWithQosSubscriptionWithSubscriptionId]] = Depends(in_memory_db)) -> AsSessionWithQosSubscription:
-
-#     return await put_scsAsId_and_subscriptionId(request,scsAsId, subscriptionId, initial_model, store)
-
-
-# @router.patch(
-#     "/{scsAsId}/subscriptions/{subscriptionId}",
-#     tags=["AsSessionWithQoS API Subscription level CRUD Operations"],
-#     status_code=status.HTTP_200_OK,
-#     response_model=AsSessionWithQosSubscription,
-#     description="Updates/replaces an existing subscription resource"
-# )
-# async def update_with_PATCH_scsAsId_and_subscriptionId(
-#     request: Request,
-#     scsAsId: str,
-#     subscriptionId: str,
-#     initial_model: AsSessionWithQosSubscriptionPatch,
-#     store: Dict[str, List[AsSessionWithQosSubscriptionWithSubscriptionId]] = Depends(in_memory_db)) -> AsSessionWithQosSubscription:
-
-#     return await patch_scsAsId_and_subscriptionId(request ,scsAsId, subscriptionId, initial_model, store)
+    if_none_match: Optional[str] = Header(None),
+    store: SubscriptionStore = Depends(in_memory_db)) -> AsSessionWithQosSubscription:
+
+    return await get_ResponseBody_by_scsAsId_and_subscriptionId(request,scsAsId, subscriptionId, store, if_none_match)
+
+
+####### PUT AND PATCH reach the PCF as an Npcf_PolicyAuthorization Update (PATCH of the App Session) ########
+@router.put(
+    "/{scsAsId}/subscriptions/{subscriptionId}",
+    tags=["AsSessionWithQoS API Subscription level CRUD Operations"],
+    status_code=status.HTTP_200_OK,
+    response_model=AsSessionWithQosSubscription,
+    description="Updates/replaces an existing subscription resource",
+    responses=COMMON_ERROR_RESPONSES
+)
+async def update_with_PUT_scsAsId_and_subscriptionId(
+    request: Request,
+    scsAsId: str,
+    subscriptionId: str,
+    initial_model: AsSessionWithQosSubscription,
+    if_match: Optional[str] = Header(None),
+    store: SubscriptionStore = Depends(in_memory_db)) -> AsSessionWithQosSubscription:
+
+    return await put_scsAsId_and_subscriptionId(request,scsAsId, subscriptionId, initial_model, store, if_match)
+
+
+@router.patch(
+    "/{scsAsId}/subscriptions/{subscriptionId}",
+    tags=["AsSessionWithQoS API Subscription level CRUD Operations"],
+    status_code=status.HTTP_200_OK,
+    response_model=AsSessionWithQosSubscription,
+    description="Modifies an existing subscription resource",
+    responses=COMMON_ERROR_RESPONSES
+)
+async def update_with_PATCH_scsAsId_and_subscriptionId(
+    request: Request,
+    scsAsId: str,
+    subscriptionId: str,
+    initial_model: AsSessionWithQosSubscriptionPatch,
+    if_match: Optional[str] = Header(None),
+    store: SubscriptionStore = Depends(in_memory_db)) -> AsSessionWithQosSubscription:
+
+    return await patch_scsAsId_and_subscriptionId(request ,scsAsId, subscriptionId, initial_model, store, if_match)
+
 
 @router.delete(
     "/{scsAsId}/subscriptions/{subscriptionId}",
@@ -133,6 +202,7 @@ async def delete_with_scsAsId_and_subscriptionId(
     request: Request,
     scsAsId: str,
     subscriptionId: str,
-    store: Dict[str, List[AsSessionWithQosSubscriptionWithSubscriptionId]] = Depends(in_memory_db)):
+    if_match: Optional[str] = Header(None),
+    store: SubscriptionStore = Depends(in_memory_db)):
 
-    return await delete_subscriptionId(request ,scsAsId, subscriptionId, store)
+    return await delete_subscriptionId(request ,scsAsId, subscriptionId, store, if_match)
@@ -0,0 +1,89 @@
+import asyncio
+from fastapi import APIRouter, status
+
+from app.helpers.callback import notification_dispatcher
+from app.helpers.pcf_http2_requests import describe_pcf_admission
+from app.helpers.problem_details import generate_error_responses
+from app.services.qos_catalogue import get_qos_catalogue
+from app.services.teardown import teardown_manager
+from app.utils.log import get_app_logger
+
+
+logger = get_app_logger()
+
+COMMON_ERROR_RESPONSES = generate_error_responses()
+
+
+router = APIRouter()
+
+
+@router.get(
+    "/callbacks/dead-letters",
+    tags=["NEF Administration"],
+    status_code=status.HTTP_200_OK,
+    description="Number of AF notifications waiting in the dead-letter spool and for a retry",
+    responses=COMMON_ERROR_RESPONSES
+)
+async def get_dead_letter_status():
+    return {
+        "deadLetters": await asyncio.to_thread(notification_dispatcher.dead_letters.count),
+        "pendingRetries": notification_dispatcher.pending_retries,
+    }
+
+
+@router.post(
+    "/callbacks/dead-letters/replay",
+    tags=["NEF Administration"],
+    status_code=status.HTTP_202_ACCEPTED,
+    description="Re-queue every dead-lettered AF notification for delivery",
+    responses=COMMON_ERROR_RESPONSES
+)
+async def replay_dead_letters():
+    replayed = await notification_dispatcher.replay_dead_letters()
+    logger.info("Admin replay re-queued %s notifications", replayed)
+    return {"replayed": replayed}
+
+
+@router.get(
+    "/qos-catalogue",
+    tags=["NEF Administration"],
+    status_code=status.HTTP_200_OK,
+    description="Active QoS profile catalogue: version, content digest, source and when it was loaded",
+    responses=COMMON_ERROR_RESPONSES
+)
+async def get_active_qos_catalogue():
+    return get_qos_catalogue().describe()
+
+
+@router.get(
+    "/teardowns",
+    tags=["NEF Administration"],
+    status_code=status.HTTP_200_OK,
+    description="Asynchronous deletes whose PCF teardown has not completed yet",
+    responses=COMMON_ERROR_RESPONSES
+)
+async def get_pending_teardowns():
+    return teardown_manager.describe()
+
+
+@router.post(
+    "/teardowns/reconcile",
+    tags=["NEF Administration"],
+    status_code=status.HTTP_202_ACCEPTED,
+    description="Re-queue stuck PCF teardowns now instead of at the next reconciler run",
+    responses=COMMON_ERROR_RESPONSES
+)
+async def reconcile_teardowns():
+    return {"requeued": teardown_manager.reconcile()}
+
+
+@router.get(
+    "/health",
+    tags=["NEF Administration"],
+    status_code=status.HTTP_200_OK,
+    description="NEF health: PCF circuit breaker state and the adaptive limit on PCF requests in flight",
+    responses=COMMON_ERROR_RESPONSES
+)
+async def get_health():
+    pcf = describe_pcf_admission()
+    return {"status": "ok" if pcf["circuitBreaker"]["state"] == "closed" else "degraded", "pcf": pcf}
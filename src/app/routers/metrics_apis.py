@@ -0,0 +1,16 @@
+from fastapi import APIRouter, Response
+
+from app.utils.metrics import REGISTRY, CONTENT_TYPE
+
+
+router = APIRouter()
+
+
+@router.get(
+    "/metrics",
+    tags=["NEF Administration"],
+    description="Metrics in the Prometheus text format",
+    response_class=Response,
+)
+async def get_metrics():
+    return Response(REGISTRY.render(), media_type=CONTENT_TYPE)
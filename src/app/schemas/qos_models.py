@@ -1,16 +1,8 @@
-from typing import Optional, List
+from typing import Any, Dict, Optional, List
 from pydantic import BaseModel, IPvAnyAddress, HttpUrl, field_validator
 import re
 from enum import Enum
-
-
-FLOW_DESCRIPTION_REGEX = re.compile(
-    r'^permit (in|out) (ip|tcp|udp) from '
-    r'([0-9a-fA-F:.]+(?:/\d+)?|any)(?: (?:(?:0|[1-9][0-9]{0,4})|(?:[0-9]+-[0-9]+)))? to '
-    r'([0-9a-fA-F:.]+(?:/\d+)?|any)(?: (?:(?:0|[1-9][0-9]{0,4})|(?:[0-9]+-[0-9]+)))?$'
-)
-
-FORBIDDEN_KEYWORDS = ["!", "options", "assigned", ",", ".."]
+from app.helpers.ip_filter_rule import IPFilterRule, parse_ip_filter_rule
 
 
 class FlowInfo(BaseModel):
@@ -24,12 +16,15 @@ class FlowInfo(BaseModel):
         if v is None:
             return v
         for rule in v:
-            if not FLOW_DESCRIPTION_REGEX.match(rule):
-                raise ValueError(f"Invalid Flow-Description format: {rule}") 
-            if any(bad in rule for bad in FORBIDDEN_KEYWORDS):
-                raise ValueError(f"Disallowed keyword or format in Flow-Description: {rule}")
+            try:
+                parse_ip_filter_rule(rule)  # cached, later lookups of the same rule are free
+            except ValueError as e:
+                raise ValueError(f"Invalid Flow-Description format: {rule} ({e})") from None
         return v
 
+    def parsed_flow_descriptions(self) -> List[IPFilterRule]:
+        return [parse_ip_filter_rule(rule) for rule in self.flowDescriptions or []]
+
     model_config = {
         "json_schema_extra": {
             "examples": [{
@@ -162,6 +157,28 @@ class UserPlaneNotificationData(BaseModel):
 
 ##### FROM 3GPP TS_129514 NEF-PCF models #####
 
+class BulkSubscriptionsRequest(BaseModel):
+    """Body of a bulk create: subscriptions created for the same SCS/AS"""
+    subscriptions: List[AsSessionWithQosSubscription]
+
+class BulkDeleteRequest(BaseModel):
+    """Body of a bulk delete: subscriptionIds of the same SCS/AS"""
+    subscriptionIds: List[str]
+
+class BulkItemResult(BaseModel):
+    """Outcome of one item of a bulk request, in request order"""
+    index: int
+    status: int  # status code the single-item operation would have returned
+    subscriptionId: Optional[str] = None
+    subscription: Optional[AsSessionWithQosSubscriptionWithSubscriptionId] = None
+    problem: Optional[Dict[str, Any]] = None  # ProblemDetails for a failed item
+
+class BulkResult(BaseModel):
+    succeeded: int
+    failed: int
+    results: List[BulkItemResult]
+
+
 class FlowUsage(str, Enum):
     """Enumeration for flow usage as per 3GPP TS 29.214 Table 5.6.3.14-1"""
     NO_INFO = "NO_INFO"         # No information about the usage of the IP flow is provided (default).
@@ -1,48 +1,315 @@
+import asyncio
+import base64
+import binascii
+import json
+from contextlib import asynccontextmanager, nullcontext
+from functools import partial
 from fastapi import  Depends, Response, Request
-from typing import List, Dict
+from fastapi.responses import StreamingResponse
+from bisect import bisect_right
+from ipaddress import IPv4Address
+from typing import List, Dict, Optional, Tuple
 from app.schemas.qos_models import (AsSessionWithQosSubscription, 
                                     AsSessionWithQosSubscriptionWithSubscriptionId,
                                     AsSessionWithQosSubscriptionPatch, 
                                     UserPlaneNotificationData, 
-                                    UserPlaneEventReport)
+                                    UserPlaneEventReport,
+                                    BulkSubscriptionsRequest,
+                                    BulkDeleteRequest,
+                                    BulkItemResult,
+                                    BulkResult)
 from app.utils.log import get_app_logger
-from app.services.db import in_memory_db
+from app.services.db import in_memory_db, SubscriptionStore, SubscriptionRecord
 from uuid import uuid4
 from app.services.db import delete_subId_with_appsessionId
+from app.services.flow_conflicts import FlowConflictIndex
+from app.services.change_feed import change_feed, ResumeTokenExpired, Watcher, ChangeEvent
+from app.services.teardown import teardown_manager
 from app.schemas.qos_models import UserPlaneEvent
 from app.helpers.callback import send_callback_to_as
-from app.helpers.problem_details import error_400, error_404, error_500
-from app.utils.app_config import NEF_BASE_URL
-
-from app.services.Southbound_apis_svc import create_app_session_context_to_PCF, delete_app_session_context_from_PCF
+from app.helpers.problem_details import (error_400, error_404, error_409, error_410, error_412, error_429, error_500, error_503,
+                                         error_504)
+from app.helpers.pcf_http2_requests import (PCFConnectFailedError, PCFConnectTimeoutError, PCFError, PCFOverloadedError,
+                                            PCFRejectedError, PCFServerError, PCFTimeoutError)
+from app.utils.app_config import (NEF_BASE_URL, BULK_MAX_ITEMS, BULK_PCF_CONCURRENCY,
+                                  LIST_MAX_PAGE_SIZE, LIST_STREAM_CHUNK_SIZE, WATCH_HEARTBEAT_INTERVAL,
+                                  DELETE_MODE, RATE_LIMIT_RATE, RATE_LIMIT_BURST, RATE_LIMIT_OVERRIDES)
+from app.utils.limiter import KeyedRateLimiter, retry_after_header
+from app.utils.metrics import ADMISSION_REJECTIONS
+
+from app.services.Southbound_apis_svc import (create_app_session_context_to_PCF, delete_app_session_context_from_PCF,
+                                              update_app_session_context_in_PCF)
 
 logger = get_app_logger()
 
+# Token bucket per SCS/AS, charged by the write operations
+rate_limiter = KeyedRateLimiter(RATE_LIMIT_RATE, RATE_LIMIT_BURST, RATE_LIMIT_OVERRIDES)
+_RATE_LIMITED = ADMISSION_REJECTIONS.labels("rate_limit")
+
+
+def rate_limited(request: Request, scsAsId: str, cost: int = 1):
+    """429 with Retry-After when the SCS/AS's bucket cannot pay for `cost` requests, else None (and charged)."""
+    if not cost:
+        return None
+    wait = rate_limiter.take(scsAsId, cost)
+    if not wait:
+        return None
+    _RATE_LIMITED.inc()
+    logger.info("Rate limited scsAsId=%s, retry in %.2fs", scsAsId, wait)
+    return error_429(request, f"Request rate limit of SCS/AS '{scsAsId}' exceeded",
+                     retry_after=retry_after_header(wait))
+
+
+# Per subscriptionId: writes to one subscription run one at a time, so an
+# If-Match check still holds when the PCF answers
+_write_locks: Dict[str, List] = {}
+
+
+@asynccontextmanager
+async def subscription_write_lock(store: SubscriptionStore, subscriptionId: str):
+    """
+    Serialize the writes to one subscription, in this process and (through the store's
+    lock) across workers sharing the store, which is brought up to date once it is held.
+    """
+    entry = _write_locks.get(subscriptionId)
+    if entry is None:
+        entry = _write_locks[subscriptionId] = [asyncio.Lock(), 0]
+    entry[1] += 1
+    try:
+        async with entry[0], store.lock(f"subscription:{subscriptionId}"):
+            yield
+    finally:
+        entry[1] -= 1
+        if not entry[1]:
+            del _write_locks[subscriptionId]
+
+
+def flow_lock(store: SubscriptionStore, subscription):
+    """
+    Store lock on the UE of `subscription`, held from its flow conflict check until it is
+    stored, so two workers cannot both accept overlapping flows for one UE.
+    """
+    if subscription.ueIpv4Addr is None:
+        return nullcontext()
+    return store.lock(f"ue:{subscription.ueIpv4Addr}")
+
+
+def pcf_error_response(request: Request, e: PCFError):
+    """
+    Map a southbound failure to 504 when the PCF timed out, 500 when it refused the request,
+    else 503 (with Retry-After when it was never sent).
+    """
+    if isinstance(e, PCFRejectedError):
+        return error_500(request, f"PCF refused the request: {str(e)}")
+    if isinstance(e, PCFTimeoutError):
+        return error_504(request, f"PCF did not respond in time: {str(e)}")
+    if isinstance(e, PCFOverloadedError):
+        return error_503(request, f"PCF request refused: {str(e)}", retry_after=retry_after_header(e.retry_after))
+    return error_503(request, f"PCF unavailable: {str(e)}")
+
+
+def flow_conflict_response(request: Request, store: SubscriptionStore, scsAsId: str, subscription,
+                           exclude: str = None):
+    """
+    400 when `subscription`'s flows overlap those of another subscription for the
+    same UE, else None. Only the caller's own subscriptions are named; the ones of
+    other SCS/ASs are counted, never identified.
+    """
+    conflicts = store.find_flow_conflicts(subscription.ueIpv4Addr, subscription.flowInfo, exclude=exclude)
+    if not conflicts:
+        return None
+    logger.info("Rejected flows of scsAsId=%s for UE %s: overlap with %s", scsAsId, subscription.ueIpv4Addr, conflicts)
+    own = [conflict for conflict in conflicts if (record := store.get_by_id(conflict)) is not None
+           and record.scsAsId == scsAsId]
+    foreign = len(conflicts) - len(own)
+    named = own + ([f"{foreign} subscription(s) of another SCS/AS"] if foreign else [])
+    invalid_params = [{"name": "flowInfo", "reason": f"Overlaps subscription {conflict}"} for conflict in own]
+    if foreign:
+        invalid_params.append({"name": "flowInfo", "reason": "Overlaps a subscription of another SCS/AS"})
+    return error_400(
+        request,
+        detail=f"Flow descriptions overlap existing subscription(s) for UE {subscription.ueIpv4Addr}: {', '.join(named)}",
+        invalid_params=invalid_params
+    )
+
+
+def notify_failed_resources_allocation(notification_destination, scsAsId, subscription_id):
+    """Queue FAILED_RESOURCES_ALLOCATION for the AS, if we got far enough to know where to send it."""
+    if not (notification_destination and subscription_id):
+        return
+    logger.info("Sending FAILED_RESOURCES_ALLOCATION notification for subscription %s", subscription_id)
+    try:
+        send_callback_to_as(
+            notification_destination, 
+            scsAsId, 
+            subscription_id, 
+            event=UserPlaneEvent.FAILED_RESOURCES_ALLOCATION
+        )
+    except Exception as callback_error:
+        logger.error("Failed to send failure notification: %s", callback_error)
+
+
+def encode_cursor(subscription_id: str) -> str:
+    return base64.urlsafe_b64encode(subscription_id.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> str:
+    """The subscriptionId a page cursor continues after; raises ValueError for a malformed cursor."""
+    try:
+        return base64.b64decode(cursor + "=" * (-len(cursor) % 4), altchars=b"-_", validate=True).decode("utf-8")
+    except (binascii.Error, UnicodeDecodeError) as e:
+        raise ValueError(f"malformed cursor '{cursor}'") from e
+
+
+def wants_ndjson(request: Request) -> bool:
+    return "application/x-ndjson" in request.headers.get("accept", "")
+
+
+async def stream_subscriptions(store: SubscriptionStore, scsAsId: str, subscription_ids: Optional[List[str]] = None):
+    """NDJSON listing, one chunk of serialized subscriptions at a time."""
+    for chunk in store.iter_raw(scsAsId, LIST_STREAM_CHUNK_SIZE, subscription_ids):
+        yield ("\n".join(chunk) + "\n").encode("utf-8")
+
+
+def page_of(records: List[SubscriptionRecord], after: Optional[str], limit: int) -> Tuple[List[SubscriptionRecord], Optional[str]]:
+    """Cursor page over an already filtered result, in subscriptionId order like SubscriptionStore.page."""
+    records = sorted(records, key=lambda record: record.subscriptionId)
+    start = bisect_right([record.subscriptionId for record in records], after) if after is not None else 0
+    chunk = records[start:start + limit]
+    return chunk, (chunk[-1].subscriptionId if start + limit < len(records) else None)
+
+
 async def get_subscriptions_based_on_scsAsId(
     request: Request,
     scsAsId: str,
-    store: Dict[str, List[AsSessionWithQosSubscription]] = Depends(in_memory_db)) -> List[AsSessionWithQosSubscription]:
+    store: SubscriptionStore = Depends(in_memory_db),
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None,
+    ueIpv4Addr: Optional[str] = None,
+    qosReference: Optional[str] = None,
+    notificationHost: Optional[str] = None) -> List[AsSessionWithQosSubscription]:
+    """
+    List the subscriptions of an SCS/AS.
+
+    - `ueIpv4Addr`, `qosReference`, `notificationHost` (host of notificationDestination)
+      keep only the matching subscriptions; they are answered from the store indexes.
+    - Without `limit`/`cursor`: the whole list, in creation order (as before).
+    - With them: one page of at most `limit` subscriptions in subscriptionId order.
+      A `Link: <...>; rel="next"` header carries the cursor of the next page.
+    - With `Accept: application/x-ndjson`: every subscription streamed as one JSON
+      document per line, without building the whole response in memory.
+    """
     try:
-        if scsAsId not in store:
+        if not await store.find_scs_as(scsAsId):
             return error_404(request, f"SCS/AS '{scsAsId}' not found.")
 
-        logger.info(f"Fetching subscriptions for {scsAsId=}")
+        logger.info("Fetching subscriptions for scsAsId=%s", scsAsId)
 
+        records = None
+        if ueIpv4Addr is not None or qosReference is not None or notificationHost is not None:
+            if ueIpv4Addr is not None:
+                try:
+                    ueIpv4Addr = str(IPv4Address(ueIpv4Addr))
+                except ValueError:
+                    return error_400(
+                        request,
+                        detail=f"Invalid ueIpv4Addr '{ueIpv4Addr}'",
+                        invalid_params=[{"name": "ueIpv4Addr", "reason": "Not an IPv4 address"}]
+                    )
+            records = store.query(
+                scsAsId,
+                ue_ipv4=ueIpv4Addr,
+                qos_reference=qosReference,
+                notification_host=notificationHost.lower() if notificationHost is not None else None,
+            )
 
-        return store[scsAsId]
+        if wants_ndjson(request):
+            subscription_ids = [record.subscriptionId for record in records] if records is not None else None
+            return StreamingResponse(stream_subscriptions(store, scsAsId, subscription_ids), media_type="application/x-ndjson")
+
+        if limit is None and cursor is None:
+            if records is not None:
+                return [record.subscription for record in records]
+            return store.list(scsAsId)
+
+        limit = LIST_MAX_PAGE_SIZE if limit is None else limit
+        if not 1 <= limit <= LIST_MAX_PAGE_SIZE:
+            return error_400(
+                request,
+                detail=f"limit must be between 1 and {LIST_MAX_PAGE_SIZE}",
+                invalid_params=[{"name": "limit", "reason": f"Not in 1..{LIST_MAX_PAGE_SIZE}"}]
+            )
+        try:
+            after = decode_cursor(cursor) if cursor is not None else None
+        except ValueError as e:
+            return error_400(request, detail=str(e), invalid_params=[{"name": "cursor", "reason": "Malformed cursor"}])
+
+        if records is not None:
+            page_records, next_after = page_of(records, after, limit)
+        else:
+            page_records, next_after = store.page(scsAsId, after, limit)
+        page = Response(content="[" + ",".join(record.raw for record in page_records) + "]", media_type="application/json")
+        if next_after is not None:
+            next_url = request.url.include_query_params(limit=limit, cursor=encode_cursor(next_after))
+            page.headers["Link"] = f'<{next_url}>; rel="next"'
+        return page
     
     except Exception as e:
-        logger.error(f"Error while fetching subscriptions for {scsAsId=}: {e}")
+        logger.error("Error while fetching subscriptions for scsAsId=%r: %s", scsAsId, e)
         return error_500(request, f"Unexpected error: {str(e)}")
 
+def publish_failed_allocation(scsAsId: str, subscription_id: Optional[str], error: Exception):
+    """Tell the watchers of the SCS/AS that the PCF did not allocate a created subscription."""
+    if subscription_id is not None:
+        change_feed.publish(scsAsId, "pcf_result", subscription_id,
+                            result=UserPlaneEvent.FAILED_RESOURCES_ALLOCATION.value, reason=str(error))
+
+
+def pcf_allocated_nothing(e: PCFError) -> bool:
+    """
+    True when a failed create provably left no app-session at the PCF: the request was
+    refused before it was sent (admission, circuit breaker, connect failure), the PCF
+    refused the stream, or it answered with an error status. After any other failure
+    (read or total timeout, connection lost mid-stream) the PCF may have allocated it.
+    """
+    return e.retryable or isinstance(e, (PCFConnectFailedError, PCFConnectTimeoutError, PCFServerError, PCFRejectedError))
+
+
+async def hand_over_unsettled(store: SubscriptionStore, scsAsId: str, subscription_id: Optional[str]):
+    """
+    Keep a subscription whose create may have reached the PCF, marked terminating, and queue
+    its teardown: its flows stay reserved until the teardown has run.
+    """
+    if subscription_id is None or store.get_record(scsAsId, subscription_id) is None:
+        return
+    store.mark_terminating(subscription_id)
+    await store.sync()
+    teardown_manager.request(subscription_id, partial(tear_down_subscription, scsAsId, subscription_id, store))
+    change_feed.publish(scsAsId, "terminating", subscription_id)
+    logger.warning("The PCF may hold an app-session for subscription %s of scsAsId=%s; handed to the teardown",
+                   subscription_id, scsAsId)
+
+
+def discard_unallocated(store: SubscriptionStore, scsAsId: str, subscription_id: Optional[str]):
+    """
+    Undo the local part of a create the PCF did not allocate, so the
+    subscription (and its flows) do not block the AF's retry.
+    """
+    if subscription_id is not None and store.remove(scsAsId, subscription_id) is not None:
+        change_feed.publish(scsAsId, "deleted", subscription_id)
+        logger.info("Discarded subscription %s for scsAsId=%s after a failed PCF request", subscription_id, scsAsId)
+
+
 async def create_subscription_for_a_given_scsAsId(
     request: Request,
     scsAsId: str,
     initial_model: AsSessionWithQosSubscription,
     response: Response,
-    store: Dict[str, List[AsSessionWithQosSubscription]] = Depends(in_memory_db))-> AsSessionWithQosSubscriptionWithSubscriptionId:
+    store: SubscriptionStore = Depends(in_memory_db),
+    rate_limit_cost: int = 1)-> AsSessionWithQosSubscriptionWithSubscriptionId:
     """
     Create a new AsSessionWithQoS subscription and forward to PCF.
+    `rate_limit_cost` is charged to the SCS/AS's token bucket first (0 when the caller already did).
     
     Flow:
     1. Validate request and create subscription in local store
@@ -50,42 +317,53 @@ async def create_subscription_for_a_given_scsAsId(
     3. Send SUCCESSFUL_RESOURCES_ALLOCATION if PCF succeeds
     4. Send FAILED_RESOURCES_ALLOCATION if PCF fails
     """
+    limited = rate_limited(request, scsAsId, rate_limit_cost)
+    if limited is not None:
+        return limited
+
     subscription_id = None
     notification_destination = None
+    allocated = False
 
     try:
         # Validate request body
         if not initial_model:
             return error_400(request, "Request body is missing or invalid.")
-        
-        # Initialize store for this scsAsId if not exists
-        if scsAsId not in store:
-            store[scsAsId] = []
-
-        # Create subscription with unique ID
-        subscription_id = str(uuid4())
-        full_subscription = AsSessionWithQosSubscriptionWithSubscriptionId(
-            subscriptionId=subscription_id,
-            **initial_model.model_dump()
-        )
-        
-        # Store subscription in database
-        store[scsAsId].append(full_subscription)
+
+        async with flow_lock(store, initial_model):
+            conflict = flow_conflict_response(request, store, scsAsId, initial_model)
+            if conflict is not None:
+                return conflict
+
+            # Create subscription with unique ID
+            subscription_id = str(uuid4())
+            full_subscription = AsSessionWithQosSubscriptionWithSubscriptionId(
+                subscriptionId=subscription_id,
+                **initial_model.model_dump()
+            )
+
+            # Store subscription in database
+            record = store.add(scsAsId, full_subscription)
+            change_feed.publish(scsAsId, "created", subscription_id, record.raw)
 
         # Set Location header for created resource
         response.headers["Location"] = f"/3gpp-as-session-with-qos/v1/{scsAsId}/subscriptions/{subscription_id}"
-        logger.info(f"Created subscription {subscription_id} for scsAsId={scsAsId}")
+        logger.info("Created subscription %s for scsAsId=%s", subscription_id, scsAsId)
         
         notification_destination = str(full_subscription.notificationDestination)
 
         # Forward request to PCF to create AppSessionContext
         # This will raise an exception if PCF returns an error status
-        logger.debug(f"Forwarding subscription {subscription_id} to PCF")
+        logger.debug("Forwarding subscription %s to PCF", subscription_id)
         await create_app_session_context_to_PCF(initial_model, scsAsId, subscription_id)
+        allocated = True
         
-        # PCF succeeded - send success notification to AS
-        logger.info(f"PCF successfully allocated resources for subscription {subscription_id}")
-        await send_callback_to_as(
+        # PCF succeeded - queue success notification to AS, delivered in the background
+        logger.info("PCF successfully allocated resources for subscription %s", subscription_id)
+        change_feed.publish(scsAsId, "pcf_result", subscription_id, result=UserPlaneEvent.SUCCESSFUL_RESOURCES_ALLOCATION.value)
+        # The subscription and its appSessionId are durable before the AF sees 201
+        await store.sync()
+        send_callback_to_as(
             notification_destination, 
             scsAsId, 
             subscription_id, 
@@ -94,40 +372,94 @@ async def create_subscription_for_a_given_scsAsId(
 
         return full_subscription
 
+    except PCFError as e:
+        logger.error("PCF request failed while creating subscription for scsAsId=%s: %s", scsAsId, e)
+        publish_failed_allocation(scsAsId, subscription_id, e)
+        if pcf_allocated_nothing(e):
+            discard_unallocated(store, scsAsId, subscription_id)
+        else:
+            await hand_over_unsettled(store, scsAsId, subscription_id)
+        notify_failed_resources_allocation(notification_destination, scsAsId, subscription_id)
+        return pcf_error_response(request, e)
+
     except Exception as e:
-        logger.error(f"Failed to create subscription for scsAsId={scsAsId}: {e}")
+        logger.error("Failed to create subscription for scsAsId=%s: %s", scsAsId, e)
+        if not allocated:
+            publish_failed_allocation(scsAsId, subscription_id, e)
+            discard_unallocated(store, scsAsId, subscription_id)
         
         # Send failure notification to AS if we have the necessary info
-        if notification_destination and subscription_id:
-            logger.info(f"Sending FAILED_RESOURCES_ALLOCATION notification for subscription {subscription_id}")
-            try:
-                await send_callback_to_as(
-                    notification_destination, 
-                    scsAsId, 
-                    subscription_id, 
-                    event=UserPlaneEvent.FAILED_RESOURCES_ALLOCATION
-                )
-            except Exception as callback_error:
-                logger.error(f"Failed to send failure notification: {callback_error}")
+        notify_failed_resources_allocation(notification_destination, scsAsId, subscription_id)
 
         return error_500(request, f"Failed to create subscription: {str(e)}")
 
 
+def etag_matches(header: Optional[str], etag: str, weak: bool = False) -> bool:
+    """Whether an If-Match/If-None-Match value (ETag list or *) matches `etag`; `weak` ignores W/ prefixes."""
+    if header is None:
+        return False
+    if header.strip() == "*":
+        return True
+    for candidate in header.split(","):
+        candidate = candidate.strip()
+        if weak and candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == etag:
+            return True
+    return False
+
+
+def precondition_failed(request: Request, record: SubscriptionRecord, if_match: Optional[str]):
+    """412 when an If-Match header does not name the current version of the subscription, else None."""
+    if if_match is None or etag_matches(if_match, record.etag):
+        return None
+    return error_412(request, f"Subscription '{record.subscriptionId}' was modified; its current ETag is {record.etag}")
+
+
+def write_refused(request: Request, record: SubscriptionRecord, if_match: Optional[str]):
+    """412 for a stale If-Match, 409 while the subscription is being torn down, else None."""
+    if record.terminating:
+        return error_409(request, f"Subscription '{record.subscriptionId}' is being deleted")
+    return precondition_failed(request, record, if_match)
+
+
+async def apply_update(request: Request, store: SubscriptionStore, scsAsId: str, record: SubscriptionRecord,
+                       updated: AsSessionWithQosSubscriptionWithSubscriptionId) -> Response:
+    """
+    Send the change to the PCF, then store it: the stored subscription keeps
+    describing what the PCF applies. Called under the subscription's write lock,
+    after write_refused(): every check is done before the PCF is contacted, and
+    no write to the subscription can come in between on any worker.
+    """
+    await update_app_session_context_in_PCF(record.subscription, updated, record.subscriptionId)
+    record = store.replace(scsAsId, updated)
+    change_feed.publish(scsAsId, "updated", record.subscriptionId, record.raw)
+    await store.sync()
+    return subscription_response(record)
+
+
+def subscription_response(record: SubscriptionRecord) -> Response:
+    """The cached serialized subscription, with its ETag."""
+    return Response(content=record.body, media_type="application/json", headers={"ETag": record.etag})
+
+
 async def get_ResponseBody_by_scsAsId_and_subscriptionId(
     request: Request,
     scsAsId: str,
     subscriptionId: str,
-    store: Dict[str, List[AsSessionWithQosSubscription]] = Depends(in_memory_db)) -> AsSessionWithQosSubscription:
+    store: SubscriptionStore = Depends(in_memory_db),
+    if_none_match: Optional[str] = None) -> AsSessionWithQosSubscription:
 
     try:
-        subscriptions = store.get(scsAsId, [])
-        for sub in subscriptions:
-            if getattr(sub, "subscriptionId", None) == subscriptionId:
-                return sub
+        record = await store.find_record(scsAsId, subscriptionId)
+        if record is not None:
+            if etag_matches(if_none_match, record.etag, weak=True):
+                return Response(status_code=304, headers={"ETag": record.etag})
+            return subscription_response(record)
 
         return error_404(request, detail=f"Subscription '{subscriptionId}' for SCS/AS '{scsAsId}' not found")
     except Exception as e:
-        logger.error(f"Error while fetching subscription {subscriptionId} for {scsAsId=}: {e}")
+        logger.error("Error while fetching subscription %s for scsAsId=%r: %s", subscriptionId, scsAsId, e)
         return error_500(request, f"Unexpected error: {str(e)}")
 
 
@@ -137,39 +469,54 @@ async def put_scsAsId_and_subscriptionId(
     scsAsId: str,
     subscriptionId: str,
     initial_model: AsSessionWithQosSubscription,
-    store: Dict[str, List[AsSessionWithQosSubscriptionWithSubscriptionId]] = Depends(in_memory_db)
+    store: SubscriptionStore = Depends(in_memory_db),
+    if_match: Optional[str] = None
 ) -> AsSessionWithQosSubscription:
-    
-    subscriptions = store.get(scsAsId, [])
-    
-    try:
-        for i, sub in enumerate(subscriptions):
-            if getattr(sub, "subscriptionId", None) == subscriptionId:
-                original_ipv4 = sub.ueIpv4Addr
 
-                if initial_model.ueIpv4Addr is not None and initial_model.ueIpv4Addr != original_ipv4:
-                    return error_400(
-                        request,
-                        detail=f"Cannot change ueIpv4Addr from {original_ipv4} to {initial_model.ueIpv4Addr}",
-                        invalid_params=[{"name": "ueIpv4Addr", "reason": "Changing ueIpv4Addr is not allowed"}]
-                    )
+    limited = rate_limited(request, scsAsId)
+    if limited is not None:
+        return limited
 
-                updated_model_data = initial_model.model_dump()
-                updated_model_data['ueIpv4Addr'] = original_ipv4
+    try:
+        async with subscription_write_lock(store, subscriptionId):
+            record = store.get_record(scsAsId, subscriptionId)
+            if record is None:
+                return error_404(
+                    request,
+                    detail=f"Subscription '{subscriptionId}' for SCS/AS '{scsAsId}' not found"
+                )
+            refused = write_refused(request, record, if_match)
+            if refused is not None:
+                return refused
+
+            original_ipv4 = record.subscription.ueIpv4Addr
 
-                subscriptions[i] = AsSessionWithQosSubscriptionWithSubscriptionId(
-                    **updated_model_data,
-                    subscriptionId=subscriptionId
+            if initial_model.ueIpv4Addr is not None and initial_model.ueIpv4Addr != original_ipv4:
+                return error_400(
+                    request,
+                    detail=f"Cannot change ueIpv4Addr from {original_ipv4} to {initial_model.ueIpv4Addr}",
+                    invalid_params=[{"name": "ueIpv4Addr", "reason": "Changing ueIpv4Addr is not allowed"}]
                 )
 
-                return AsSessionWithQosSubscription(**updated_model_data)
+            updated_model_data = initial_model.model_dump()
+            updated_model_data['ueIpv4Addr'] = original_ipv4
+            updated = AsSessionWithQosSubscriptionWithSubscriptionId(
+                **updated_model_data,
+                subscriptionId=subscriptionId
+            )
 
-        return error_404(
-            request,
-            detail=f"Subscription '{subscriptionId}' for SCS/AS '{scsAsId}' not found"
-        )
+            async with flow_lock(store, updated):
+                conflict = flow_conflict_response(request, store, scsAsId, updated, exclude=subscriptionId)
+                if conflict is not None:
+                    return conflict
+
+                return await apply_update(request, store, scsAsId, record, updated)
+
+    except PCFError as e:
+        logger.error("PCF unavailable while updating subscription %s for scsAsId=%r: %s", subscriptionId, scsAsId, e)
+        return pcf_error_response(request, e)
     except Exception as e:
-        logger.error(f"Error while updating subscription {subscriptionId} for {scsAsId=}: {e}")
+        logger.error("Error while updating subscription %s for scsAsId=%r: %s", subscriptionId, scsAsId, e)
         return error_500(request, f"Unexpected error: {str(e)}")
     
 
@@ -178,49 +525,129 @@ async def patch_scsAsId_and_subscriptionId(
     scsAsId: str,
     subscriptionId: str,
     initial_model: AsSessionWithQosSubscriptionPatch,
-    store: Dict[str, List[AsSessionWithQosSubscriptionWithSubscriptionId]] = Depends(in_memory_db)
+    store: SubscriptionStore = Depends(in_memory_db),
+    if_match: Optional[str] = None
 ) -> AsSessionWithQosSubscription:
 
-    subscriptions = store.get(scsAsId, [])
+    limited = rate_limited(request, scsAsId)
+    if limited is not None:
+        return limited
+
     try:
-        for i, sub in enumerate(subscriptions):
-            if getattr(sub, "subscriptionId", None) == subscriptionId:
-                updated_data = sub.model_dump(exclude={'subscriptionId'})
-                patch_data = initial_model.model_dump(exclude_unset=True)
-                updated_data.update(patch_data)
-                
-                subscriptions[i] = AsSessionWithQosSubscriptionWithSubscriptionId(
-                    **updated_data,
-                    subscriptionId=subscriptionId
+        async with subscription_write_lock(store, subscriptionId):
+            record = store.get_record(scsAsId, subscriptionId)
+            if record is None:
+                return error_404(
+                    request,
+                    detail=f"Subscription '{subscriptionId}' for SCS/AS '{scsAsId}' not found"
                 )
-                
-                return AsSessionWithQosSubscription(**updated_data)
-        
-        return error_404(
-            request,
-            detail=f"Subscription '{subscriptionId}' for SCS/AS '{scsAsId}' not found"
-        )
+            refused = write_refused(request, record, if_match)
+            if refused is not None:
+                return refused
+
+            updated_data = record.subscription.model_dump(exclude={'subscriptionId'})
+            patch_data = initial_model.model_dump(exclude_unset=True)
+            updated_data.update(patch_data)
+            updated = AsSessionWithQosSubscriptionWithSubscriptionId(
+                **updated_data,
+                subscriptionId=subscriptionId
+            )
+
+            async with flow_lock(store, updated):
+                conflict = flow_conflict_response(request, store, scsAsId, updated, exclude=subscriptionId)
+                if conflict is not None:
+                    return conflict
+
+                return await apply_update(request, store, scsAsId, record, updated)
+
+    except PCFError as e:
+        logger.error("PCF unavailable while patching subscription %s for scsAsId=%r: %s", subscriptionId, scsAsId, e)
+        return pcf_error_response(request, e)
     except Exception as e:
-        logger.error(f"Error while patching subscription {subscriptionId} for {scsAsId=}: {e}")
+        logger.error("Error while patching subscription %s for scsAsId=%r: %s", subscriptionId, scsAsId, e)
         return error_500(request, f"Unexpected error: {str(e)}")
 
+def wants_async_delete(request: Request) -> bool:
+    return DELETE_MODE == "async" or "respond-async" in request.headers.get("prefer", "").lower()
+
+
+async def finish_delete(scsAsId: str, subscriptionId: str, store: SubscriptionStore):
+    """Local part of a delete once the PCF app-session is gone: drop the subscription and notify the AF."""
+    sub = store.remove(scsAsId, subscriptionId)
+    if sub is None:
+        return
+    change_feed.publish(scsAsId, "deleted", subscriptionId)
+    await store.sync()
+    logger.info("Deleted subscription %s for scsAsId=%s", subscriptionId, scsAsId)
+
+    try:
+        send_callback_to_as(str(sub.notificationDestination), scsAsId, subscriptionId, event=UserPlaneEvent.SESSION_TERMINATION)
+    except Exception as e:
+        logger.error("Callback failed: %s", e)
+
+
+async def tear_down_subscription(scsAsId: str, subscriptionId: str, store: SubscriptionStore):
+    """Background part of an asynchronous delete; raises while the PCF refuses, and is retried."""
+    await delete_app_session_context_from_PCF(subscriptionId)
+    await finish_delete(scsAsId, subscriptionId, store)
+
+
+def resume_teardowns(store: SubscriptionStore) -> int:
+    """
+    Queue the teardown of every subscription marked terminating in the store that has none
+    queued here. Another worker may be tearing the same one down: the PCF delete and the
+    local cleanup both tolerate running twice.
+    """
+    resumed = 0
+    for record in store.terminating_records():
+        if teardown_manager.request(record.subscriptionId,
+                                    partial(tear_down_subscription, record.scsAsId, record.subscriptionId, store)):
+            resumed += 1
+    return resumed
+
+
 async def delete_subscriptionId(
     request: Request,
     scsAsId: str,
     subscriptionId: str,
-    store: Dict[str, List[AsSessionWithQosSubscriptionWithSubscriptionId]] = Depends(in_memory_db)) -> UserPlaneNotificationData:
-
-    subscriptions = store.get(scsAsId, [])
-    for sub in subscriptions:
-        if getattr(sub, "subscriptionId", None) == subscriptionId:
-            subscriptions.remove(sub)
-            logger.info(f"Deleted subscription {subscriptionId} for scsAsId={scsAsId}")
+    store: SubscriptionStore = Depends(in_memory_db),
+    if_match: Optional[str] = None,
+    rate_limit_cost: int = 1) -> UserPlaneNotificationData:
+
+    limited = rate_limited(request, scsAsId, rate_limit_cost)
+    if limited is not None:
+        return limited
+
+    # Not while a PUT/PATCH of it waits for the PCF
+    async with subscription_write_lock(store, subscriptionId):
+        record = store.get_record(scsAsId, subscriptionId)
+        if record is not None:
+            failed = precondition_failed(request, record, if_match)
+            if failed is not None:
+                return failed
+
+            # Already terminating: the background teardown finishes the job
+            if record.terminating:
+                return Response(status_code=202)
+
+            if wants_async_delete(request):
+                # Durable before the 202: after a restart, or on another worker, the teardown resumes from the mark
+                store.mark_terminating(subscriptionId)
+                await store.sync()
+                teardown_manager.request(subscriptionId, partial(tear_down_subscription, scsAsId, subscriptionId, store))
+                change_feed.publish(scsAsId, "terminating", subscriptionId)
+                logger.info("Subscription %s for scsAsId=%s is terminating", subscriptionId, scsAsId)
+                return Response(status_code=202, headers={"Preference-Applied": "respond-async"})
+
+            # Tear down the PCF app-session first, so a timed out delete can be retried by the AF
+            try:
+                await delete_app_session_context_from_PCF(subscriptionId)
+            except PCFError as e:
+                logger.error("PCF request failed while deleting subscription %s: %s", subscriptionId, e)
+                return pcf_error_response(request, e)
 
-            # Remove the mapping of subscriptionId to appSessionId
-            delete_app_session_context_from_PCF(subscriptionId)
+            await finish_delete(scsAsId, subscriptionId, store)
 
-            notification_destination = str(sub.notificationDestination)
-            
             transaction_url = f"{NEF_BASE_URL}/3gpp-as-session-with-qos/v1/{scsAsId}/subscriptions/{subscriptionId}"
 
             payload = UserPlaneNotificationData(
@@ -229,15 +656,200 @@ async def delete_subscriptionId(
                     UserPlaneEventReport(event=UserPlaneEvent.SESSION_TERMINATION)
                 ]
             )
+            return payload
+
+        return error_404(
+            request,
+            detail=f"Subscription '{subscriptionId}' for SCS/AS '{scsAsId}' not found."
+        )
+
+
+def _bulk_size_error(request: Request, name: str, count: int):
+    if count == 0:
+        return error_400(request, f"'{name}' must not be empty.", invalid_params=[{"name": name, "reason": "Empty list"}])
+    if count > BULK_MAX_ITEMS:
+        return error_400(
+            request,
+            f"At most {BULK_MAX_ITEMS} items are accepted per bulk request, got {count}.",
+            invalid_params=[{"name": name, "reason": f"More than {BULK_MAX_ITEMS} items"}]
+        )
+    return None
+
+
+def _bulk_item_result(index: int, outcome, success_status: int, subscription_id: str = None) -> BulkItemResult:
+    """Map what a single-item service returned (model, bodiless 2xx or ProblemDetails response) to a BulkItemResult."""
+    if isinstance(outcome, Response):
+        if outcome.status_code < 300:  # e.g. 202 for an asynchronous delete
+            return BulkItemResult(index=index, status=outcome.status_code, subscriptionId=subscription_id)
+        return BulkItemResult(index=index, status=outcome.status_code, subscriptionId=subscription_id,
+                              problem=json.loads(outcome.body))
+    if isinstance(outcome, AsSessionWithQosSubscriptionWithSubscriptionId):
+        return BulkItemResult(index=index, status=success_status, subscriptionId=outcome.subscriptionId, subscription=outcome)
+    return BulkItemResult(index=index, status=success_status, subscriptionId=subscription_id)
+
+
+def _bulk_result(results: List[BulkItemResult]) -> BulkResult:
+    results.sort(key=lambda result: result.index)
+    succeeded = sum(1 for result in results if result.status < 300)
+    return BulkResult(succeeded=succeeded, failed=len(results) - succeeded, results=results)
+
+
+async def bulk_create_subscriptions(
+    request: Request,
+    scsAsId: str,
+    bulk: BulkSubscriptionsRequest,
+    store: SubscriptionStore = Depends(in_memory_db)) -> BulkResult:
+    """
+    Create many subscriptions for one SCS/AS.
+
+    The whole batch is validated first: its size, and flows of the same UE
+    overlapping within the batch (those items fail with 400 and are not sent).
+    The rest go through create_subscription_for_a_given_scsAsId with at most
+    BULK_PCF_CONCURRENCY PCF requests in flight; each item succeeds or fails
+    on its own.
+    """
+    size_error = _bulk_size_error(request, "subscriptions", len(bulk.subscriptions))
+    if size_error is not None:
+        return size_error
+
+    results = []
+    accepted = []
+    batch_flows = FlowConflictIndex()
+    for index, subscription in enumerate(bulk.subscriptions):
+        if subscription.ueIpv4Addr is not None and subscription.flowInfo:
+            ue = str(subscription.ueIpv4Addr)
+            rules = [rule for flow in subscription.flowInfo for rule in flow.parsed_flow_descriptions()]
+            clashing = batch_flows.conflicts(ue, rules)
+            if clashing:
+                problem = error_400(
+                    request,
+                    detail=f"Flow descriptions overlap item(s) {', '.join(clashing)} of this request for UE {ue}",
+                    invalid_params=[{"name": f"subscriptions[{index}].flowInfo", "reason": f"Overlaps item {other}"} for other in clashing]
+                )
+                results.append(_bulk_item_result(index, problem, 201))
+                continue
+            batch_flows.add(str(index), ue, rules)
+        accepted.append((index, subscription))
+
+    # The whole batch is charged to the SCS/AS's token bucket at once, its items are not charged again
+    limited = rate_limited(request, scsAsId, len(accepted))
+    if limited is not None:
+        return limited
+
+    semaphore = asyncio.Semaphore(BULK_PCF_CONCURRENCY)
+
+    async def create(index: int, subscription: AsSessionWithQosSubscription) -> BulkItemResult:
+        async with semaphore:
+            item_response = Response()
+            outcome = await create_subscription_for_a_given_scsAsId(request, scsAsId, subscription, item_response, store,
+                                                                    rate_limit_cost=0)
+            location = item_response.headers.get("Location")
+            return _bulk_item_result(index, outcome, 201, location.rsplit("/", 1)[-1] if location else None)
+
+    results.extend(await asyncio.gather(*(create(index, subscription) for index, subscription in accepted)))
+    result = _bulk_result(results)
+    logger.info("Bulk create for scsAsId=%s: %s created, %s failed", scsAsId, result.succeeded, result.failed)
+    return result
+
+
+async def bulk_delete_subscriptions(
+    request: Request,
+    scsAsId: str,
+    bulk: BulkDeleteRequest,
+    store: SubscriptionStore = Depends(in_memory_db)) -> BulkResult:
+    """
+    Delete many subscriptions of one SCS/AS through delete_subscriptionId,
+    with at most BULK_PCF_CONCURRENCY PCF requests in flight. Repeated ids fail with 400.
+    """
+    size_error = _bulk_size_error(request, "subscriptionIds", len(bulk.subscriptionIds))
+    if size_error is not None:
+        return size_error
+
+    results = []
+    accepted = []
+    seen = set()
+    for index, subscription_id in enumerate(bulk.subscriptionIds):
+        if subscription_id in seen:
+            problem = error_400(
+                request,
+                detail=f"Subscription '{subscription_id}' is listed more than once.",
+                invalid_params=[{"name": f"subscriptionIds[{index}]", "reason": "Duplicate subscriptionId"}]
+            )
+            results.append(_bulk_item_result(index, problem, 200, subscription_id))
+            continue
+        seen.add(subscription_id)
+        accepted.append((index, subscription_id))
+
+    limited = rate_limited(request, scsAsId, len(accepted))
+    if limited is not None:
+        return limited
+
+    semaphore = asyncio.Semaphore(BULK_PCF_CONCURRENCY)
+
+    async def delete(index: int, subscription_id: str) -> BulkItemResult:
+        async with semaphore:
             try:
-                await send_callback_to_as(notification_destination, scsAsId, subscriptionId, event=UserPlaneEvent.SESSION_TERMINATION)
+                outcome = await delete_subscriptionId(request, scsAsId, subscription_id, store, rate_limit_cost=0)
             except Exception as e:
-                logger.error(f"Callback failed: {e}")
+                logger.error("Failed to delete subscription %s for scsAsId=%r: %s", subscription_id, scsAsId, e)
+                outcome = error_500(request, f"Unexpected error: {str(e)}")
+            return _bulk_item_result(index, outcome, 200, subscription_id)
 
-            return payload
-        
-    return error_404(
-        request,
-        detail=f"Subscription '{subscriptionId}' for SCS/AS '{scsAsId}' not found."
-    )
+    results.extend(await asyncio.gather(*(delete(index, subscription_id) for index, subscription_id in accepted)))
+    result = _bulk_result(results)
+    logger.info("Bulk delete for scsAsId=%s: %s deleted, %s failed", scsAsId, result.succeeded, result.failed)
+    return result
 
+
+def format_change(change: ChangeEvent, ndjson: bool) -> bytes:
+    if ndjson:
+        return f"{change.payload}\n".encode("utf-8")
+    return f"id: {change.id}\nevent: {change.event}\ndata: {change.payload}\n\n".encode("utf-8")
+
+
+async def watch_stream(watcher: Watcher, ndjson: bool, heartbeat_interval: float = WATCH_HEARTBEAT_INTERVAL):
+    """Replayed events, then live ones until the watcher is cut off, the feed closes or the client goes away."""
+    try:
+        for change in watcher.backlog:
+            yield format_change(change, ndjson)
+        watcher.backlog = []
+        while True:
+            try:
+                change = await asyncio.wait_for(watcher.queue.get(), heartbeat_interval)
+            except asyncio.TimeoutError:
+                yield b"\n" if ndjson else b": keep-alive\n\n"
+                continue
+            if change is None:
+                break
+            yield format_change(change, ndjson)
+    finally:
+        change_feed.unwatch(watcher)
+
+
+async def watch_subscriptions(
+    request: Request,
+    scsAsId: str,
+    since: Optional[str] = None,
+    last_event_id: Optional[str] = None):
+    """
+    Stream the changes of an SCS/AS's subscriptions: created, updated, deleted and
+    pcf_result events, as server-sent events or, with Accept: application/x-ndjson,
+    one JSON object per line. `since` (or the SSE Last-Event-ID header) resumes
+    after that event id; 410 when the events after it are no longer buffered.
+    """
+    token = since if since is not None else last_event_id
+    try:
+        watcher = change_feed.watch(scsAsId, token)
+    except ValueError:
+        return error_400(request, detail=f"Invalid resume token '{token}'",
+                         invalid_params=[{"name": "since", "reason": "Not an event id"}])
+    except ResumeTokenExpired as e:
+        return error_410(request, f"Cannot resume the change feed of SCS/AS '{scsAsId}': {e}. List the subscriptions again and watch without a token.")
+
+    ndjson = wants_ndjson(request)
+    logger.info("Watching changes of scsAsId=%r (%s, from %s)", scsAsId, 'ndjson' if ndjson else 'sse', token)
+    return StreamingResponse(
+        watch_stream(watcher, ndjson),
+        media_type="application/x-ndjson" if ndjson else "text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
@@ -1,12 +1,13 @@
 import json
-from app.schemas.qos_models import (
-    AppSessionContext, AppSessionContextReqData, AsSessionWithQosSubscription,
-    MediaComponent, MediaSubComponent, FlowStatus, MediaType
-)
+import logging
+from app.schemas.qos_models import AsSessionWithQosSubscription
 from app.utils.log import get_app_logger
-from app.utils.app_config import QOS_MAPPING
-from app.services.db import map_subId_with_appsessionId, delete_subId_with_appsessionId, get_app_session_id
-from app.helpers.pcf_http2_requests import pcf_delete_request,pcf_post_request
+from app.services.qos_catalogue import get_qos_catalogue
+from app.services.db import (map_subId_with_appsessionId, delete_subId_with_appsessionId, get_app_session_id,
+                             get_pcf_catalogue, set_pcf_catalogue)
+from app.helpers.pcf_http2_requests import (PCFRejectedError, PCFServerError, pcf_delete_request, pcf_post_request,
+                                            pcf_patch_request)
+from app.helpers.pcf_payload import merge_patch
 from app.helpers.callback import send_callback_to_as
 from app.schemas.qos_models import UserPlaneEvent
 
@@ -15,53 +16,37 @@ logger = get_app_logger()
 
 
 
+def pcf_status_error(message: str, status_code: int):
+    """The PCFError for an error status: PCFServerError for 5xx, PCFRejectedError for 4xx."""
+    if status_code >= 500:
+        return PCFServerError(message, status_code)
+    return PCFRejectedError(message, status_code)
+
+
 async def create_app_session_context_to_PCF(initial_model: AsSessionWithQosSubscription, scsAsId: str, subscriptionId: str):
     """
     Create the requestbody for the pcf, mapping values from the NorthboundApi
-    like suppfeat, ipv4, and using QOS_MAPPING for QoS parameters.
+    like suppfeat, ipv4, and using the QoS catalogue for QoS parameters.
     """
 
-    med_components = {}
+    # One catalogue version for the whole create, even if a reload swaps in a new one meanwhile
+    catalogue = get_qos_catalogue()
     qos_ref = initial_model.qosReference
-    qos_profile = QOS_MAPPING.get(qos_ref)
-    if not qos_profile:
-        raise ValueError(f"Unknown qosReference: {qos_ref}")
-
-    if initial_model.flowInfo:
-        for flow in initial_model.flowInfo:
-            med_sub_comp = MediaSubComponent.from_flow_info(flow)
-            med_component = MediaComponent(
-                medCompN=1,  # Always set to 1 as because we request only one qos_profile
-                fStatus=FlowStatus.ENABLED,
-                medType=MediaType[qos_profile["mediaType"]],
-                marBwUl=qos_profile["marBwUl"],
-                marBwDl=qos_profile["marBwDl"],
-                medSubComps={str(flow.flowId): med_sub_comp}
-            )
-            med_components["1"] = med_component   # Always set to 1 as because we request only one qos_profile
-
-    req_data = AppSessionContextReqData.from_subscription(
-        from_subscription=initial_model,
-        medComponents=med_components,
-        notifUri=initial_model.notificationDestination
-    )
-
-
-    app_session_context = AppSessionContext(ascReqData=req_data)
-
-
-    # 
-    # Convert model to dict
-    payload = app_session_context.model_dump(mode="json")
-    # Pass dict to function (do NOT serialize here)
-    session_id, status_code = pcf_post_request(payload)
-
-    logger.debug(f"Payload to PCF: {json.dumps(payload, indent=2)}")
+    template = catalogue.template(qos_ref)
+    if template is None:
+        raise ValueError(f"Unknown qosReference: {qos_ref} (QoS catalogue v{catalogue.version})")
+
+    # Precompiled per-profile template: splice in the subscription values, serialized straight to bytes
+    payload = template.render(initial_model)
+    session_id, status_code = await pcf_post_request(payload)
+
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("Payload to PCF: %s", payload.decode())
     
     # Check if PCF returned an error (404 or other failure status)
     if status_code and status_code >= 400:
-        logger.error(f"PCF returned error status {status_code}")
-        raise Exception(f"PCF resource allocation failed with status {status_code}") 
+        logger.error("PCF returned error status %s", status_code)
+        raise pcf_status_error(f"PCF resource allocation failed with status {status_code}", status_code)
  
 
 
@@ -75,7 +60,8 @@ async def create_app_session_context_to_PCF(initial_model: AsSessionWithQosSubsc
     #end we map the appsessionid with the subscriptionId cause PCF gives a int as appSessionId
 
     if session_id:
-        map_subId_with_appsessionId(session_id)  # appSessionId mapping
+        map_subId_with_appsessionId(subscriptionId, session_id)  # appSessionId mapping
+    set_pcf_catalogue(subscriptionId, catalogue.digest)
     
     # logger.info(app_session_context.model_dump_json(indent=2))
     # return app_session_context
@@ -83,23 +69,87 @@ async def create_app_session_context_to_PCF(initial_model: AsSessionWithQosSubsc
 
 
 
-def delete_app_session_context_from_PCF(subscriptionId):
+def _med_components(catalogue, subscription: AsSessionWithQosSubscription) -> dict:
+    template = catalogue.template(subscription.qosReference)
+    if template is None:
+        raise ValueError(f"Unknown qosReference: {subscription.qosReference} (QoS catalogue v{catalogue.version})")
+    return json.loads(template.render(subscription))["ascReqData"]["medComponents"]
+
+
+async def update_app_session_context_in_PCF(old: AsSessionWithQosSubscription, new: AsSessionWithQosSubscription,
+                                            subscriptionId: str) -> bool:
+    """
+    Npcf_PolicyAuthorization Update for a changed subscription.
+
+    The medComponents the PCF holds (rendered from `old`) are diffed with
+    the ones for `new`, and only the difference is sent, as a JSON merge
+    patch: a bandwidth change is just marBwUl/marBwDl, so the PCF keeps the
+    QoS flow instead of tearing it down and building it again.
+    `old` is only rendered again when the PCF got its components from the
+    catalogue version in use now; after a reload (or when that is not known)
+    the full set is sent.
+    Returns False when nothing the PCF knows about changed (no request sent).
+    """
+    catalogue = get_qos_catalogue()
+    new_components = _med_components(catalogue, new)
+    old_components = {}
+    if get_pcf_catalogue(subscriptionId) == catalogue.digest:
+        try:
+            old_components = _med_components(catalogue, old)
+        except ValueError:
+            # Profile gone from the catalogue since: replace the media components wholesale
+            pass
+    patch = merge_patch(old_components, new_components)
+    if not patch:
+        logger.debug("No media component change for subscriptionId: %s, PCF not contacted", subscriptionId)
+        return False
+
+    session_id = get_app_session_id(subscriptionId)
+    if session_id is None:
+        logger.warning("No App Session for subscriptionId: %s, cannot update it on the PCF", subscriptionId)
+        return False
+
+    payload = json.dumps({"ascReqData": {"medComponents": patch}}, separators=(",", ":")).encode("utf-8")
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("Update payload to PCF: %s", payload.decode())
+    status_code = await pcf_patch_request(session_id, payload)
+    if status_code >= 400:
+        logger.error("PCF returned error status %s for the update of App Session %s", status_code, session_id)
+        raise pcf_status_error(f"PCF resource modification failed with status {status_code}", status_code)
+    set_pcf_catalogue(subscriptionId, catalogue.digest)
+    return True
+
+
+async def delete_app_session_context_from_PCF(subscriptionId):
     """
     Deletes the App Session Context from PCF using the app_session_id.
+
+    Raises PCFServerError when the PCF answers 5xx (and PCFError when it
+    cannot be reached); the mapping is then kept so the delete can be retried.
     """
     session_id = get_app_session_id(subscriptionId)  # Get the app session ID from the mapping
-    logger.debug(f"subscriptionId: {subscriptionId} and session_id: {session_id}")
+    logger.debug("subscriptionId: %s and session_id: %s", subscriptionId, session_id)
+
+    # The create never got an app-session (or it was already deleted): nothing to tear down at the PCF
+    if session_id is None:
+        logger.info("No app-session for subscriptionId %s, skipping the PCF delete", subscriptionId)
+        return
+
+    status = await pcf_delete_request(session_id)
+    if status >= 500:
+        raise PCFServerError(f"PCF answered {status} to the delete of app-session {session_id}", status)
+    if status >= 400:
+        # 404 and the like: the PCF holds no such app-session any more, so the delete is done as far as it goes
+        logger.warning("PCF answered %s to the delete of app-session %s; dropping it locally", status, session_id)
 
-    delete_subId_with_appsessionId(subscriptionId)# Remove mapping first
-    logger.debug(f"Deleted mapping for subscriptionId: {subscriptionId}")
-   # delete actual app session context from PCF
-    pcf_delete_request(session_id)
+    delete_subId_with_appsessionId(subscriptionId)
+    logger.debug("Deleted mapping for subscriptionId: %s", subscriptionId)
 
 
-    logger.debug(f"Deleted App Session Context for subscriptionId: {subscriptionId} and session_id: {session_id}")
+    logger.debug("Deleted App Session Context for subscriptionId: %s and session_id: %s", subscriptionId, session_id)
 
 
 
-#TODO maybe add a PATCH request also dont know if we need it
-# ps i tested it and it works but only for uplink downlink, if i change MediaType to video or voice it creates a new qos_flow but with the same session_id 
+# NOTE Open5GS applies PATCHed uplink/downlink bandwidth in place; a MediaType change makes it create a new
+# qos_flow under the same session_id
 #NOTE GET request is not supported by open5gs
\ No newline at end of file
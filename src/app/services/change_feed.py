@@ -0,0 +1,146 @@
+import asyncio
+import json
+from collections import deque
+from itertools import count
+from typing import Deque, Dict, List, NamedTuple, Optional, Set
+from uuid import uuid4
+from app.utils.log import get_app_logger
+from app.utils.app_config import WATCH_HISTORY_SIZE, WATCH_QUEUE_SIZE
+
+logger = get_app_logger()
+
+
+class ChangeEvent(NamedTuple):
+    """One change of an SCS/AS's subscriptions. `payload` is the event as JSON, serialized once for every watcher."""
+    seq: int  # per SCS/AS and feed instance
+    id: str  # the resume token: "<epoch>-<seq>"
+    event: str  # created | updated | deleted | pcf_result
+    payload: str
+
+
+class ResumeTokenExpired(Exception):
+    """The events after a resume token are no longer (or were never) in the ring buffer."""
+
+
+class Watcher:
+    """A consumer of one SCS/AS's events. `None` in the queue means it was cut off or the feed closed."""
+
+    def __init__(self, scsAsId: str, backlog: List[ChangeEvent], queue_size: int):
+        self.scsAsId = scsAsId
+        self.backlog = backlog
+        self.queue: asyncio.Queue = asyncio.Queue(queue_size)
+        self.cut_off = False
+
+
+class ChangeFeed:
+    """
+    In-process event bus for subscription changes, per scsAsId.
+
+    The last `history_size` events of each SCS/AS are kept in a ring buffer,
+    so a watcher that reconnects with the id of the last event it saw gets
+    what it missed. Every watcher has a bounded queue; one that falls
+    `queue_size` events behind is cut off instead of buffered further, and
+    can resume from its last event.
+
+    Sequence numbers only mean something within one feed: resume tokens
+    carry the feed's random `epoch`, so a token from before a restart, or
+    from another worker process, is refused instead of replaying the wrong
+    events.
+    """
+
+    def __init__(self, history_size: int, queue_size: int):
+        self.history_size = history_size
+        self.queue_size = queue_size
+        self.epoch = uuid4().hex[:12]
+        self._history: Dict[str, Deque[ChangeEvent]] = {}
+        self._counters: Dict[str, count] = {}
+        self._watchers: Dict[str, Set[Watcher]] = {}
+
+    def publish(self, scsAsId: str, event: str, subscriptionId: str, subscription_json: Optional[str] = None, **fields):
+        """Record an event and hand it to the SCS/AS's watchers. `subscription_json` is embedded as is."""
+        counter = self._counters.get(scsAsId)
+        if counter is None:
+            counter = self._counters[scsAsId] = count(1)
+        seq = next(counter)
+        token = self.token(seq)
+        payload = json.dumps({"id": token, "event": event, "subscriptionId": subscriptionId, **fields})
+        if subscription_json is not None:
+            payload = f'{payload[:-1]}, "subscription": {subscription_json}}}'
+        change = ChangeEvent(seq, token, event, payload)
+
+        history = self._history.get(scsAsId)
+        if history is None:
+            history = self._history[scsAsId] = deque(maxlen=self.history_size)
+        history.append(change)
+
+        for watcher in tuple(self._watchers.get(scsAsId, ())):
+            try:
+                watcher.queue.put_nowait(change)
+            except asyncio.QueueFull:
+                logger.warning("Cutting off a slow watcher of scsAsId=%s (%s events behind)", scsAsId, self.queue_size)
+                self._end(watcher, cut_off=True)
+
+    def token(self, seq: int) -> str:
+        return f"{self.epoch}-{seq}"
+
+    def _resume_seq(self, token: str) -> int:
+        """The sequence number of a resume token issued by this feed; ValueError if it is not a token."""
+        epoch, _, seq = token.rpartition("-")
+        if not seq.isdigit():
+            raise ValueError(f"Invalid resume token '{token}'")
+        if epoch != self.epoch:
+            raise ResumeTokenExpired(f"token {token} was issued by another feed instance (NEF restart or another worker)")
+        return int(seq)
+
+    def watch(self, scsAsId: str, since: Optional[str] = None) -> Watcher:
+        """
+        Start watching an SCS/AS. With `since` (the id of the last event seen), the
+        events after it are replayed first; raises ResumeTokenExpired if they are gone,
+        ValueError for a malformed token.
+        """
+        history = self._history.get(scsAsId, ())
+        backlog = []
+        if since is not None:
+            since = self._resume_seq(since)
+            last = history[-1].seq if history else 0
+            first = history[0].seq if history else 1
+            if since > last or since < first - 1:
+                raise ResumeTokenExpired(f"events after {since} are not available (buffer holds {first}..{last})")
+            backlog = [change for change in history if change.seq > since]
+        watcher = Watcher(scsAsId, backlog, self.queue_size)
+        self._watchers.setdefault(scsAsId, set()).add(watcher)
+        return watcher
+
+    def unwatch(self, watcher: Watcher):
+        watchers = self._watchers.get(watcher.scsAsId)
+        if watchers is not None:
+            watchers.discard(watcher)
+            if not watchers:
+                del self._watchers[watcher.scsAsId]
+
+    def _end(self, watcher: Watcher, cut_off: bool = False):
+        self.unwatch(watcher)
+        watcher.cut_off = cut_off
+        # Drop what it has not read: it resumes from its last event anyway
+        while not watcher.queue.empty():
+            watcher.queue.get_nowait()
+        watcher.queue.put_nowait(None)
+
+    def watcher_count(self) -> int:
+        return sum(len(watchers) for watchers in self._watchers.values())
+
+    def close(self):
+        """End every watch stream (shutdown)."""
+        for watchers in list(self._watchers.values()):
+            for watcher in list(watchers):
+                self._end(watcher)
+
+    def clear(self):
+        self.close()
+        self._history.clear()
+        self._counters.clear()
+        # The counters restart: tokens handed out so far must not match
+        self.epoch = uuid4().hex[:12]
+
+
+change_feed = ChangeFeed(history_size=WATCH_HISTORY_SIZE, queue_size=WATCH_QUEUE_SIZE)
@@ -1,140 +1,684 @@
 from app.schemas.qos_models import AsSessionWithQosSubscriptionWithSubscriptionId
-from typing import List, Dict
+import asyncio
+import json
+import os
+from bisect import bisect_left, bisect_right, insort
+from contextlib import AsyncExitStack, asynccontextmanager, contextmanager
+from hashlib import blake2b
+from typing import Iterator, List, Dict, Optional, Tuple
+from itertools import count
+from urllib.parse import urlsplit
 from app.utils.log import get_app_logger
+from app.utils.metrics import REGISTRY, Gauge
+from app.utils.app_config import (
+    NEF_STORE_BACKEND, NEF_STORE_DIR, WAL_COMMIT_INTERVAL, WAL_SNAPSHOT_EVERY, SQLITE_CHANGE_LOG_RETENTION,
+    SQLITE_POLL_INTERVAL, SQLITE_LOCK_LEASE,
+)
+from app.services.persistence import StoreBackend, SQLiteBackend, WriteAheadLogBackend
+from app.services.flow_conflicts import FlowConflictIndex
+from app.helpers.ip_filter_rule import IPFilterRule
 from app.schemas.qos_models import FlowInfo
 from pydantic import HttpUrl
 from ipaddress import IPv4Address
 
 logger = get_app_logger()
 
-# In-memory store for subscriptions
-SUBSCRIPTION_STORE: Dict[str, List[AsSessionWithQosSubscriptionWithSubscriptionId]] = {}
 
-# In-memory store for mapping subscriptionId to appSessionId
-SUBSCRIPTION_ID_TO_APP_SESSION_ID: Dict[str, str] = {}
+def notification_host(url) -> str:
+    """Lower-cased host of a notificationDestination, the key of the host index."""
+    return urlsplit(str(url)).hostname or ""
+
+
+class SubscriptionRecord:
+    """
+    A stored subscription together with the bookkeeping the store keeps for it.
+
+    Records restored from disk only hold the subscription JSON; the pydantic
+    model is built the first time it is needed, which keeps recovery fast.
+    """
+
+    __slots__ = ("scsAsId", "subscriptionId", "ue_ipv4", "qos_reference", "seq", "app_session_id",
+                 "terminating", "pcf_catalogue", "notification_host", "_subscription", "_raw", "_body", "_etag")
+
+    def __init__(self, scsAsId: str, subscriptionId: str, ue_ipv4: Optional[str], qos_reference: Optional[str],
+                 seq: int, subscription: Optional[AsSessionWithQosSubscriptionWithSubscriptionId] = None,
+                 raw: Optional[str] = None, notification_host: Optional[str] = None):
+        self.scsAsId = scsAsId
+        self.subscriptionId = subscriptionId
+        self.ue_ipv4 = ue_ipv4
+        self.qos_reference = qos_reference
+        self.seq = seq  # insertion order, kept across updates
+        self.app_session_id: Optional[str] = None
+        self.terminating = False  # deleted asynchronously, its PCF teardown not done yet
+        # digest of the QoS catalogue the PCF's media components were rendered from; None: not known here
+        self.pcf_catalogue: Optional[str] = None
+        self.notification_host = notification_host  # None until known (restored records)
+        self._subscription = subscription
+        self._raw = raw
+        self._body: Optional[bytes] = None
+        self._etag: Optional[str] = None
+
+    @classmethod
+    def from_subscription(cls, scsAsId: str, subscription: AsSessionWithQosSubscriptionWithSubscriptionId, seq: int):
+        return cls(
+            scsAsId,
+            subscription.subscriptionId,
+            str(subscription.ueIpv4Addr) if subscription.ueIpv4Addr is not None else None,
+            subscription.qosReference,
+            seq,
+            subscription=subscription,
+            notification_host=notification_host(subscription.notificationDestination),
+        )
+
+    @property
+    def subscription(self) -> AsSessionWithQosSubscriptionWithSubscriptionId:
+        if self._subscription is None:
+            self._subscription = AsSessionWithQosSubscriptionWithSubscriptionId.model_validate_json(self._raw)
+        return self._subscription
+
+    @property
+    def raw(self) -> str:
+        """The subscription serialized as JSON."""
+        if self._raw is None:
+            self._raw = self._subscription.model_dump_json()
+        return self._raw
+
+    @property
+    def body(self) -> bytes:
+        """The subscription as GET returns it (without subscriptionId), serialized once per version."""
+        if self._body is None:
+            self._body = self.subscription.model_dump_json(exclude={"subscriptionId"}).encode("utf-8")
+        return self._body
+
+    @property
+    def etag(self) -> str:
+        """Strong ETag of `body`. Derived from the content, so every worker and restart agrees on it."""
+        if self._etag is None:
+            self._etag = f'"{blake2b(self.body, digest_size=12).hexdigest()}"'
+        return self._etag
+
+    def snapshot_row(self) -> Tuple[str, str, Optional[str], Optional[str], Optional[str], str]:
+        """
+        (scsAsId, subscriptionId, ueIpv4Addr, qosReference, appSessionId, JSON). Safe off the
+        event loop: it never fills the cached JSON, which a concurrent update may just have dropped.
+        """
+        raw = self._raw
+        if raw is None:
+            subscription = self._subscription
+            raw = subscription.model_dump_json() if subscription is not None else self._raw
+        return self.scsAsId, self.subscriptionId, self.ue_ipv4, self.qos_reference, self.app_session_id, raw
+
+    def set_content(self, subscription: Optional[AsSessionWithQosSubscriptionWithSubscriptionId] = None,
+                    raw: Optional[str] = None):
+        """Swap in a new version of the subscription, dropping the cached serializations."""
+        self._subscription, self._raw = subscription, raw
+        self._body = self._etag = None
+
+
+class SubscriptionStore:
+    """
+    In-memory subscription store.
+
+    Primary lookup is O(1) on (scsAsId, subscriptionId). Secondary indexes on
+    ueIpv4Addr and qosReference (per scsAsId) and on the PCF appSessionId are
+    kept in step on every write. Per-SCS/AS listing keeps insertion order;
+    cursor pages are in subscriptionId order.
+    Every change is also handed to the persistence backend (see
+    app.services.persistence); the default backend keeps nothing on disk.
+    """
+
+    def __init__(self, backend: Optional[StoreBackend] = None):
+        self._backend = backend or StoreBackend()
+        self._subscriptions: Dict[str, Dict[str, SubscriptionRecord]] = {}
+        self._ue_index: Dict[Tuple[str, str], Dict[str, None]] = {}
+        self._qos_index: Dict[Tuple[str, str], Dict[str, None]] = {}
+        # notificationDestination host per scsAsId. Restored records only hold JSON, so their host is
+        # read on the first host query for their SCS/AS; until then they wait in _host_pending.
+        self._host_index: Dict[Tuple[str, str], Dict[str, None]] = {}
+        self._host_pending: Dict[str, Dict[str, None]] = {}
+        self._app_session_index: Dict[str, SubscriptionRecord] = {}
+        self._records: Dict[str, SubscriptionRecord] = {}  # subscriptionId -> record, subscriptionIds are UUIDs
+        self._seq = count()
+        # Flow filters per UE for conflict checks. Restored records are only parsed and indexed
+        # when their UE is first checked, which keeps recovery from validating every subscription.
+        self._flow_index = FlowConflictIndex()
+        self._flow_pending: Dict[str, Dict[str, None]] = {}
+        # Per SCS/AS subscriptionIds in sorted order for cursor pagination, built on the first page
+        # request and kept in step afterwards. Sorting by id gives every worker the same order.
+        self._sorted_ids: Dict[str, List[str]] = {}
+        self._poller: Optional[asyncio.Task] = None
+        self._refreshing = asyncio.Lock()
+
+    # --- persistence ---
+
+    @contextmanager
+    def _replaying(self):
+        """Apply changes that come from the backend without writing them back to it."""
+        backend, self._backend = self._backend, _NO_BACKEND
+        try:
+            yield backend
+        finally:
+            self._backend = backend
+
+    async def refresh(self):
+        """Pick up changes committed by other worker processes (shared backends only)."""
+        async with self._refreshing:
+            changes = await self._backend.fetch_changes()
+            if changes is not None:
+                with self._replaying() as backend:
+                    backend.apply_changes(self, changes)
+
+    @asynccontextmanager
+    async def lock(self, *names: str):
+        """
+        Hold the backend locks `names` (taken in the given order) and start from the state
+        every worker committed: checks made inside hold across workers, and what is written
+        inside is durable on exit.
+        """
+        async with AsyncExitStack() as stack:
+            for name in names:
+                await stack.enter_async_context(self._backend.lock(name))
+            await self.refresh()
+            yield
+
+    async def _refresh_loop(self, interval: float):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.refresh()
+            except Exception as e:
+                logger.error("Could not read the changes of the other workers: %s", e)
+
+    async def open(self):
+        """
+        Rebuild the store from the backend, then start accepting durable writes. A shared
+        backend is polled every `poll_interval` seconds from then on; reads never wait for it.
+        """
+        with self._replaying() as backend:
+            await asyncio.to_thread(backend.recover, self)
+        self._backend.start()
+        if self._backend.shared and self._backend.poll_interval > 0:
+            self._poller = asyncio.get_running_loop().create_task(self._refresh_loop(self._backend.poll_interval))
+
+    async def sync(self):
+        """Wait until every change made so far is durable (group commit, no fsync per call)."""
+        await self._backend.sync()
+
+    async def close(self):
+        if self._poller is not None:
+            self._poller.cancel()
+            await asyncio.gather(self._poller, return_exceptions=True)
+            self._poller = None
+        await self._backend.close()
+
+    def restore(self, scsAsId: str, subscriptionId: str, ue_ipv4: Optional[str], qos_reference: Optional[str],
+                raw: str, app_session_id: Optional[str] = None):
+        """Insert or overwrite a subscription from its persisted form, without validating it yet."""
+        record = self._records.get(subscriptionId)
+        if record is not None:
+            self._unindex(record)
+            self._unindex_flows(record)
+            record.ue_ipv4, record.qos_reference, record.notification_host = ue_ipv4, qos_reference, None
+            record.pcf_catalogue = None  # written elsewhere, maybe after a PCF update from another catalogue
+            record.set_content(raw=raw)
+        else:
+            record = SubscriptionRecord(scsAsId, subscriptionId, ue_ipv4, qos_reference, next(self._seq), raw=raw)
+            self._subscriptions.setdefault(scsAsId, {})[subscriptionId] = record
+            self._records[subscriptionId] = record
+            self._order_add(record)
+        self._index(record)
+        if ue_ipv4 is not None:
+            self._flow_pending.setdefault(ue_ipv4, {})[subscriptionId] = None
+        if app_session_id is not None:
+            self.set_app_session_id(subscriptionId, app_session_id)
+
+    def restore_snapshot(self, rows):
+        """
+        Bulk load (scsAsId, subscriptionId, ueIpv4Addr, qosReference, appSessionId, JSON) rows
+        into an empty store. Same result as restore() per row, with the per-call overhead inlined.
+        """
+        subscriptions, records = self._subscriptions, self._records
+        ue_index, qos_index, app_index = self._ue_index, self._qos_index, self._app_session_index
+        flow_pending, host_pending = self._flow_pending, self._host_pending
+        seq = self._seq
+        self._sorted_ids.clear()
+        for scsAsId, subscriptionId, ue_ipv4, qos_reference, app_session_id, raw in rows:
+            record = SubscriptionRecord(scsAsId, subscriptionId, ue_ipv4, qos_reference, next(seq), raw=raw)
+            per_scs = subscriptions.get(scsAsId)
+            if per_scs is None:
+                per_scs = subscriptions[scsAsId] = {}
+            per_scs[subscriptionId] = record
+            records[subscriptionId] = record
+            hosts = host_pending.get(scsAsId)
+            if hosts is None:
+                hosts = host_pending[scsAsId] = {}
+            hosts[subscriptionId] = None
+            for index, value in ((ue_index, ue_ipv4), (qos_index, qos_reference)):
+                if value is not None:
+                    entries = index.get((scsAsId, value))
+                    if entries is None:
+                        entries = index[(scsAsId, value)] = {}
+                    entries[subscriptionId] = None
+            if ue_ipv4 is not None:
+                pending = flow_pending.get(ue_ipv4)
+                if pending is None:
+                    pending = flow_pending[ue_ipv4] = {}
+                pending[subscriptionId] = None
+            if app_session_id is not None:
+                record.app_session_id = app_session_id
+                app_index[app_session_id] = record
+
+    def snapshot_records(self) -> List[SubscriptionRecord]:
+        """
+        Every record, in insertion order: a shallow copy, cheap enough to take on the
+        event loop. Turn them into rows with SubscriptionRecord.snapshot_row() in a thread.
+        """
+        # _records only ever appends, so its order already is insertion order
+        return list(self._records.values())
+
+    # --- secondary index maintenance ---
+
+    @staticmethod
+    def _index_add(index: Dict[Tuple[str, str], Dict[str, None]], scsAsId: str, value, subscriptionId: str):
+        if value is not None:
+            index.setdefault((scsAsId, str(value)), {})[subscriptionId] = None
+
+    @staticmethod
+    def _index_remove(index: Dict[Tuple[str, str], Dict[str, None]], scsAsId: str, value, subscriptionId: str):
+        if value is None:
+            return
+        key = (scsAsId, str(value))
+        entries = index.get(key)
+        if entries is not None:
+            entries.pop(subscriptionId, None)
+            if not entries:
+                del index[key]
+
+    def _index(self, record: SubscriptionRecord):
+        self._index_add(self._ue_index, record.scsAsId, record.ue_ipv4, record.subscriptionId)
+        self._index_add(self._qos_index, record.scsAsId, record.qos_reference, record.subscriptionId)
+        if record.notification_host is not None:
+            self._index_add(self._host_index, record.scsAsId, record.notification_host, record.subscriptionId)
+        else:
+            self._host_pending.setdefault(record.scsAsId, {})[record.subscriptionId] = None
+
+    def _unindex(self, record: SubscriptionRecord):
+        self._index_remove(self._ue_index, record.scsAsId, record.ue_ipv4, record.subscriptionId)
+        self._index_remove(self._qos_index, record.scsAsId, record.qos_reference, record.subscriptionId)
+        if record.notification_host is not None:
+            self._index_remove(self._host_index, record.scsAsId, record.notification_host, record.subscriptionId)
+        else:
+            self._host_pending.get(record.scsAsId, {}).pop(record.subscriptionId, None)
+
+    def _index_pending_hosts(self, scsAsId: str):
+        for subscriptionId in self._host_pending.pop(scsAsId, None) or ():
+            record = self._records.get(subscriptionId)
+            if record is None or record.notification_host is not None:
+                continue
+            if record._subscription is not None:
+                url = record._subscription.notificationDestination
+            else:
+                url = json.loads(record._raw).get("notificationDestination", "")
+            record.notification_host = notification_host(url)
+            self._index_add(self._host_index, scsAsId, record.notification_host, subscriptionId)
+
+    @staticmethod
+    def _flow_rules(subscription: AsSessionWithQosSubscriptionWithSubscriptionId) -> List[IPFilterRule]:
+        return [rule for flow in subscription.flowInfo or [] for rule in flow.parsed_flow_descriptions()]
+
+    def _index_flows(self, record: SubscriptionRecord):
+        if record.ue_ipv4 is not None:
+            self._flow_index.add(record.subscriptionId, record.ue_ipv4, self._flow_rules(record.subscription))
+
+    def _unindex_flows(self, record: SubscriptionRecord):
+        self._flow_index.remove(record.subscriptionId)
+        if record.ue_ipv4 is not None:
+            pending = self._flow_pending.get(record.ue_ipv4)
+            if pending is not None:
+                pending.pop(record.subscriptionId, None)
+
+    def _order_add(self, record: SubscriptionRecord):
+        ids = self._sorted_ids.get(record.scsAsId)
+        if ids is not None:
+            insort(ids, record.subscriptionId)
+
+    def _order_remove(self, record: SubscriptionRecord):
+        ids = self._sorted_ids.get(record.scsAsId)
+        if ids is not None:
+            position = bisect_left(ids, record.subscriptionId)
+            if position < len(ids) and ids[position] == record.subscriptionId:
+                del ids[position]
+
+    def _from_index(self, index: Dict[Tuple[str, str], Dict[str, None]], scsAsId: str, value) -> List[AsSessionWithQosSubscriptionWithSubscriptionId]:
+        subscription_ids = index.get((scsAsId, str(value)), {})
+        records = sorted((self._records[sid] for sid in subscription_ids), key=lambda r: r.seq)
+        return [r.subscription for r in records]
+
+    # --- subscriptions ---
+
+    def has_scs_as(self, scsAsId: str) -> bool:
+        return scsAsId in self._subscriptions
+
+    async def find_scs_as(self, scsAsId: str) -> bool:
+        """has_scs_as() that, on a miss, first picks up what other workers committed since the last poll."""
+        if scsAsId not in self._subscriptions and self._backend.shared:
+            await self.refresh()
+        return scsAsId in self._subscriptions
+
+    def add(self, scsAsId: str, subscription: AsSessionWithQosSubscriptionWithSubscriptionId) -> SubscriptionRecord:
+        record = SubscriptionRecord.from_subscription(scsAsId, subscription, next(self._seq))
+        known = scsAsId in self._subscriptions
+        self._subscriptions.setdefault(scsAsId, {})[subscription.subscriptionId] = record
+        self._records[subscription.subscriptionId] = record
+        try:
+            self._order_add(record)
+            self._index(record)
+            self._index_flows(record)
+            self._backend.put(record)
+        except BaseException:
+            # Nothing of a half-added subscription may stay behind, least of all its flows
+            self._subscriptions[scsAsId].pop(subscription.subscriptionId, None)
+            if not known:  # nor the SCS/AS this subscription made known
+                del self._subscriptions[scsAsId]
+            self._forget(record)
+            raise
+        return record
+
+    def get_record(self, scsAsId: str, subscriptionId: str) -> Optional[SubscriptionRecord]:
+        return self._subscriptions.get(scsAsId, {}).get(subscriptionId)
+
+    async def find_record(self, scsAsId: str, subscriptionId: str) -> Optional[SubscriptionRecord]:
+        """get_record() that, on a miss, first picks up what other workers committed since the last poll."""
+        record = self.get_record(scsAsId, subscriptionId)
+        if record is None and self._backend.shared:
+            await self.refresh()
+            record = self.get_record(scsAsId, subscriptionId)
+        return record
+
+    def get_by_id(self, subscriptionId: str) -> Optional[SubscriptionRecord]:
+        return self._records.get(subscriptionId)
+
+    def get(self, scsAsId: str, subscriptionId: str) -> Optional[AsSessionWithQosSubscriptionWithSubscriptionId]:
+        record = self.get_record(scsAsId, subscriptionId)
+        return record.subscription if record else None
+
+    def replace(self, scsAsId: str, subscription: AsSessionWithQosSubscriptionWithSubscriptionId) -> Optional[SubscriptionRecord]:
+        """Swap in a new version of an existing subscription, keeping its position and appSessionId."""
+        record = self.get_record(scsAsId, subscription.subscriptionId)
+        if record is None:
+            return None
+        self._unindex(record)
+        self._unindex_flows(record)
+        updated = SubscriptionRecord.from_subscription(scsAsId, subscription, record.seq)
+        record.ue_ipv4, record.qos_reference = updated.ue_ipv4, updated.qos_reference
+        record.notification_host = updated.notification_host
+        record.set_content(subscription=subscription)
+        self._index(record)
+        self._index_flows(record)
+        self._backend.put(record)
+        return record
+
+    def remove(self, scsAsId: str, subscriptionId: str) -> Optional[AsSessionWithQosSubscriptionWithSubscriptionId]:
+        """Remove a subscription; the SCS/AS stays known even when its last subscription goes."""
+        record = self._subscriptions.get(scsAsId, {}).pop(subscriptionId, None)
+        if record is None:
+            return None
+        self._forget(record)
+        self._backend.delete(scsAsId, subscriptionId)
+        return record.subscription
+
+    def _forget(self, record: SubscriptionRecord):
+        """Drop a record from the lookups and indexes (it is already out of its SCS/AS's dict)."""
+        self._records.pop(record.subscriptionId, None)
+        self._order_remove(record)
+        self._unindex(record)
+        self._unindex_flows(record)
+        if record.app_session_id is not None:
+            self._app_session_index.pop(record.app_session_id, None)
+
+    def list(self, scsAsId: str) -> List[AsSessionWithQosSubscriptionWithSubscriptionId]:
+        return [record.subscription for record in self._subscriptions.get(scsAsId, {}).values()]
+
+    def sizes(self) -> Dict[Tuple[str], int]:
+        """Number of subscriptions per SCS/AS, keyed by (scsAsId,) as metric label values."""
+        return {(scsAsId,): len(subscriptions) for scsAsId, subscriptions in self._subscriptions.items()}
+
+    def page(self, scsAsId: str, after: Optional[str], limit: int) -> Tuple[List[SubscriptionRecord], Optional[str]]:
+        """
+        Up to `limit` records of an SCS/AS in subscriptionId order, starting after the id `after`,
+        and the id to continue after (None on the last page).
+        """
+        subscriptions = self._subscriptions.get(scsAsId)
+        if not subscriptions:
+            return [], None
+        ids = self._sorted_ids.get(scsAsId)
+        if ids is None:
+            ids = self._sorted_ids[scsAsId] = sorted(subscriptions)
+        start = bisect_right(ids, after) if after is not None else 0
+        chunk = ids[start:start + limit]
+        next_after = chunk[-1] if start + limit < len(ids) else None
+        return [subscriptions[subscriptionId] for subscriptionId in chunk], next_after
+
+    def iter_raw(self, scsAsId: str, chunk_size: int, subscription_ids: Optional[List[str]] = None) -> Iterator[List[str]]:
+        """
+        The serialized subscriptions of an SCS/AS (all, in listing order, or the given ids),
+        `chunk_size` at a time. The ids are taken up front; subscriptions removed while
+        iterating are skipped.
+        """
+        if subscription_ids is None:
+            subscription_ids = list(self._subscriptions.get(scsAsId, ()))
+        for start in range(0, len(subscription_ids), chunk_size):
+            subscriptions = self._subscriptions.get(scsAsId, {})
+            chunk = [subscriptions[sid].raw for sid in subscription_ids[start:start + chunk_size] if sid in subscriptions]
+            if chunk:
+                yield chunk
+
+    def records(self):
+        """Iterate over every stored record, across all SCS/AS."""
+        for subscriptions in self._subscriptions.values():
+            yield from subscriptions.values()
+
+    def find_by_ue_ipv4(self, scsAsId: str, ueIpv4Addr) -> List[AsSessionWithQosSubscriptionWithSubscriptionId]:
+        return self._from_index(self._ue_index, scsAsId, ueIpv4Addr)
+
+    def find_by_qos_reference(self, scsAsId: str, qosReference: str) -> List[AsSessionWithQosSubscriptionWithSubscriptionId]:
+        return self._from_index(self._qos_index, scsAsId, qosReference)
+
+    def query(self, scsAsId: str, ue_ipv4: Optional[str] = None, qos_reference: Optional[str] = None,
+              notification_host: Optional[str] = None) -> List[SubscriptionRecord]:
+        """
+        Records of an SCS/AS matching every given filter, in insertion order.
+        Served from the secondary indexes: the smallest matching set is walked and
+        checked against the others, so the cost follows the result size.
+        """
+        if notification_host is not None:
+            self._index_pending_hosts(scsAsId)
+        candidates = [
+            index.get((scsAsId, value), {})
+            for index, value in ((self._ue_index, ue_ipv4), (self._qos_index, qos_reference),
+                                 (self._host_index, notification_host))
+            if value is not None
+        ]
+        if not candidates:
+            return list(self._subscriptions.get(scsAsId, {}).values())
+        candidates.sort(key=len)
+        smallest, others = candidates[0], candidates[1:]
+        records = [self._records[sid] for sid in smallest if all(sid in other for other in others)]
+        records.sort(key=lambda r: r.seq)
+        return records
+
+    def find_flow_conflicts(self, ueIpv4Addr, flowInfo: Optional[List[FlowInfo]], exclude: Optional[str] = None) -> List[str]:
+        """
+        subscriptionIds, across all SCS/AS, whose flow descriptions for the same UE overlap
+        the given flows. `exclude` skips the subscription being updated. The ids of other
+        SCS/ASs are for the NEF only: callers must not show them to the requesting AF.
+        """
+        if ueIpv4Addr is None or not flowInfo:
+            return []
+        ue_ipv4 = str(ueIpv4Addr)
+        pending = self._flow_pending.pop(ue_ipv4, None)
+        for subscriptionId in pending or ():
+            record = self._records.get(subscriptionId)
+            if record is not None:
+                self._index_flows(record)
+        rules = [rule for flow in flowInfo for rule in flow.parsed_flow_descriptions()]
+        return self._flow_index.conflicts(ue_ipv4, rules, exclude)
+
+    # --- subscriptionId <-> PCF appSessionId ---
+
+    def set_app_session_id(self, subscriptionId: str, appSessionId: str) -> bool:
+        record = self._records.get(subscriptionId)
+        if record is None:
+            return False
+        if record.app_session_id is not None:
+            self._app_session_index.pop(record.app_session_id, None)
+        record.app_session_id = appSessionId
+        self._app_session_index[appSessionId] = record
+        self._backend.map(subscriptionId, appSessionId)
+        return True
+
+    def get_app_session_id(self, subscriptionId: str) -> Optional[str]:
+        record = self._records.get(subscriptionId)
+        return record.app_session_id if record else None
+
+    def clear_app_session_id(self, subscriptionId: str) -> bool:
+        record = self._records.get(subscriptionId)
+        if record is None or record.app_session_id is None:
+            return False
+        self._app_session_index.pop(record.app_session_id, None)
+        record.app_session_id = None
+        self._backend.unmap(subscriptionId)
+        return True
+
+    def find_by_app_session_id(self, appSessionId: str) -> Optional[SubscriptionRecord]:
+        return self._app_session_index.get(appSessionId)
+
+    # --- asynchronous deletes ---
+
+    def mark_terminating(self, subscriptionId: str) -> bool:
+        """
+        Record that the subscription is being deleted in the background. The mark is
+        persisted, so the teardown is resumed after a restart and by every worker.
+        """
+        record = self._records.get(subscriptionId)
+        if record is None or record.terminating:
+            return False
+        record.terminating = True
+        self._backend.mark_terminating(subscriptionId)
+        return True
+
+    def terminating_records(self) -> List[SubscriptionRecord]:
+        return [record for record in self._records.values() if record.terminating]
+
+    def clear(self):
+        self._subscriptions.clear()
+        self._ue_index.clear()
+        self._qos_index.clear()
+        self._host_index.clear()
+        self._host_pending.clear()
+        self._app_session_index.clear()
+        self._records.clear()
+        self._flow_index.clear()
+        self._flow_pending.clear()
+        self._sorted_ids.clear()
+        self._backend.clear()
+
+    def __len__(self):
+        return len(self._records)
+
+
+_NO_BACKEND = StoreBackend()
+
+
+def create_store_backend() -> StoreBackend:
+    """Persistence backend selected by NEF_STORE_BACKEND (memory | wal | sqlite)."""
+    if NEF_STORE_BACKEND == "wal":
+        return WriteAheadLogBackend(NEF_STORE_DIR, commit_interval=WAL_COMMIT_INTERVAL, snapshot_every=WAL_SNAPSHOT_EVERY)
+    if NEF_STORE_BACKEND == "sqlite":
+        return SQLiteBackend(os.path.join(NEF_STORE_DIR, "subscriptions.db"), commit_interval=WAL_COMMIT_INTERVAL,
+                             change_log_retention=SQLITE_CHANGE_LOG_RETENTION, poll_interval=SQLITE_POLL_INTERVAL,
+                             lock_lease=SQLITE_LOCK_LEASE)
+    if NEF_STORE_BACKEND != "memory":
+        raise ValueError(f"Unknown NEF_STORE_BACKEND: {NEF_STORE_BACKEND}")
+    return StoreBackend()
+
+
+# Store for subscriptions and their subscriptionId -> appSessionId mapping
+SUBSCRIPTION_STORE = SubscriptionStore(create_store_backend())
+REGISTRY.register(Gauge("nef_subscriptions", "Stored subscriptions per SCS/AS", ("scsAsId",),
+                        collect=SUBSCRIPTION_STORE.sizes))
 
 def in_memory_db():
-    # logger.info(SUBSCRIPTION_STORE)
-    # logger.info(SUBSCRIPTION_ID_TO_APP_SESSION_ID)
     return SUBSCRIPTION_STORE
 
-def map_subId_with_appsessionId(appsessionID):
-    """ Maps subscriptionId to appSessionId in the in-memory store."""
-    for subscriptions in SUBSCRIPTION_STORE.values():
-        for sub in subscriptions:
-            if not SUBSCRIPTION_ID_TO_APP_SESSION_ID.get(sub.subscriptionId):
-                SUBSCRIPTION_ID_TO_APP_SESSION_ID[sub.subscriptionId] = appsessionID
-                logger.info(f"Mapped subscriptionId {sub.subscriptionId} with appSessionId {appsessionID}")
-    return SUBSCRIPTION_ID_TO_APP_SESSION_ID
+def map_subId_with_appsessionId(subscriptionId, appsessionID):
+    """ Maps the subscriptionId whose PCF create returned appsessionID, in O(1)."""
+    previous = SUBSCRIPTION_STORE.find_by_app_session_id(appsessionID)
+    if previous is not None and previous.subscriptionId != subscriptionId:
+        logger.warning("appSessionId %s was mapped to subscriptionId %s, remapping",
+                       appsessionID, previous.subscriptionId)
+        SUBSCRIPTION_STORE.clear_app_session_id(previous.subscriptionId)
+    if SUBSCRIPTION_STORE.set_app_session_id(subscriptionId, appsessionID):
+        logger.info("Mapped subscriptionId %s with appSessionId %s", subscriptionId, appsessionID)
+    else:
+        logger.warning("SubscriptionId %s not found, appSessionId %s not mapped.", subscriptionId, appsessionID)
 
 def get_app_session_id(subscriptionId):
     """
     Retrieves the app session ID associated with the given subscription ID.
     """
-    return SUBSCRIPTION_ID_TO_APP_SESSION_ID.get(subscriptionId, None)
+    return SUBSCRIPTION_STORE.get_app_session_id(subscriptionId)
+
+def set_pcf_catalogue(subscriptionId, digest: str):
+    """
+    Remember which QoS catalogue version the media components last sent to the PCF came from.
+    """
+    record = SUBSCRIPTION_STORE.get_by_id(subscriptionId)
+    if record is not None:
+        record.pcf_catalogue = digest
+
+def get_pcf_catalogue(subscriptionId) -> Optional[str]:
+    record = SUBSCRIPTION_STORE.get_by_id(subscriptionId)
+    return record.pcf_catalogue if record else None
+
+def get_subscription_by_app_session_id(appSessionId) -> Optional[Tuple[str, AsSessionWithQosSubscriptionWithSubscriptionId]]:
+    """
+    Reverse lookup used to route PCF-originated notifications: appSessionId -> (scsAsId, subscription).
+    """
+    record = SUBSCRIPTION_STORE.find_by_app_session_id(appSessionId)
+    return (record.scsAsId, record.subscription) if record else None
 
 def delete_subId_with_appsessionId(subscriptionId):
     """
     Deletes the mapping of subscriptionId to appSessionId.
     """
-    if subscriptionId in SUBSCRIPTION_ID_TO_APP_SESSION_ID:
-        del SUBSCRIPTION_ID_TO_APP_SESSION_ID[subscriptionId]
-    else:
-        logger.warning(f"SubscriptionId {subscriptionId} not found in mappings.")
+    if not SUBSCRIPTION_STORE.clear_app_session_id(subscriptionId):
+        logger.warning("SubscriptionId %s not found in mappings.", subscriptionId)
 
 
 
 
 if __name__ == "__main__":
 
-    SUBSCRIPTION_STORE = {
-        'example': [
-            AsSessionWithQosSubscriptionWithSubscriptionId(
-                notificationDestination=HttpUrl('https://example.com/callback'),
-                supportedFeatures='003C',
-                qosReference='qod_2',
-                ueIpv4Addr=IPv4Address('10.45.0.3'),
-                flowInfo=[
-                    FlowInfo(
-                        flowId=1,
-                        flowDescriptions=[
-                            'permit in ip from 10.45.0.4 to any',
-                            'permit out ip from any to 10.45.0.4'
-                        ]
-                    )
-                ],
-                subscriptionId='995082ed-b16a-4595-affb-913e63249430'
-            )
-        ],
-
-
-        
-        # 'example2': [
-        #     AsSessionWithQosSubscriptionWithSubscriptionId(
-        #         notificationDestination=HttpUrl('https://example.com/callback'),
-        #         supportedFeatures='003C',
-        #         qosReference='qod_2',
-        #         ueIpv4Addr=IPv4Address('10.45.0.3'),
-        #         flowInfo=[
-        #             FlowInfo(
-        #                 flowId=1,
-        #                 flowDescriptions=[
-        #                     'permit in ip from 10.45.0.4 to any',
-        #                     'permit out ip from any to 10.45.0.4'
-        #                 ]
-        #             )
-        #         ],
-        #         subscriptionId='90f149c5-f83c-41d4-ab82-39157b4e6b1f'
-        #     ),
-        #     AsSessionWithQosSubscriptionWithSubscriptionId(
-        #         notificationDestination=HttpUrl('https://example.com/callback'),
-        #         supportedFeatures='003C',
-        #         qosReference='qod_2',
-        #         ueIpv4Addr=IPv4Address('10.45.0.3'),
-        #         flowInfo=[
-        #             FlowInfo(
-        #                 flowId=1,
-        #                 flowDescriptions=[
-        #                     'permit in ip from 10.45.0.4 to any',
-        #                     'permit out ip from any to 10.45.0.4'
-        #                 ]
-        #             )
-        #         ],
-        #         subscriptionId='eca4eba1-4a05-4d25-89eb-af247c50ef7c'
-        #     ),
-        #     AsSessionWithQosSubscriptionWithSubscriptionId(
-        #         notificationDestination=HttpUrl('https://example.com/callback'),
-        #         supportedFeatures='003C',
-        #         qosReference='qod_2',
-        #         ueIpv4Addr=IPv4Address('10.45.0.3'),
-        #         flowInfo=[
-        #             FlowInfo(
-        #                 flowId=1,
-        #                 flowDescriptions=[
-        #                     'permit in ip from 10.45.0.4 to any',
-        #                     'permit out ip from any to 10.45.0.4'
-        #                 ]
-        #             )
-        #         ],
-        #         subscriptionId='e291db4b-d727-4390-9f85-64104170e3ca'
-        #     ),
-        #     AsSessionWithQosSubscriptionWithSubscriptionId(
-        #         notificationDestination=HttpUrl('https://example.com/callback'),
-        #         supportedFeatures='003C',
-        #         qosReference='qod_2',
-        #         ueIpv4Addr=IPv4Address('10.45.0.3'),
-        #         flowInfo=[
-        #             FlowInfo(
-        #                 flowId=1,
-        #                 flowDescriptions=[
-        #                     'permit in ip from 10.45.0.4 to any',
-        #                     'permit out ip from any to 10.45.0.4'
-        #                 ]
-        #             )
-        #         ],
-        #         subscriptionId='9dd86c39-7273-4c4e-b633-c6e387b195d5'
-        #     )
-        # ]
-    }
+    SUBSCRIPTION_STORE.add(
+        'example',
+        AsSessionWithQosSubscriptionWithSubscriptionId(
+            notificationDestination=HttpUrl('https://example.com/callback'),
+            supportedFeatures='003C',
+            qosReference='qod_2',
+            ueIpv4Addr=IPv4Address('10.45.0.3'),
+            flowInfo=[
+                FlowInfo(
+                    flowId=1,
+                    flowDescriptions=[
+                        'permit in ip from 10.45.0.4 to any',
+                        'permit out ip from any to 10.45.0.4'
+                    ]
+                )
+            ],
+            subscriptionId='995082ed-b16a-4595-affb-913e63249430'
+        )
+    )
     # Call the function and print the result
-    # print(map_subId_with_appsessionId(166))
\ No newline at end of file
+    # map_subId_with_appsessionId('995082ed-b16a-4595-affb-913e63249430', 166)
+    # print(get_app_session_id('995082ed-b16a-4595-affb-913e63249430'))
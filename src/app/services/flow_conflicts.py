@@ -0,0 +1,158 @@
+from bisect import bisect_left, bisect_right, insort
+from ipaddress import ip_address
+from itertools import count
+from typing import Dict, Iterable, List, Optional, Tuple
+from app.helpers.ip_filter_rule import IPFilterRule
+
+# "any" address: covers every IPv4 and IPv6 integer address
+ANY_ADDRESS = (0, 2 ** 128 - 1)
+
+
+class IntervalIndex:
+    """
+    Dynamic set of integer intervals [first, last] answering "which intervals
+    overlap [a, b]" in O(log n + k).
+
+    Intervals are kept in sorted lists bucketed by length class
+    (bit_length of last - first). Every interval of class k is shorter than
+    2**k, so one that overlaps [a, b] must start in [a - 2**k + 1, b]: one
+    bisect per non-empty class finds the candidates. Inserts and deletes
+    are a bisect plus a list insert/delete.
+    """
+
+    def __init__(self):
+        self._buckets: Dict[int, List[Tuple[int, int, int]]] = {}
+        self._values: Dict[int, object] = {}
+        self._ids = count()
+
+    def add(self, first: int, last: int, value) -> int:
+        """Insert an interval and return its handle for remove()."""
+        handle = next(self._ids)
+        insort(self._buckets.setdefault((last - first).bit_length(), []), (first, last, handle))
+        self._values[handle] = value
+        return handle
+
+    def remove(self, first: int, last: int, handle: int):
+        bucket_class = (last - first).bit_length()
+        bucket = self._buckets[bucket_class]
+        del bucket[bisect_left(bucket, (first, last, handle))]
+        if not bucket:
+            del self._buckets[bucket_class]
+        del self._values[handle]
+
+    def overlapping(self, first: int, last: int) -> Iterable:
+        for bucket_class, bucket in self._buckets.items():
+            start = bisect_left(bucket, (first - (1 << bucket_class) + 1,))
+            end = bisect_right(bucket, (last, float("inf")))
+            for lo, hi, handle in bucket[start:end]:
+                if hi >= first:
+                    yield self._values[handle]
+
+    def __len__(self):
+        return len(self._values)
+
+
+def _addresses_overlap(a, b) -> bool:
+    if a is None or b is None:  # any
+        return True
+    return a.version == b.version and a.first <= b.last and b.first <= a.last
+
+
+def _ports_overlap(a, b) -> bool:
+    if a is None or b is None:  # any
+        return True
+    return a[0] <= b[1] and b[0] <= a[1]
+
+
+def rules_overlap(a: IPFilterRule, b: IPFilterRule) -> bool:
+    """True when some packet would match both filters."""
+    return (
+        a.direction == b.direction
+        and (a.protocol is None or b.protocol is None or a.protocol == b.protocol)
+        and _addresses_overlap(a.src, b.src)
+        and _addresses_overlap(a.dst, b.dst)
+        and _ports_overlap(a.src_ports, b.src_ports)
+        and _ports_overlap(a.dst_ports, b.dst_ports)
+    )
+
+
+def _range(address) -> Tuple[int, int]:
+    return (address.first, address.last) if address is not None else ANY_ADDRESS
+
+
+def _remote_endpoint(rule: IPFilterRule, ue: int) -> str:
+    """The endpoint of the rule that is not the UE: the dimension that tells a UE's flows apart."""
+    src = rule.src
+    return "dst" if src is not None and src.first <= ue <= src.last else "src"
+
+
+class FlowConflictIndex:
+    """
+    Flow filters of every subscription, per UE, for overlap checks.
+
+    Per UE and direction, every filter is in two IntervalIndexes, one on
+    its source and one on its destination range. Filters that overlap
+    overlap on both, so a lookup only needs the index of one endpoint: the
+    remote one of the new filter (the one not holding the UE), which
+    yields the few filters that could overlap it. Those are then compared
+    on protocol, addresses and ports.
+    """
+
+    def __init__(self):
+        self._by_ue: Dict[str, Dict[Tuple[str, str], IntervalIndex]] = {}
+        # subscriptionId -> (ue, [((direction, endpoint), first, last, handle)])
+        self._entries: Dict[str, Tuple[str, List[Tuple[Tuple[str, str], int, int, int]]]] = {}
+
+    def add(self, subscription_id: str, ue_ipv4: str, rules: List[IPFilterRule]):
+        self.remove(subscription_id)
+        if not rules:
+            return
+        per_direction = self._by_ue.setdefault(ue_ipv4, {})
+        entries = []
+        # Registered before the inserts, so remove() can roll back the ones made if a later rule fails
+        self._entries[subscription_id] = (ue_ipv4, entries)
+        try:
+            for rule in rules:
+                for endpoint, address in (("src", rule.src), ("dst", rule.dst)):
+                    key = (rule.direction, endpoint)
+                    first, last = _range(address)
+                    index = per_direction.setdefault(key, IntervalIndex())
+                    entries.append((key, first, last, index.add(first, last, (subscription_id, rule))))
+        except BaseException:
+            self.remove(subscription_id)
+            raise
+
+    def remove(self, subscription_id: str):
+        entry = self._entries.pop(subscription_id, None)
+        if entry is None:
+            return
+        ue_ipv4, entries = entry
+        per_direction = self._by_ue[ue_ipv4]
+        for key, first, last, handle in entries:
+            index = per_direction[key]
+            index.remove(first, last, handle)
+            if not index:
+                del per_direction[key]
+        if not per_direction:
+            del self._by_ue[ue_ipv4]
+
+    def conflicts(self, ue_ipv4: str, rules: List[IPFilterRule], exclude: Optional[str] = None) -> List[str]:
+        """subscriptionIds (in discovery order) with a filter overlapping one of `rules` on the same UE."""
+        per_direction = self._by_ue.get(ue_ipv4)
+        if not per_direction or not rules:
+            return []
+        ue = int(ip_address(ue_ipv4))
+        clashing: Dict[str, None] = {}
+        for rule in rules:
+            endpoint = _remote_endpoint(rule, ue)
+            index = per_direction.get((rule.direction, endpoint))
+            if index is None:
+                continue
+            for subscription_id, other in index.overlapping(*_range(getattr(rule, endpoint))):
+                if subscription_id != exclude and subscription_id not in clashing and rules_overlap(rule, other):
+                    clashing[subscription_id] = None
+        return list(clashing)
+
+    def clear(self):
+        self._by_ue.clear()
+        self._entries.clear()
@@ -0,0 +1,751 @@
+import asyncio
+import gc
+import glob
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import asynccontextmanager
+from typing import Dict, IO, List, Optional, Set, Tuple
+from app.utils.log import get_app_logger
+
+logger = get_app_logger()
+
+# Log/snapshot lines are tab separated; text columns are escaped so they never contain a tab or newline
+NULL = "\\N"
+SNAPSHOT_HEADER = "#nef-snapshot v1 segment="
+
+
+def escape(value: Optional[str]) -> str:
+    if value is None:
+        return NULL
+    if "\\" in value or "\t" in value or "\n" in value:
+        return value.replace("\\", "\\\\").replace("\t", "\\t").replace("\n", "\\n")
+    return value
+
+
+def unescape(value: str) -> Optional[str]:
+    if value == NULL:
+        return None
+    if "\\" not in value:
+        return value
+    out, chars = [], iter(value)
+    for ch in chars:
+        if ch == "\\":
+            nxt = next(chars, "")
+            out.append({"t": "\t", "n": "\n"}.get(nxt, nxt))
+        else:
+            out.append(ch)
+    return "".join(out)
+
+
+class StoreBackend:
+    """No persistence: the subscription store lives in process memory only."""
+
+    shared = False  # True when other processes write to the same state
+    poll_interval = 0.0  # seconds between polls for the changes of other processes
+
+    def recover(self, store):
+        pass
+
+    def start(self):
+        pass
+
+    def put(self, record):
+        pass
+
+    def delete(self, scsAsId: str, subscriptionId: str):
+        pass
+
+    def map(self, subscriptionId: str, appSessionId: str):
+        pass
+
+    def unmap(self, subscriptionId: str):
+        pass
+
+    def mark_terminating(self, subscriptionId: str):
+        pass
+
+    def clear(self):
+        pass
+
+    async def fetch_changes(self):
+        """What other processes changed since the last poll, for apply_changes(); None when nothing did."""
+        return None
+
+    def apply_changes(self, store, changes):
+        """Bring the store up to date with what fetch_changes() returned (on the event loop)."""
+
+    @asynccontextmanager
+    async def lock(self, name: str):
+        """
+        Lock `name` across the processes sharing the state; what is written while holding
+        it is durable when it is released. A process-local backend has nothing to lock.
+        """
+        yield
+
+    async def sync(self):
+        """Wait until every change made so far is durable."""
+
+    async def close(self):
+        pass
+
+
+class GroupCommitBackend(StoreBackend):
+    """
+    Buffers store changes and has a single committer task write them out in
+    batches, off the event loop. Concurrent requests waiting in sync() share
+    one durable write (group commit). Subclasses implement _write(batch).
+
+    A batch that fails to commit is not dropped: the requests waiting for it
+    get the error, and the batch goes back in front of the buffer to be
+    retried after a backoff, together with what was buffered meanwhile.
+    """
+
+    retry_base_delay = 0.05
+    retry_max_delay = 5.0
+
+    def __init__(self, commit_interval: float):
+        self.commit_interval = commit_interval
+        self.failed_commits = 0
+        self._store = None
+        self._buffer: List = []
+        self._waiters: List[asyncio.Future] = []
+        self._writing = False
+        self._committer: Optional[asyncio.Task] = None
+        self._dirty: Optional[asyncio.Event] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def start(self):
+        """Start the group-commit task on the running event loop."""
+        loop = asyncio.get_running_loop()
+        if loop is self._loop:
+            return False
+        self._loop = loop
+        self._dirty = asyncio.Event()
+        self._committer = loop.create_task(self._commit_loop())
+        return True
+
+    def _committed(self, batch: List):
+        """Called on the event loop once `batch` is durable."""
+
+    def _append(self, item):
+        self._buffer.append(item)
+        if self._dirty is not None:
+            self._dirty.set()
+
+    async def sync(self):
+        if self._loop is None:
+            self.start()
+        if not self._buffer and not self._writing:
+            return
+        waiter = self._loop.create_future()
+        self._waiters.append(waiter)
+        self._dirty.set()
+        await waiter
+
+    async def _commit_loop(self):
+        retry_delay = self.retry_base_delay
+        while True:
+            await self._dirty.wait()
+            if self.commit_interval > 0:
+                # Let concurrent requests add their changes to this batch
+                await asyncio.sleep(self.commit_interval)
+            self._dirty.clear()
+            batch, self._buffer = self._buffer, []
+            waiters, self._waiters = self._waiters, []
+            self._writing = True
+            try:
+                if batch:
+                    await asyncio.to_thread(self._write, batch)
+            except Exception as e:
+                self.failed_commits += 1
+                self._buffer = self._retry_batch(batch + self._buffer)
+                logger.error("%s commit of %s changes failed, retrying in %.2fs: %s",
+                             type(self).__name__, len(batch), retry_delay, e)
+                for waiter in waiters:
+                    if not waiter.done():
+                        waiter.set_exception(e)
+                self._writing = False
+                self._dirty.set()
+                await asyncio.sleep(retry_delay)
+                retry_delay = min(retry_delay * 2, self.retry_max_delay)
+                continue
+            finally:
+                self._writing = False
+            retry_delay = self.retry_base_delay
+            self._committed(batch)
+            for waiter in waiters:
+                if not waiter.done():
+                    waiter.set_result(None)
+
+    def _retry_batch(self, buffer: List) -> List:
+        """The buffer to write on the next attempt, after a failed commit of its head."""
+        return buffer
+
+    def _write(self, batch: List):
+        raise NotImplementedError
+
+    async def close(self):
+        """Flush what is buffered and stop the committer."""
+        if self._loop is not None:
+            try:
+                await self.sync()
+            finally:
+                self._committer.cancel()
+                await asyncio.gather(self._committer, return_exceptions=True)
+        elif self._buffer:
+            self._write(self._buffer)
+            self._buffer = []
+        self._loop = None
+
+
+class WriteAheadLogBackend(GroupCommitBackend):
+    """
+    Append-only write-ahead log with periodic compact snapshots.
+
+    Every store change becomes one line of the current WAL segment
+    (wal-<n>.log). Lines are buffered and written by a single committer task
+    that fsyncs once per batch (group commit), so concurrent requests waiting
+    in sync() share one fsync. Every `snapshot_every` changes the full state
+    is written to snapshot.log, tagged with the first segment it does not
+    cover, and the older segments are deleted. Recovery loads the snapshot
+    and replays the remaining segments.
+
+    Line formats:
+        P scsAsId subscriptionId ueIpv4Addr qosReference <subscription JSON>
+        D scsAsId subscriptionId
+        M subscriptionId appSessionId
+        U subscriptionId
+        T subscriptionId  (being deleted asynchronously; also follows the S lines in a snapshot)
+        C
+        S scsAsId subscriptionId ueIpv4Addr qosReference appSessionId <subscription JSON>  (snapshot only)
+    """
+
+    def __init__(self, directory: str, commit_interval: float, snapshot_every: int):
+        super().__init__(commit_interval)
+        self.directory = directory
+        self.snapshot_every = max(1, snapshot_every)
+        self._segment = 1
+        self._files: Dict[int, IO[str]] = {}
+        self._ops_since_snapshot = 0
+        self._snapshot_task: Optional[asyncio.Task] = None
+
+    @property
+    def snapshot_path(self) -> str:
+        return os.path.join(self.directory, "snapshot.log")
+
+    def _segment_path(self, segment: int) -> str:
+        return os.path.join(self.directory, f"wal-{segment:08d}.log")
+
+    def _segments(self) -> List[int]:
+        paths = glob.glob(os.path.join(self.directory, "wal-*.log"))
+        return sorted(int(os.path.basename(p)[4:-4]) for p in paths)
+
+    # --- recovery ---
+
+    def recover(self, store):
+        """Rebuild the store (and all its indexes) from the snapshot and the WAL segments."""
+        self._store = store
+        os.makedirs(self.directory, exist_ok=True)
+        # Recovery only allocates long-lived objects; cyclic GC passes over them are pure overhead
+        gc_was_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            self._recover(store)
+        finally:
+            if gc_was_enabled:
+                gc.enable()
+
+    def _recover(self, store):
+        first_segment = 0
+        restored = replayed = 0
+
+        if os.path.exists(self.snapshot_path):
+            with open(self.snapshot_path, encoding="utf-8") as snapshot:
+                header = snapshot.readline()
+                if header.startswith(SNAPSHOT_HEADER):
+                    first_segment = int(header[len(SNAPSHOT_HEADER):])
+                    terminating = []
+                    store.restore_snapshot(self._snapshot_rows(snapshot, terminating))
+                    for sub_id in terminating:
+                        store.mark_terminating(sub_id)
+                    restored = len(store)
+
+        segments = self._segments()
+        for segment in segments:
+            if segment < first_segment:
+                os.remove(self._segment_path(segment))
+                continue
+            with open(self._segment_path(segment), encoding="utf-8") as wal:
+                for line in wal:
+                    if not line.endswith("\n"):
+                        logger.warning("Ignoring torn last record of WAL segment %s", segment)
+                        break
+                    self._replay(store, line[:-1])
+                    replayed += 1
+
+        self._segment = max(segments + [first_segment, 0]) + 1
+        self._ops_since_snapshot = replayed
+        logger.info("Recovered %s subscriptions from snapshot and %s WAL records from %s", restored, replayed, self.directory)
+
+    @staticmethod
+    def _snapshot_rows(snapshot, terminating: List[str]):
+        """The S rows of a snapshot; the ids of its T lines go to `terminating`."""
+        for line in snapshot:
+            if not line.endswith("\n"):
+                break
+            if line[0] == "T":
+                terminating.append(line[2:-1])
+                continue
+            _, scs, sub_id, ue, qos, app, raw = line[:-1].split("\t", 6)
+            yield unescape(scs), sub_id, unescape(ue), unescape(qos), unescape(app), raw
+
+    @staticmethod
+    def _replay(store, line: str):
+        op = line[0]
+        if op == "P":
+            _, scs, sub_id, ue, qos, raw = line.split("\t", 5)
+            store.restore(unescape(scs), sub_id, unescape(ue), unescape(qos), raw)
+        elif op == "D":
+            _, scs, sub_id = line.split("\t")
+            store.remove(unescape(scs), sub_id)
+        elif op == "M":
+            _, sub_id, app = line.split("\t")
+            store.set_app_session_id(sub_id, unescape(app))
+        elif op == "U":
+            _, sub_id = line.split("\t")
+            store.clear_app_session_id(sub_id)
+        elif op == "T":
+            _, sub_id = line.split("\t")
+            store.mark_terminating(sub_id)
+        elif op == "C":
+            store.clear()
+
+    # --- writing ---
+
+    def start(self):
+        if super().start() and self._ops_since_snapshot:
+            self._begin_snapshot()
+
+    def _append(self, *fields: str):
+        super()._append((self._segment, "\t".join(fields) + "\n"))
+        self._ops_since_snapshot += 1
+        if self._ops_since_snapshot >= self.snapshot_every and self._loop is not None:
+            self._begin_snapshot()
+
+    def put(self, record):
+        self._append("P", escape(record.scsAsId), record.subscriptionId,
+                     escape(record.ue_ipv4), escape(record.qos_reference), record.raw)
+
+    def delete(self, scsAsId: str, subscriptionId: str):
+        self._append("D", escape(scsAsId), subscriptionId)
+
+    def map(self, subscriptionId: str, appSessionId: str):
+        self._append("M", subscriptionId, escape(appSessionId))
+
+    def unmap(self, subscriptionId: str):
+        self._append("U", subscriptionId)
+
+    def mark_terminating(self, subscriptionId: str):
+        self._append("T", subscriptionId)
+
+    def clear(self):
+        self._append("C")
+
+    def _retry_batch(self, buffer: List[Tuple[int, str]]) -> List[Tuple[int, str]]:
+        # The failed write may have left part of a line behind: retry in a fresh segment, so that
+        # torn line stays the last of its segment, where recovery expects it and stops
+        self._segment += 1
+        for wal in self._files.values():
+            wal.close()
+        self._files = {}
+        return [(self._segment, line) for _, line in buffer]
+
+    def _write(self, batch: List[Tuple[int, str]]):
+        """Write a batch (possibly spanning a segment rotation) and fsync each touched segment once."""
+        touched = []
+        start = 0
+        while start < len(batch):
+            segment = batch[start][0]
+            end = start
+            while end < len(batch) and batch[end][0] == segment:
+                end += 1
+            wal = self._files.get(segment)
+            if wal is None:
+                wal = self._files[segment] = open(self._segment_path(segment), "a", encoding="utf-8")
+            wal.write("".join(line for _, line in batch[start:end]))
+            touched.append(wal)
+            start = end
+        for wal in touched:
+            wal.flush()
+            os.fsync(wal.fileno())
+        current = batch[-1][0]
+        for segment in [s for s in self._files if s < current]:
+            self._files.pop(segment).close()
+
+    # --- snapshots ---
+
+    def _begin_snapshot(self):
+        """
+        Start a snapshot at the current log position and write it out in the background.
+
+        Only the list of records is taken on the event loop; they are read and
+        serialized in the writer thread, by which time some may have changed.
+        Every such change is logged in a segment from `first_segment` on, which
+        recovery replays over the snapshot, so the result is the same.
+        """
+        if self._snapshot_task is not None and not self._snapshot_task.done():
+            return
+        records = self._store.snapshot_records()
+        self._segment += 1
+        self._ops_since_snapshot = 0
+        self._snapshot_task = self._loop.create_task(self._write_snapshot(records, self._segment))
+
+    async def _write_snapshot(self, records, first_segment: int):
+        try:
+            await asyncio.to_thread(self._write_snapshot_file, records, first_segment)
+            logger.info("Wrote snapshot of %s subscriptions, WAL now starts at segment %s", len(records), first_segment)
+        except Exception as e:
+            logger.error("Snapshot of %s failed: %s", self.directory, e)
+
+    def _write_snapshot_file(self, records, first_segment: int):
+        tmp_path = self.snapshot_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as snapshot:
+            snapshot.write(f"{SNAPSHOT_HEADER}{first_segment}\n")
+            snapshot.writelines(
+                f"S\t{escape(scs)}\t{sub_id}\t{escape(ue)}\t{escape(qos)}\t{escape(app)}\t{raw}\n"
+                for scs, sub_id, ue, qos, app, raw in (record.snapshot_row() for record in records)
+            )
+            snapshot.writelines(f"T\t{record.subscriptionId}\n" for record in records if record.terminating)
+            snapshot.flush()
+            os.fsync(snapshot.fileno())
+        os.replace(tmp_path, self.snapshot_path)
+        dir_fd = os.open(self.directory, os.O_RDONLY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
+        for segment in self._segments():
+            if segment < first_segment:
+                os.remove(self._segment_path(segment))
+
+    async def close(self):
+        """Flush what is buffered, finish a running snapshot and close the segment files."""
+        if self._snapshot_task is not None:
+            await self._snapshot_task
+        await super().close()
+        for wal in self._files.values():
+            wal.close()
+        self._files = {}
+
+
+class SQLiteBackend(GroupCommitBackend):
+    """
+    Subscription state shared by every worker process through one SQLite
+    database in WAL mode, so `uvicorn --workers N` sees a single store.
+
+    Each worker keeps its in-memory store and indexes, and reads only
+    those. Writes are group-committed to the `subscriptions` table together
+    with one row per change in `changes`. Every `poll_interval` seconds the
+    store polls: fetch_changes() checks PRAGMA data_version (a cheap read
+    that only moves when another connection committed) and reads the
+    changes committed by other workers in a thread, then apply_changes()
+    applies them on the event loop. What one worker acknowledged is thus
+    visible on the others within `poll_interval`. A row read while this
+    worker had an uncommitted write of the same subscription may be older
+    than the store, so it is skipped and read again on the next poll.
+    Change rows older than `change_log_retention` seconds are pruned; a
+    worker that fell further behind reloads the table.
+
+    lock() takes a row of the `locks` table, so checks that must see every
+    worker's writes (ETags, flow conflicts) run under it after a poll. A
+    lock left behind by a dead worker expires after `lock_lease` seconds.
+    """
+
+    shared = True
+
+    SCHEMA = (
+        "CREATE TABLE IF NOT EXISTS subscriptions ("
+        " subscription_id TEXT PRIMARY KEY, scs_as_id TEXT NOT NULL, ue_ipv4 TEXT,"
+        " qos_reference TEXT, app_session_id TEXT, raw TEXT NOT NULL, terminating INTEGER NOT NULL DEFAULT 0)",
+        "CREATE TABLE IF NOT EXISTS changes ("
+        " id INTEGER PRIMARY KEY AUTOINCREMENT, origin TEXT NOT NULL, subscription_id TEXT, created REAL NOT NULL)",
+        "CREATE INDEX IF NOT EXISTS changes_created ON changes (created)",
+        "CREATE TABLE IF NOT EXISTS locks (name TEXT PRIMARY KEY, owner TEXT NOT NULL, expires REAL NOT NULL)",
+    )
+
+    def __init__(self, path: str, commit_interval: float, change_log_retention: float, poll_interval: float = 0.05,
+                 lock_lease: float = 30.0):
+        super().__init__(commit_interval)
+        self.path = path
+        self.change_log_retention = change_log_retention
+        self.poll_interval = poll_interval
+        self.lock_lease = lock_lease
+        self.origin = uuid.uuid4().hex  # tags the changes this worker committed
+        self._reader: Optional[sqlite3.Connection] = None
+        self._writer: Optional[sqlite3.Connection] = None
+        self._locker: Optional[sqlite3.Connection] = None
+        self._locker_guard = threading.Lock()  # one lock statement at a time on _locker
+        self._data_version = None
+        self._last_change = 0
+        self._last_prune = 0.0
+        # subscriptionId (None: clear) -> changes of this worker not committed yet
+        self._unsynced: Dict[Optional[str], int] = {}
+        self._touched: Set[Optional[str]] = set()  # written since the current poll began
+        self._in_doubt: Set[Optional[str]] = set()  # not committed when the current poll began
+        self._recheck: Set[str] = set()  # skipped by the last poll, read again on the next
+        self._reading: Optional[asyncio.Future] = None  # the thread reading the changes, if any
+
+    def _connect(self) -> sqlite3.Connection:
+        # Autocommit mode: transactions are opened explicitly with BEGIN IMMEDIATE
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=FULL")
+        return conn
+
+    # --- recovery ---
+
+    def recover(self, store):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._writer = self._connect()
+        for statement in self.SCHEMA:
+            self._writer.execute(statement)
+        columns = {row[1] for row in self._writer.execute("PRAGMA table_info(subscriptions)")}
+        if "terminating" not in columns:  # database of an older version
+            self._writer.execute("ALTER TABLE subscriptions ADD COLUMN terminating INTEGER NOT NULL DEFAULT 0")
+        self._reader = self._connect()
+        self._locker = self._connect()
+        self._restore_all(store, *self._read_all())
+        logger.info("Loaded %s subscriptions from %s", len(store), self.path)
+
+    def _read_all(self) -> Tuple[List[Tuple], List[str]]:
+        """
+        Every subscription row, in insertion order, and the ids of those being deleted; also
+        moves to the change log position they reflect.
+        """
+        self._data_version = self._reader.execute("PRAGMA data_version").fetchone()[0]
+        self._last_change = self._reader.execute("SELECT COALESCE(MAX(id), 0) FROM changes").fetchone()[0]
+        rows = self._reader.execute(
+            "SELECT scs_as_id, subscription_id, ue_ipv4, qos_reference, app_session_id, raw"
+            " FROM subscriptions ORDER BY rowid"
+        ).fetchall()
+        terminating = [row[0] for row in self._reader.execute("SELECT subscription_id FROM subscriptions WHERE terminating")]
+        return rows, terminating
+
+    @staticmethod
+    def _restore_all(store, rows: List[Tuple], terminating: List[str]):
+        store.restore_snapshot(rows)
+        for subscription_id in terminating:
+            store.mark_terminating(subscription_id)
+
+    # --- changes from other workers ---
+
+    async def fetch_changes(self):
+        if self._reading is not None:
+            await asyncio.gather(self._reading, return_exceptions=True)
+            self._reading = None
+        if self._reader is None:
+            return None
+        # The rows read may predate writes of this worker that are not committed yet
+        self._in_doubt = set(self._unsynced)
+        self._touched = set()
+        recheck, self._recheck = self._recheck, set()
+        # Shielded: a cancelled poll leaves the thread to finish before the connection is used again
+        reading = self._reading = asyncio.ensure_future(asyncio.to_thread(self._read_changes, recheck))
+        try:
+            return await asyncio.shield(reading)
+        except BaseException:
+            self._recheck |= recheck
+            raise
+
+    def _read_changes(self, recheck: Set[str]):
+        """
+        ("reload", rows, terminating ids) when the change log was pruned past this worker, else
+        ("changes", cleared, {subscriptionId: row or None}); None if nothing changed.
+        """
+        version = self._reader.execute("PRAGMA data_version").fetchone()[0]
+        if version == self._data_version and not recheck:
+            return None
+        self._data_version = version
+        changes = self._reader.execute(
+            "SELECT id, origin, subscription_id FROM changes WHERE id > ? ORDER BY id", (self._last_change,)
+        ).fetchall()
+        if changes and changes[0][0] > self._last_change + 1:
+            logger.warning("Change log of %s was pruned past this worker, reloading", self.path)
+            return ("reload", *self._read_all())
+        if changes:
+            self._last_change = changes[-1][0]
+
+        cleared = False
+        changed: Dict[str, None] = dict.fromkeys(recheck)
+        for _, origin, subscription_id in changes:
+            if origin == self.origin:
+                continue
+            if subscription_id is None:
+                cleared = True
+                changed.clear()
+            else:
+                changed[subscription_id] = None
+        if not cleared and not changed:
+            return None
+        rows = {
+            subscription_id: self._reader.execute(
+                "SELECT scs_as_id, ue_ipv4, qos_reference, app_session_id, raw, terminating FROM subscriptions"
+                " WHERE subscription_id = ?", (subscription_id,)
+            ).fetchone()
+            for subscription_id in changed
+        }
+        return "changes", cleared, rows
+
+    def apply_changes(self, store, changes):
+        if changes[0] == "reload":
+            if self._in_doubt or self._touched or self._unsynced:
+                # The table may not hold the latest writes of this worker yet: reload on a later poll
+                self._data_version, self._last_change = None, -1
+                return
+            store.clear()
+            self._restore_all(store, changes[1], changes[2])
+            return
+        _, cleared, rows = changes
+        skip = self._in_doubt | self._touched | self._unsynced.keys()
+        if None in skip:
+            # A local clear is on its way to the database: everything read may be stale
+            self._recheck.update(rows)
+            return
+        if cleared:
+            store.clear()
+        for subscription_id, row in rows.items():
+            if subscription_id in skip:
+                self._recheck.add(subscription_id)
+                continue
+            if row is None:
+                record = store.get_by_id(subscription_id)
+                if record is not None:
+                    store.remove(record.scsAsId, subscription_id)
+                continue
+            scs, ue, qos, app, raw, terminating = row
+            store.restore(scs, subscription_id, ue, qos, raw, app)
+            if app is None:
+                store.clear_app_session_id(subscription_id)
+            if terminating:
+                store.mark_terminating(subscription_id)
+
+    # --- locks shared by the workers ---
+
+    @asynccontextmanager
+    async def lock(self, name: str):
+        owner = uuid.uuid4().hex
+        delay = 0.001
+        while not await asyncio.to_thread(self._try_lock, name, owner):
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 0.05)
+        try:
+            yield
+        finally:
+            try:
+                await self.sync()
+            finally:
+                await asyncio.to_thread(self._unlock, name, owner)
+
+    def _try_lock(self, name: str, owner: str) -> bool:
+        with self._locker_guard:
+            conn = self._locker
+            now = time.time()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.execute("DELETE FROM locks WHERE name = ? AND expires < ?", (name, now))
+                acquired = conn.execute("INSERT OR IGNORE INTO locks (name, owner, expires) VALUES (?, ?, ?)",
+                                        (name, owner, now + self.lock_lease)).rowcount == 1
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+        return acquired
+
+    def _unlock(self, name: str, owner: str):
+        with self._locker_guard:
+            self._locker.execute("DELETE FROM locks WHERE name = ? AND owner = ?", (name, owner))
+
+    # --- writing ---
+
+    def put(self, record):
+        self._append(("put", record.subscriptionId, record.scsAsId, record.ue_ipv4,
+                      record.qos_reference, record.app_session_id, record.raw))
+
+    def delete(self, scsAsId: str, subscriptionId: str):
+        self._append(("delete", subscriptionId))
+
+    def map(self, subscriptionId: str, appSessionId: str):
+        self._append(("map", subscriptionId, appSessionId))
+
+    def unmap(self, subscriptionId: str):
+        self._append(("map", subscriptionId, None))
+
+    def mark_terminating(self, subscriptionId: str):
+        self._append(("terminating", subscriptionId))
+
+    def clear(self):
+        self._append(("clear", None))
+
+    def _append(self, op: Tuple):
+        subscription_id = op[1]
+        self._unsynced[subscription_id] = self._unsynced.get(subscription_id, 0) + 1
+        self._touched.add(subscription_id)
+        super()._append(op)
+
+    def _committed(self, batch: List[Tuple]):
+        for op in batch:
+            left = self._unsynced[op[1]] - 1
+            if left:
+                self._unsynced[op[1]] = left
+            else:
+                del self._unsynced[op[1]]
+
+    def _write(self, batch: List[Tuple]):
+        now = time.time()
+        conn = self._writer
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            for op in batch:
+                kind, subscription_id = op[0], op[1]
+                if kind == "put":
+                    conn.execute(
+                        "INSERT INTO subscriptions (subscription_id, scs_as_id, ue_ipv4, qos_reference, app_session_id, raw)"
+                        " VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT (subscription_id) DO UPDATE SET"
+                        " ue_ipv4 = excluded.ue_ipv4, qos_reference = excluded.qos_reference, raw = excluded.raw",
+                        (subscription_id, *op[2:]),
+                    )
+                elif kind == "delete":
+                    conn.execute("DELETE FROM subscriptions WHERE subscription_id = ?", (subscription_id,))
+                elif kind == "map":
+                    conn.execute("UPDATE subscriptions SET app_session_id = ? WHERE subscription_id = ?",
+                                 (op[2], subscription_id))
+                elif kind == "terminating":
+                    conn.execute("UPDATE subscriptions SET terminating = 1 WHERE subscription_id = ?", (subscription_id,))
+                elif kind == "clear":
+                    conn.execute("DELETE FROM subscriptions")
+            conn.executemany(
+                "INSERT INTO changes (origin, subscription_id, created) VALUES (?, ?, ?)",
+                [(self.origin, op[1], now) for op in batch],
+            )
+            if now - self._last_prune > min(60.0, self.change_log_retention):
+                conn.execute("DELETE FROM changes WHERE created < ?", (now - self.change_log_retention,))
+                self._last_prune = now
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    async def close(self):
+        await super().close()
+        if self._reading is not None:
+            await asyncio.gather(self._reading, return_exceptions=True)
+            self._reading = None
+        for conn in (self._reader, self._writer, self._locker):
+            if conn is not None:
+                conn.close()
+        self._reader = self._writer = self._locker = None
@@ -0,0 +1,140 @@
+import asyncio
+import hashlib
+import json
+import os
+from datetime import datetime, timezone
+from typing import Dict, Optional, Tuple
+from app.helpers.pcf_payload import PayloadTemplate, compile_templates
+from app.utils.app_config import QOS_MAPPING, QOS_CATALOGUE_FILE, QOS_CATALOGUE_POLL_INTERVAL
+from app.utils.log import get_app_logger
+
+logger = get_app_logger()
+
+
+class QosCatalogue:
+    """
+    One immutable, validated version of the QoS profile catalogue.
+
+    Requests read the active catalogue once and keep using that object, so a
+    reload swapping in a new version never changes a create half-way.
+    """
+
+    __slots__ = ("version", "digest", "source", "loaded_at", "profiles", "templates")
+
+    def __init__(self, version: int, profiles: dict, source: str, digest: str):
+        if not isinstance(profiles, dict) or not profiles:
+            raise ValueError("QoS catalogue must be a non-empty JSON object of profiles")
+        # Validates every profile (bitrate format, MediaType) and precompiles its PCF payload template
+        self.templates: Dict[str, PayloadTemplate] = compile_templates(profiles)
+        self.profiles = profiles
+        self.version = version
+        self.digest = digest
+        self.source = source
+        self.loaded_at = datetime.now(timezone.utc)
+
+    def template(self, qos_reference: str) -> Optional[PayloadTemplate]:
+        return self.templates.get(qos_reference)
+
+    def describe(self) -> dict:
+        return {
+            "version": self.version,
+            "digest": self.digest,
+            "source": self.source,
+            "loadedAt": self.loaded_at.isoformat(),
+            "profiles": sorted(self.profiles),
+        }
+
+
+def _parse(content: bytes, source: str, version: int) -> QosCatalogue:
+    try:
+        profiles = json.loads(content)
+    except ValueError as e:
+        raise ValueError(f"{source} is not valid JSON: {e}") from e
+    return QosCatalogue(version, profiles, source, hashlib.sha256(content).hexdigest()[:16])
+
+
+def _file_signature(path: str) -> Optional[Tuple[int, int]]:
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+class QosCatalogueManager:
+    """
+    Holds the active QosCatalogue and reloads it from a JSON file when the file changes.
+
+    A new version is only swapped in after it fully validated; a broken file
+    is logged and the previous version stays active. The swap is a single
+    reference assignment, so the request path never takes a lock.
+    """
+
+    def __init__(self, path: Optional[str], poll_interval: float, fallback: dict):
+        self.path = path
+        self.poll_interval = poll_interval
+        self._signature = None
+        self._watcher: Optional[asyncio.Task] = None
+        if path:
+            self._signature = _file_signature(path)
+            with open(path, "rb") as catalogue_file:
+                self._active = _parse(catalogue_file.read(), path, 1)
+        else:
+            content = json.dumps(fallback, sort_keys=True).encode("utf-8")
+            self._active = _parse(content, "env:QOS_MAPPING", 1)
+        logger.info("QoS catalogue v%s loaded from %s: %s",
+                    self._active.version, self._active.source, sorted(self._active.profiles))
+
+    @property
+    def active(self) -> QosCatalogue:
+        return self._active
+
+    def reload(self) -> bool:
+        """Load the file again if it changed. Returns True when a new version was swapped in."""
+        if not self.path:
+            return False
+        signature = _file_signature(self.path)
+        if signature is None or signature == self._signature:
+            return False
+        self._signature = signature
+        with open(self.path, "rb") as catalogue_file:
+            content = catalogue_file.read()
+        current = self._active
+        digest = hashlib.sha256(content).hexdigest()[:16]
+        if digest == current.digest:
+            return False
+        try:
+            catalogue = _parse(content, self.path, current.version + 1)
+        except ValueError as e:
+            logger.error("Rejected QoS catalogue change in %s, keeping v%s: %s", self.path, current.version, e)
+            return False
+        self._active = catalogue
+        logger.info("QoS catalogue v%s loaded from %s: %s", catalogue.version, self.path, sorted(catalogue.profiles))
+        return True
+
+    def start(self):
+        """Watch the catalogue file from the running event loop."""
+        if self.path and self.poll_interval > 0 and (self._watcher is None or self._watcher.done()):
+            self._watcher = asyncio.get_running_loop().create_task(self._watch())
+
+    async def _watch(self):
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            try:
+                await asyncio.to_thread(self.reload)
+            except OSError as e:
+                logger.error("Could not read QoS catalogue %s: %s", self.path, e)
+
+    async def stop(self):
+        if self._watcher is not None:
+            self._watcher.cancel()
+            await asyncio.gather(self._watcher, return_exceptions=True)
+            self._watcher = None
+
+
+qos_catalogue = QosCatalogueManager(QOS_CATALOGUE_FILE, QOS_CATALOGUE_POLL_INTERVAL, QOS_MAPPING)
+
+
+def get_qos_catalogue() -> QosCatalogue:
+    """The active catalogue; callers keep the returned object for the whole request."""
+    return qos_catalogue.active
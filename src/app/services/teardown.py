@@ -0,0 +1,219 @@
+import asyncio
+import random
+import time
+from typing import Awaitable, Callable, Dict, List, Optional
+from app.utils.log import get_app_logger
+from app.utils.app_config import (
+    TEARDOWN_WORKERS,
+    TEARDOWN_MAX_ATTEMPTS,
+    TEARDOWN_RETRY_BASE_DELAY,
+    TEARDOWN_RETRY_MAX_DELAY,
+    TEARDOWN_RECONCILE_INTERVAL,
+    TEARDOWN_STUCK_AFTER,
+)
+
+logger = get_app_logger()
+
+
+class _Teardown:
+    """A subscription being deleted in the background; `run` does the PCF teardown and the local cleanup."""
+
+    __slots__ = ("subscriptionId", "run", "attempts", "requested_at", "last_activity", "state", "last_error")
+
+    def __init__(self, subscriptionId: str, run: Callable[[], Awaitable[None]]):
+        self.subscriptionId = subscriptionId
+        self.run = run
+        self.attempts = 0
+        self.requested_at = self.last_activity = time.monotonic()
+        self.state = "queued"  # queued | running | retrying | exhausted
+        self.last_error: Optional[str] = None
+
+
+class TeardownManager:
+    """
+    Runs asynchronous deletes.
+
+    A delete in async mode registers its teardown here and answers at once.
+    Worker tasks run the teardowns; a failed one is retried after a full-jitter
+    exponential backoff, up to `max_attempts` times. The reconciler wakes every
+    `reconcile_interval` seconds and re-queues teardowns that made no progress
+    for `stuck_after` seconds (typically exhausted ones, once the PCF is back),
+    with a fresh attempt budget. The subscription stays in the store, marked
+    terminating, until its teardown succeeds. The mark is persisted with the
+    subscription; `resume`, when set, queues the teardowns of the marked
+    subscriptions found in the store, at start and on every reconciler run,
+    so teardowns outlive a restart and those of another worker that went
+    away are picked up.
+    """
+
+    def __init__(self, workers: int, max_attempts: int, retry_base_delay: float, retry_max_delay: float,
+                 reconcile_interval: float, stuck_after: float):
+        self.workers = max(1, workers)
+        self.max_attempts = max(1, max_attempts)
+        self.retry_base_delay = retry_base_delay
+        self.retry_max_delay = retry_max_delay
+        self.reconcile_interval = reconcile_interval
+        self.stuck_after = stuck_after
+        self._pending: Dict[str, _Teardown] = {}
+        self._retry_timers: Dict[str, asyncio.TimerHandle] = {}
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self.resume: Optional[Callable[[], int]] = None  # queues the teardowns recorded in the store
+
+    def start(self):
+        """Create the queue, the workers and the reconciler on the running event loop (idempotent)."""
+        loop = asyncio.get_running_loop()
+        if loop is self._loop:
+            return
+        self._loop = loop
+        self._queue = asyncio.Queue()
+        self._retry_timers = {}
+        self._tasks = [loop.create_task(self._worker()) for _ in range(self.workers)]
+        self._tasks.append(loop.create_task(self._reconciler()))
+        # Teardowns registered on a previous loop (tests) are picked up again
+        for teardown in self._pending.values():
+            teardown.state = "queued"
+            self._queue.put_nowait(teardown)
+        logger.info("Started PCF teardown manager with %s workers", self.workers)
+        if self.resume is not None:
+            resumed = self.resume()
+            if resumed:
+                logger.info("Resumed %s PCF teardowns found in the store", resumed)
+
+    async def stop(self, drain_timeout: float = 5.0):
+        """Let queued teardowns finish for up to `drain_timeout` seconds, then stop."""
+        if self._loop is None:
+            return
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout=drain_timeout)
+        except asyncio.TimeoutError:
+            pass
+        for timer in self._retry_timers.values():
+            timer.cancel()
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        if self._pending:
+            logger.warning("%s PCF teardowns unfinished on shutdown; they resume from the store on the next start",
+                           len(self._pending))
+        self._pending.clear()
+        self._retry_timers = {}
+        self._tasks = []
+        self._loop = None
+
+    async def join(self):
+        """Wait until the queue is empty and no teardown is running (retries may still be waiting)."""
+        if self._queue is not None:
+            await self._queue.join()
+
+    def request(self, subscriptionId: str, run: Callable[[], Awaitable[None]]) -> bool:
+        """Register and queue a teardown; False if one is already under way for this subscription."""
+        self.start()
+        if subscriptionId in self._pending:
+            return False
+        teardown = self._pending[subscriptionId] = _Teardown(subscriptionId, run)
+        self._queue.put_nowait(teardown)
+        return True
+
+    def is_terminating(self, subscriptionId: str) -> bool:
+        return subscriptionId in self._pending
+
+    def describe(self) -> dict:
+        now = time.monotonic()
+        return {
+            "pending": len(self._pending),
+            "teardowns": [
+                {
+                    "subscriptionId": t.subscriptionId,
+                    "state": t.state,
+                    "attempts": t.attempts,
+                    "pendingFor": round(now - t.requested_at, 3),
+                    "lastError": t.last_error,
+                }
+                for t in self._pending.values()
+            ],
+        }
+
+    def retry_delay(self, attempts: int) -> float:
+        return random.uniform(0, min(self.retry_max_delay, self.retry_base_delay * 2 ** (attempts - 1)))
+
+    async def _worker(self):
+        while True:
+            teardown = await self._queue.get()
+            try:
+                await self._attempt(teardown)
+            except Exception as e:
+                logger.error("Teardown of subscription %s failed: %s", teardown.subscriptionId, e)
+            finally:
+                self._queue.task_done()
+
+    async def _attempt(self, teardown: _Teardown):
+        if self._pending.get(teardown.subscriptionId) is not teardown:
+            return
+        teardown.state = "running"
+        teardown.attempts += 1
+        teardown.last_activity = time.monotonic()
+        try:
+            await teardown.run()
+        except Exception as e:
+            teardown.last_error = f"{type(e).__name__}: {e}"
+            teardown.last_activity = time.monotonic()
+            if teardown.attempts < self.max_attempts:
+                teardown.state = "retrying"
+                delay = self.retry_delay(teardown.attempts)
+                logger.warning("Teardown of subscription %s failed (attempt %s), retrying in %.2fs: %s",
+                               teardown.subscriptionId, teardown.attempts, delay, teardown.last_error)
+                self._retry_timers[teardown.subscriptionId] = self._loop.call_later(delay, self._retry, teardown)
+            else:
+                teardown.state = "exhausted"
+                logger.error("Teardown of subscription %s gave up after %s attempts, left to the reconciler: %s",
+                             teardown.subscriptionId, teardown.attempts, teardown.last_error)
+            return
+        del self._pending[teardown.subscriptionId]
+        logger.info("Tore down subscription %s after %s attempt(s)", teardown.subscriptionId, teardown.attempts)
+
+    def _retry(self, teardown: _Teardown):
+        self._retry_timers.pop(teardown.subscriptionId, None)
+        if self._pending.get(teardown.subscriptionId) is teardown:
+            teardown.state = "queued"
+            self._queue.put_nowait(teardown)
+
+    def reconcile(self) -> int:
+        """
+        Re-queue teardowns idle for `stuck_after` seconds, with a fresh attempt budget, and
+        queue those recorded in the store but not known here.
+        """
+        now = time.monotonic()
+        requeued = self.resume() if self.resume is not None else 0
+        for teardown in self._pending.values():
+            if teardown.state in ("exhausted", "retrying") and now - teardown.last_activity >= self.stuck_after:
+                timer = self._retry_timers.pop(teardown.subscriptionId, None)
+                if timer is not None:
+                    timer.cancel()
+                teardown.attempts = 0
+                teardown.state = "queued"
+                teardown.last_activity = now
+                self._queue.put_nowait(teardown)
+                requeued += 1
+        if requeued:
+            logger.info("Reconciler re-queued %s stuck PCF teardowns", requeued)
+        return requeued
+
+    async def _reconciler(self):
+        while True:
+            await asyncio.sleep(self.reconcile_interval)
+            try:
+                self.reconcile()
+            except Exception as e:
+                logger.error("Teardown reconciliation failed: %s", e)
+
+
+teardown_manager = TeardownManager(
+    workers=TEARDOWN_WORKERS,
+    max_attempts=TEARDOWN_MAX_ATTEMPTS,
+    retry_base_delay=TEARDOWN_RETRY_BASE_DELAY,
+    retry_max_delay=TEARDOWN_RETRY_MAX_DELAY,
+    reconcile_interval=TEARDOWN_RECONCILE_INTERVAL,
+    stuck_after=TEARDOWN_STUCK_AFTER,
+)
@@ -3,12 +3,22 @@ import pytest
 from fastapi.testclient import TestClient
 from app import _app
 from app.services.db import in_memory_db
+from app.helpers.callback import notification_dispatcher
+from app.services.change_feed import change_feed
+
+@pytest.fixture(autouse=True)
+def dead_letter_spool(tmp_path, monkeypatch):
+    """Keep dead-lettered test callbacks out of the working directory."""
+    monkeypatch.setattr(notification_dispatcher.dead_letters, "path", str(tmp_path / "dead_letters.ndjson"))
+    return notification_dispatcher.dead_letters
 
 @pytest.fixture
 def client():
     store = in_memory_db()
     store.clear()
-    return TestClient(_app)
+    change_feed.clear()
+    with TestClient(_app) as test_client:
+        yield test_client
 
 @pytest.fixture
 def example_subscription():
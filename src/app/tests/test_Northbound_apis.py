@@ -1,6 +1,17 @@
+import asyncio
+import json
+import time
+import httpx
 import pytest
 from unittest.mock import patch
 
+from app import _app
+
+from app.helpers.pcf_http2_requests import PCFConnectionError, PCFReadTimeoutError
+from app.schemas.qos_models import AsSessionWithQosSubscriptionWithSubscriptionId
+from app.services.db import SubscriptionStore, map_subId_with_appsessionId
+from app.services.Southbound_apis_svc import delete_app_session_context_from_PCF
+
 
 # --- Pytest Fixtures ---
 
@@ -13,6 +24,11 @@ def mock_http2_pcf_requests():
         yield mock1, mock2
 
 
+@pytest.fixture(autouse=True)
+def mock_pcf_update():
+    with patch("app.services.Northbound_apis_svc.update_app_session_context_in_PCF") as mock:
+        yield mock
+
 
 
 # --- Test Cases ---
@@ -43,35 +59,83 @@ def test_get_subscription_by_id(client, example_subscription):
         assert get_data[key] == value
 
 
-# def test_put_subscription(client, example_subscription):
-#     post_resp = client.post(
-#         "/3gpp-as-session-with-qos/v1/AS1586/subscriptions",
-#         json=example_subscription
-#     )
-#     sub_id = post_resp.json()["subscriptionId"]
-#     put_payload = example_subscription.copy()
-#     put_payload["supportedFeatures"] = "FFFF"
-#     put_resp = client.put(
-#         f"/3gpp-as-session-with-qos/v1/AS1586/subscriptions/{sub_id}",
-#         json=put_payload
-#     )
-#     assert put_resp.status_code == 200
-#     assert put_resp.json()["supportedFeatures"] == "FFFF"
-
-
-# def test_patch_subscription(client, example_subscription):
-#     post_resp = client.post(
-#         "/3gpp-as-session-with-qos/v1/AS1586/subscriptions",
-#         json=example_subscription
-#     )
-#     sub_id = post_resp.json()["subscriptionId"]
-#     patch_payload = {"qosReference": "qos_4"}
-#     patch_resp = client.patch(
-#         f"/3gpp-as-session-with-qos/v1/AS1586/subscriptions/{sub_id}",
-#         json=patch_payload
-#     )
-#     assert patch_resp.status_code == 200
-#     assert patch_resp.json()["qosReference"] == "qos_4"
+def test_put_subscription(client, example_subscription):
+    post_resp = client.post(
+        "/3gpp-as-session-with-qos/v1/AS1586/subscriptions",
+        json=example_subscription
+    )
+    sub_id = post_resp.json()["subscriptionId"]
+    put_payload = example_subscription.copy()
+    put_payload["supportedFeatures"] = "FFFF"
+    put_resp = client.put(
+        f"/3gpp-as-session-with-qos/v1/AS1586/subscriptions/{sub_id}",
+        json=put_payload
+    )
+    assert put_resp.status_code == 200
+    assert put_resp.json()["supportedFeatures"] == "FFFF"
+
+
+def test_patch_subscription(client, example_subscription, mock_pcf_update):
+    post_resp = client.post(
+        "/3gpp-as-session-with-qos/v1/AS1586/subscriptions",
+        json=example_subscription
+    )
+    sub_id = post_resp.json()["subscriptionId"]
+    patch_payload = {"qosReference": "QOS_M"}
+    patch_resp = client.patch(
+        f"/3gpp-as-session-with-qos/v1/AS1586/subscriptions/{sub_id}",
+        json=patch_payload
+    )
+    assert patch_resp.status_code == 200
+    assert patch_resp.json()["qosReference"] == "QOS_M"
+    old, new, subscription_id = mock_pcf_update.call_args[0]
+    assert (old.qosReference, new.qosReference, subscription_id) == ("QOS_L", "QOS_M", sub_id)
+
+
+def test_update_subscription_pcf_unavailable_keeps_the_stored_one(client, example_subscription, mock_pcf_update):
+    sub_id = client.post("/3gpp-as-session-with-qos/v1/AS1586/subscriptions", json=example_subscription).json()["subscriptionId"]
+    mock_pcf_update.side_effect = PCFConnectionError("connection refused")
+
+    resp = client.patch(f"/3gpp-as-session-with-qos/v1/AS1586/subscriptions/{sub_id}", json={"qosReference": "QOS_M"})
+    assert resp.status_code == 503
+    stored = client.get(f"/3gpp-as-session-with-qos/v1/AS1586/subscriptions/{sub_id}").json()
+    assert stored["qosReference"] == "QOS_L"
+
+
+@pytest.mark.asyncio
+async def test_concurrent_puts_with_the_same_etag_let_one_through(client, example_subscription, mock_pcf_update):
+    url = "/3gpp-as-session-with-qos/v1/AS1586/subscriptions"
+    created = client.post(url, json=example_subscription)
+    sub_id = created.json()["subscriptionId"]
+    etag = client.get(f"{url}/{sub_id}").headers["etag"]
+
+    async def slow_pcf(*args):
+        await asyncio.sleep(0.02)
+    mock_pcf_update.side_effect = slow_pcf
+
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=_app), base_url="http://nef") as nef:
+        puts = [asyncio.ensure_future(nef.put(f"{url}/{sub_id}", json=dict(example_subscription, qosReference=qos),
+                                              headers={"If-Match": etag}))
+                for qos in ("QOS_M", "QOS_H")]
+        await asyncio.sleep(0.005)
+        # A delete arriving meanwhile waits for the updates instead of pulling the subscription from under them
+        deleted = await nef.delete(f"{url}/{sub_id}")
+        responses = await asyncio.gather(*puts)
+
+    assert sorted(resp.status_code for resp in responses) == [200, 412]
+    assert mock_pcf_update.await_count == 1
+    assert deleted.status_code == 200
+
+
+def test_update_is_refused_while_the_subscription_terminates(client, example_subscription, mock_http2_pcf_requests):
+    _, mock_delete = mock_http2_pcf_requests
+    url = "/3gpp-as-session-with-qos/v1/AS1586/subscriptions"
+    sub_id = client.post(url, json=example_subscription).json()["subscriptionId"]
+    mock_delete.side_effect = PCFConnectionError("Cannot connect to PCF")
+    assert client.delete(f"{url}/{sub_id}", headers={"Prefer": "respond-async"}).status_code == 202
+
+    assert client.put(f"{url}/{sub_id}", json=example_subscription).status_code == 409
+    assert client.patch(f"{url}/{sub_id}", json={"qosReference": "QOS_M"}).status_code == 409
 
 
 def test_delete_subscription(client, example_subscription):
@@ -92,9 +156,225 @@ def test_delete_subscription(client, example_subscription):
     assert del_data["eventReports"][0]["event"] == "SESSION_TERMINATION"
 
 
+def test_create_subscription_queues_callback_without_waiting(client, example_subscription):
+    with patch("app.services.Northbound_apis_svc.send_callback_to_as") as mock_callback:
+        resp = client.post("/3gpp-as-session-with-qos/v1/AS1586/subscriptions", json=example_subscription)
+
+    assert resp.status_code == 201
+    mock_callback.assert_called_once()
+    assert mock_callback.call_args.kwargs["event"] == "SUCCESSFUL_RESOURCES_ALLOCATION"
+
+
+def test_create_subscription_pcf_timeout_returns_504(client, example_subscription, mock_http2_pcf_requests):
+    mock_create, _ = mock_http2_pcf_requests
+    mock_create.side_effect = PCFReadTimeoutError("PCF sent no response data")
+
+    resp = client.post("/3gpp-as-session-with-qos/v1/AS1586/subscriptions", json=example_subscription)
+    assert resp.status_code == 504
+    assert resp.json()["title"] == "Gateway Timeout"
+
+
+def test_delete_subscription_pcf_unavailable_returns_503(client, example_subscription, mock_http2_pcf_requests):
+    _, mock_delete = mock_http2_pcf_requests
+    post_resp = client.post("/3gpp-as-session-with-qos/v1/AS1586/subscriptions", json=example_subscription)
+    sub_id = post_resp.json()["subscriptionId"]
+
+    mock_delete.side_effect = PCFConnectionError("Cannot connect to PCF")
+    del_resp = client.delete(f"/3gpp-as-session-with-qos/v1/AS1586/subscriptions/{sub_id}")
+    assert del_resp.status_code == 503
+
+    # The subscription is kept so the AF can retry the delete
+    get_resp = client.get(f"/3gpp-as-session-with-qos/v1/AS1586/subscriptions/{sub_id}")
+    assert get_resp.status_code == 200
+
+
+def test_delete_subscription_pcf_answers_503_keeps_it(client, example_subscription):
+    url = "/3gpp-as-session-with-qos/v1/AS1586/subscriptions/" + \
+          client.post("/3gpp-as-session-with-qos/v1/AS1586/subscriptions", json=example_subscription).json()["subscriptionId"]
+    map_subId_with_appsessionId(url.rsplit("/", 1)[1], "5")
+
+    with patch("app.services.Northbound_apis_svc.delete_app_session_context_from_PCF", delete_app_session_context_from_PCF), \
+         patch("app.services.Southbound_apis_svc.pcf_delete_request", return_value=503) as mock_pcf_delete:
+        assert client.delete(url).status_code == 503
+        assert client.get(url).status_code == 200
+
+        mock_pcf_delete.return_value = 204
+        assert client.delete(url).status_code == 200
+        assert client.get(url).status_code == 404
+
+
 def test_get_subscriptions_missing_id(client):
     """Test the GET subscriptions endpoint with a missing SCS/AS ID"""
     response = client.get("/3gpp-as-session-with-qos/v1/as999/subscriptions")
     assert response.status_code == 404
     data = response.json()
     assert "SCS/AS 'as999' not found" in data.get("detail")
+
+
+def test_create_rejects_overlapping_flows_for_same_ue(client, example_subscription):
+    first = client.post("/3gpp-as-session-with-qos/v1/AS1586/subscriptions", json=example_subscription)
+    assert first.status_code == 201
+    first_id = first.json()["subscriptionId"]
+
+    # The same AS is told which of its subscriptions clashes
+    resp = client.post("/3gpp-as-session-with-qos/v1/AS1586/subscriptions", json=example_subscription)
+    assert resp.status_code == 400
+    body = resp.json()
+    assert first_id in body["detail"]
+    assert body["invalidParams"] == [{"name": "flowInfo", "reason": f"Overlaps subscription {first_id}"}]
+
+    # Another AS asking for the same flows of the same UE is rejected without seeing the other AS's ids
+    resp = client.post("/3gpp-as-session-with-qos/v1/AS2000/subscriptions", json=example_subscription)
+    assert resp.status_code == 400
+    body = resp.json()
+    assert first_id not in resp.text
+    assert "1 subscription(s) of another SCS/AS" in body["detail"]
+    assert body["invalidParams"] == [{"name": "flowInfo", "reason": "Overlaps a subscription of another SCS/AS"}]
+    assert client.get("/3gpp-as-session-with-qos/v1/AS2000/subscriptions").status_code == 404
+
+    example_subscription["flowInfo"] = [{"flowId": 2, "flowDescriptions": ["permit in udp from 10.45.0.3 5000 to 192.168.1.7"]}]
+    assert client.post("/3gpp-as-session-with-qos/v1/AS2000/subscriptions", json=example_subscription).status_code == 201
+
+
+def _subscription_for_ue(example_subscription, ue):
+    return dict(example_subscription, ueIpv4Addr=ue,
+                flowInfo=[{"flowId": 1, "flowDescriptions": [f"permit out ip from any to {ue}"]}])
+
+
+def test_bulk_create_reports_each_item(client, example_subscription, mock_http2_pcf_requests):
+    mock_create, _ = mock_http2_pcf_requests
+    mock_create.side_effect = [None, PCFConnectionError("Cannot connect to PCF")]
+    subscriptions = [
+        _subscription_for_ue(example_subscription, "10.45.0.10"),
+        _subscription_for_ue(example_subscription, "10.45.0.11"),
+        _subscription_for_ue(example_subscription, "10.45.0.10"),  # overlaps item 0
+    ]
+    resp = client.post("/3gpp-as-session-with-qos/v1/AS1586/subscriptions/bulk", json={"subscriptions": subscriptions})
+    assert resp.status_code == 200
+    body = resp.json()
+    assert (body["succeeded"], body["failed"]) == (1, 2)
+    assert [result["status"] for result in body["results"]] == [201, 503, 400]
+    assert body["results"][0]["subscription"]["subscriptionId"] == body["results"][0]["subscriptionId"]
+    assert body["results"][2]["problem"]["invalidParams"][0]["name"] == "subscriptions[2].flowInfo"
+    assert mock_create.call_count == 2
+
+
+def test_bulk_delete_reports_each_item(client, example_subscription):
+    created = client.post("/3gpp-as-session-with-qos/v1/AS1586/subscriptions", json=example_subscription).json()
+    ids = [created["subscriptionId"], "missing", created["subscriptionId"]]
+    resp = client.post("/3gpp-as-session-with-qos/v1/AS1586/subscriptions/bulk-delete", json={"subscriptionIds": ids})
+    assert resp.status_code == 200
+    assert [result["status"] for result in resp.json()["results"]] == [200, 404, 400]
+    assert client.get(f"/3gpp-as-session-with-qos/v1/AS1586/subscriptions/{created['subscriptionId']}").status_code == 404
+
+
+def test_bulk_delete_in_async_mode_accepts_each_item(client, example_subscription):
+    base = "/3gpp-as-session-with-qos/v1/AS1586/subscriptions"
+    created = client.post(base, json=example_subscription).json()["subscriptionId"]
+    resp = client.post(f"{base}/bulk-delete", json={"subscriptionIds": [created, "missing"]},
+                       headers={"Prefer": "respond-async"})
+    assert resp.status_code == 200
+    body = resp.json()
+    assert [result["status"] for result in body["results"]] == [202, 404]
+    assert body["results"][0].get("problem") is None
+    assert (body["succeeded"], body["failed"]) == (1, 1)
+
+    for _ in range(200):
+        if client.get(f"{base}/{created}").status_code == 404:
+            break
+        time.sleep(0.01)
+    assert client.get(f"{base}/{created}").status_code == 404
+
+
+def test_bulk_requests_are_bounded(client, example_subscription):
+    resp = client.post("/3gpp-as-session-with-qos/v1/AS1586/subscriptions/bulk-delete", json={"subscriptionIds": []})
+    assert resp.status_code == 400
+    with patch("app.services.Northbound_apis_svc.BULK_MAX_ITEMS", 1):
+        resp = client.post("/3gpp-as-session-with-qos/v1/AS1586/subscriptions/bulk",
+                           json={"subscriptions": [example_subscription, example_subscription]})
+    assert resp.status_code == 400
+
+
+def test_list_subscriptions_with_cursor_pagination(client, example_subscription):
+    base = "/3gpp-as-session-with-qos/v1/AS1586/subscriptions"
+    created = {client.post(base, json=_subscription_for_ue(example_subscription, f"10.45.1.{n}")).json()["subscriptionId"]
+               for n in range(5)}
+
+    seen, url, pages = [], f"{base}?limit=2", 0
+    while url:
+        resp = client.get(url)
+        assert resp.status_code == 200
+        assert len(resp.json()) <= 2
+        seen += [subscription["subscriptionId"] for subscription in resp.json()]
+        url = resp.links.get("next", {}).get("url")
+        pages += 1
+    assert pages == 3
+    assert seen == sorted(created)
+
+    assert client.get(f"{base}?limit=0").status_code == 400
+    assert client.get(f"{base}?cursor=%%%").status_code == 400
+    assert len(client.get(base).json()) == 5
+
+
+def test_list_subscriptions_streamed_as_ndjson(client, example_subscription):
+    base = "/3gpp-as-session-with-qos/v1/AS1586/subscriptions"
+    for n in range(3):
+        client.post(base, json=_subscription_for_ue(example_subscription, f"10.45.2.{n}"))
+    resp = client.get(base, headers={"Accept": "application/x-ndjson"})
+    assert resp.status_code == 200
+    assert resp.headers["content-type"].startswith("application/x-ndjson")
+    lines = [json.loads(line) for line in resp.text.splitlines()]
+    assert lines == client.get(base).json()
+
+
+def test_list_subscriptions_filtered(client, example_subscription):
+    base = "/3gpp-as-session-with-qos/v1/AS1586/subscriptions"
+    ids = []
+    for n, (qos, destination) in enumerate([("QOS_M", "https://af-a.example.com/cb"),
+                                            ("QOS_L", "https://af-b.example.com/cb"),
+                                            ("QOS_M", "https://AF-B.example.com/other")]):
+        ue = f"10.45.3.{n % 2}"
+        body = dict(example_subscription, ueIpv4Addr=ue, qosReference=qos, notificationDestination=destination,
+                    flowInfo=[{"flowId": 1, "flowDescriptions": [f"permit out tcp from any {5000 + n} to {ue}"]}])
+        ids.append(client.post(base, json=body).json()["subscriptionId"])
+
+    def listed(query, **kwargs):
+        resp = client.get(f"{base}?{query}", **kwargs)
+        assert resp.status_code == 200
+        return [subscription["subscriptionId"] for subscription in resp.json()]
+
+    assert listed("qosReference=QOS_M") == [ids[0], ids[2]]
+    assert listed("ueIpv4Addr=10.45.3.0") == [ids[0], ids[2]]
+    assert listed("notificationHost=af-b.example.com") == [ids[1], ids[2]]
+    assert listed("qosReference=QOS_M&notificationHost=af-b.example.com") == [ids[2]]
+    assert listed("qosReference=QOS_E") == []
+    assert listed("qosReference=QOS_M&limit=1") == [min(ids[0], ids[2])]
+    assert client.get(f"{base}?ueIpv4Addr=10.45.3").status_code == 400
+
+
+def test_conditional_get_and_delete_with_etag(client, example_subscription):
+    url = f"/3gpp-as-session-with-qos/v1/AS1586/subscriptions/" \
+          f"{client.post('/3gpp-as-session-with-qos/v1/AS1586/subscriptions', json=example_subscription).json()['subscriptionId']}"
+    resp = client.get(url)
+    etag = resp.headers["ETag"]
+    assert resp.json()["qosReference"] == "QOS_L" and "subscriptionId" not in resp.json()
+
+    not_modified = client.get(url, headers={"If-None-Match": f'"other", W/{etag}'})
+    assert not_modified.status_code == 304 and not_modified.headers["ETag"] == etag
+    assert client.get(url, headers={"If-None-Match": '"other"'}).status_code == 200
+
+    assert client.delete(url, headers={"If-Match": '"stale"'}).status_code == 412
+    assert client.delete(url, headers={"If-Match": etag}).status_code == 200
+
+
+def test_etag_changes_with_the_subscription(example_subscription):
+    store = SubscriptionStore()
+    subscription = AsSessionWithQosSubscriptionWithSubscriptionId(subscriptionId="sub-1", **example_subscription)
+    record = store.add("AS1586", subscription)
+    etag, body = record.etag, record.body
+    assert record.etag is etag and record.body is body  # cached
+
+    store.replace("AS1586", subscription.model_copy(update={"qosReference": "QOS_M"}))
+    assert record.etag != etag and b"QOS_M" in record.body
+    store.restore("AS1586", "sub-1", "10.45.0.3", "QOS_L", subscription.model_dump_json())
+    assert record.etag == etag
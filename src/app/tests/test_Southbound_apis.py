@@ -1,3 +1,4 @@
+import json
 import pytest
 from unittest.mock import patch, AsyncMock
 from uuid import uuid4
@@ -12,11 +13,22 @@ from unittest.mock import patch
 
 from app.services.db import (
     SUBSCRIPTION_STORE,
-    SUBSCRIPTION_ID_TO_APP_SESSION_ID,
+    SubscriptionStore,
     map_subId_with_appsessionId,
+    get_pcf_catalogue,
+    get_subscription_by_app_session_id,
+    set_pcf_catalogue,
 )
 from app.services.Southbound_apis_svc import delete_app_session_context_from_PCF
 from app.schemas.qos_models import AsSessionWithQosSubscriptionWithSubscriptionId
+from app.schemas.qos_models import (
+    AppSessionContext, AppSessionContextReqData, FlowStatus, MediaComponent, MediaSubComponent, MediaType,
+)
+from app.helpers.pcf_http2_requests import PCFRejectedError, PCFServerError
+from app.helpers.pcf_payload import compile_templates, merge_patch
+from app.services.Southbound_apis_svc import update_app_session_context_in_PCF
+from app.services.qos_catalogue import get_qos_catalogue
+from app.utils.app_config import QOS_MAPPING
 
 
 
@@ -30,7 +42,8 @@ async def test_create_app_session_context_PCF(example_subscription):
         **example_subscription
     )
 
-    SUBSCRIPTION_STORE[scs_as_id] = [subscription_with_id]
+    SUBSCRIPTION_STORE.clear()
+    SUBSCRIPTION_STORE.add(scs_as_id, subscription_with_id)
 
     subscription_model = AsSessionWithQosSubscription(**example_subscription)
 
@@ -43,7 +56,7 @@ async def test_create_app_session_context_PCF(example_subscription):
         await create_app_session_context_to_PCF(subscription_model, scs_as_id, subscription_id)
 
         assert mock_post.called is True
-        payload = mock_post.call_args[0][0]
+        payload = json.loads(mock_post.call_args[0][0])
         assert "ascReqData" in payload
 
         req_data = payload["ascReqData"]
@@ -56,14 +69,23 @@ async def test_create_app_session_context_PCF(example_subscription):
 
     mapped_session_id = get_app_session_id(subscription_id)
     assert mapped_session_id == fake_session_id
+
+    with patch("app.services.Southbound_apis_svc.pcf_post_request", return_value=(None, 403)):
+        with pytest.raises(PCFRejectedError) as rejected:
+            await create_app_session_context_to_PCF(subscription_model, scs_as_id, str(uuid4()))
+    assert rejected.value.status_code == 403
+    with patch("app.services.Southbound_apis_svc.pcf_post_request", return_value=(None, 502)):
+        with pytest.raises(PCFServerError):
+            await create_app_session_context_to_PCF(subscription_model, scs_as_id, str(uuid4()))
     
 
 
 
 
 
-@patch("app.services.Southbound_apis_svc.pcf_delete_request")
-def test_delete_app_session_context_PCF(mock_pcf_delete, example_subscription):
+@pytest.mark.asyncio
+@patch("app.services.Southbound_apis_svc.pcf_delete_request", return_value=204)
+async def test_delete_app_session_context_PCF(mock_pcf_delete, example_subscription):
     """
 
     Test that delete_app_session_context_from_PCF:
@@ -79,21 +101,183 @@ def test_delete_app_session_context_PCF(mock_pcf_delete, example_subscription):
         **example_subscription
     )
 
-    SUBSCRIPTION_STORE['test'] = [test_subscription]
+    SUBSCRIPTION_STORE.clear()
+    SUBSCRIPTION_STORE.add('test', test_subscription)
 
     # Map subscriptionId to appSessionId
     test_app_session_id = "test-session-456"
-    map_subId_with_appsessionId(test_app_session_id)
+    map_subId_with_appsessionId(test_subscription.subscriptionId, test_app_session_id)
 
     # Assert mapping was created
-    assert SUBSCRIPTION_ID_TO_APP_SESSION_ID[test_subscription.subscriptionId] == test_app_session_id
+    assert get_app_session_id(test_subscription.subscriptionId) == test_app_session_id
 
     # Call deletion
-    delete_app_session_context_from_PCF(test_subscription.subscriptionId)
+    await delete_app_session_context_from_PCF(test_subscription.subscriptionId)
 
     # Check mapping is removed before delete call
-    assert test_subscription.subscriptionId not in SUBSCRIPTION_ID_TO_APP_SESSION_ID
+    assert get_app_session_id(test_subscription.subscriptionId) is None
 
     # Ensure delete call was made with correct session_id
-    mock_pcf_delete.assert_called_once_with(test_app_session_id)
+    mock_pcf_delete.assert_awaited_once_with(test_app_session_id)
+
+
+@pytest.mark.asyncio
+async def test_delete_app_session_context_PCF_keeps_the_mapping_on_5xx(example_subscription):
+    subscription = AsSessionWithQosSubscriptionWithSubscriptionId(subscriptionId=str(uuid4()), **example_subscription)
+    SUBSCRIPTION_STORE.clear()
+    SUBSCRIPTION_STORE.add("AS1586", subscription)
+    map_subId_with_appsessionId(subscription.subscriptionId, "9")
+
+    with patch("app.services.Southbound_apis_svc.pcf_delete_request", return_value=503) as mock_pcf_delete:
+        with pytest.raises(PCFServerError):
+            await delete_app_session_context_from_PCF(subscription.subscriptionId)
+        assert get_app_session_id(subscription.subscriptionId) == "9"
+
+        mock_pcf_delete.return_value = 204
+        await delete_app_session_context_from_PCF(subscription.subscriptionId)
+        assert get_app_session_id(subscription.subscriptionId) is None
+
+        # Without an app-session there is nothing to send
+        mock_pcf_delete.reset_mock()
+        await delete_app_session_context_from_PCF(subscription.subscriptionId)
+        mock_pcf_delete.assert_not_awaited()
+
+
+def test_map_subId_with_appsessionId_binds_only_the_given_subscription(example_subscription):
+    SUBSCRIPTION_STORE.clear()
+    first, second = (
+        AsSessionWithQosSubscriptionWithSubscriptionId(subscriptionId=str(uuid4()), **example_subscription)
+        for _ in range(2)
+    )
+    SUBSCRIPTION_STORE.add("AS1586", first)
+    SUBSCRIPTION_STORE.add("AS1586", second)
+
+    # The second create's PCF response arrives first; the first subscription must stay unmapped
+    map_subId_with_appsessionId(second.subscriptionId, "7")
+    assert get_app_session_id(first.subscriptionId) is None
+    assert get_app_session_id(second.subscriptionId) == "7"
+
+    map_subId_with_appsessionId(first.subscriptionId, "6")
+    assert get_subscription_by_app_session_id("6") == ("AS1586", first)
+    assert get_subscription_by_app_session_id("7") == ("AS1586", second)
+    assert get_subscription_by_app_session_id("8") is None
+
+
+def test_subscription_store_indexes(example_subscription):
+    store = SubscriptionStore()
+    subs = [
+        AsSessionWithQosSubscriptionWithSubscriptionId(
+            subscriptionId=str(uuid4()),
+            **{**example_subscription, "ueIpv4Addr": ue, "qosReference": qos}
+        )
+        for ue, qos in [("10.45.0.3", "QOS_L"), ("10.45.0.4", "QOS_M"), ("10.45.0.3", "QOS_M")]
+    ]
+    for sub in subs:
+        store.add("AS1", sub)
+
+    assert store.get("AS1", subs[1].subscriptionId) is subs[1]
+    assert store.get("AS2", subs[1].subscriptionId) is None
+    assert store.list("AS1") == subs
+    assert store.find_by_ue_ipv4("AS1", "10.45.0.3") == [subs[0], subs[2]]
+    assert store.find_by_qos_reference("AS1", "QOS_M") == [subs[1], subs[2]]
+
+    store.set_app_session_id(subs[2].subscriptionId, "42")
+    assert store.find_by_app_session_id("42").subscription is subs[2]
+
+    updated = subs[2].model_copy(update={"qosReference": "QOS_S"})
+    store.replace("AS1", updated)
+    assert store.find_by_qos_reference("AS1", "QOS_M") == [subs[1]]
+    assert store.list("AS1") == [subs[0], subs[1], updated]
+    assert store.get_app_session_id(subs[2].subscriptionId) == "42"
+
+    assert store.remove("AS1", subs[0].subscriptionId) is subs[0]
+    assert store.find_by_ue_ipv4("AS1", "10.45.0.3") == [updated]
+    store.remove("AS1", updated.subscriptionId)
+    assert store.find_by_app_session_id("42") is None
+    assert store.has_scs_as("AS1") and len(store) == 1
+
+
+def _model_built_payload(subscription, profile):
+    """The AppSessionContext as the pydantic models build it (the path the templates replace)."""
+    med_components = {}
+    for flow in subscription.flowInfo or []:
+        med_components["1"] = MediaComponent(
+            medCompN=1,
+            fStatus=FlowStatus.ENABLED,
+            medType=MediaType[profile["mediaType"]],
+            marBwUl=profile["marBwUl"],
+            marBwDl=profile["marBwDl"],
+            medSubComps={str(flow.flowId): MediaSubComponent.from_flow_info(flow)},
+        )
+    req_data = AppSessionContextReqData.from_subscription(
+        from_subscription=subscription,
+        medComponents=med_components,
+        notifUri=subscription.notificationDestination,
+    )
+    return AppSessionContext(ascReqData=req_data).model_dump(mode="json")
+
+
+@pytest.mark.parametrize("qos_reference", sorted(QOS_MAPPING))
+@pytest.mark.parametrize("changes", [
+    {},
+    {"supportedFeatures": None, "notificationDestination": "http://af.local:9000"},
+    {"flowInfo": None},
+    {"flowInfo": [
+        {"flowId": 1, "flowDescriptions": ["permit out ip from any to 10.45.0.3"]},
+        {"flowId": 7, "flowDescriptions": ["permit out udp from any 5000-5010 to 10.45.0.3"]},
+    ]},
+])
+def test_payload_template_matches_model_built_payload(example_subscription, qos_reference, changes):
+    subscription = AsSessionWithQosSubscription(**{**example_subscription, "qosReference": qos_reference, **changes})
+    body = get_qos_catalogue().template(qos_reference).render(subscription)
+    assert json.loads(body) == _model_built_payload(subscription, QOS_MAPPING[qos_reference])
+
+
+def test_invalid_qos_profile_is_rejected_when_compiled():
+    with pytest.raises(ValueError):
+        compile_templates({"QOS_X": {"marBwDl": "fast", "marBwUl": "8 Mbps", "mediaType": "AUDIO"}})
+    with pytest.raises(ValueError):
+        compile_templates({"QOS_X": {"marBwDl": "8 Mbps", "marBwUl": "8 Mbps", "mediaType": "HOLOGRAM"}})
+
+
+def test_merge_patch_keeps_changed_members_only():
+    old = {"1": {"medType": "VIDEO", "marBwDl": "8 Mbps", "medSubComps": {"1": {"fNum": 1}, "2": {"fNum": 2}}}}
+    new = {"1": {"medType": "VIDEO", "marBwDl": "4 Mbps", "medSubComps": {"1": {"fNum": 1}}}}
+    assert merge_patch(old, new) == {"1": {"marBwDl": "4 Mbps", "medSubComps": {"2": None}}}
+    assert merge_patch(new, new) == {}
+
+
+@pytest.mark.asyncio
+async def test_update_app_session_sends_only_the_changed_bandwidth(example_subscription):
+    subscription_id = str(uuid4())
+    SUBSCRIPTION_STORE.clear()
+    SUBSCRIPTION_STORE.add("AS1586", AsSessionWithQosSubscriptionWithSubscriptionId(
+        subscriptionId=subscription_id, **{**example_subscription, "qosReference": "QOS_M"}))
+    map_subId_with_appsessionId(subscription_id, "session-42")
+    set_pcf_catalogue(subscription_id, get_qos_catalogue().digest)  # as the create does
+    old = AsSessionWithQosSubscription(**{**example_subscription, "qosReference": "QOS_M"})
+    new = AsSessionWithQosSubscription(**{**example_subscription, "qosReference": "QOS_S"})
+
+    with patch("app.services.Southbound_apis_svc.pcf_patch_request", new_callable=AsyncMock) as mock_patch:
+        mock_patch.return_value = 204
+        assert await update_app_session_context_in_PCF(old, new, subscription_id) is True
+
+        session_id, body = mock_patch.call_args[0]
+        assert session_id == "session-42"
+        assert json.loads(body) == {"ascReqData": {"medComponents": {"1": {"marBwDl": "4 Mbps", "marBwUl": "4 Mbps"}}}}
+
+        mock_patch.reset_mock()
+        assert await update_app_session_context_in_PCF(new, new, subscription_id) is False
+        mock_patch.assert_not_called()
+
+        # The PCF got its components from an earlier catalogue version: an unchanged PUT sends them all
+        set_pcf_catalogue(subscription_id, "before-reload")
+        assert await update_app_session_context_in_PCF(new, new, subscription_id) is True
+        full = json.loads(get_qos_catalogue().template("QOS_S").render(new))["ascReqData"]["medComponents"]
+        assert json.loads(mock_patch.call_args[0][1]) == {"ascReqData": {"medComponents": full}}
+        assert get_pcf_catalogue(subscription_id) == get_qos_catalogue().digest
+
+        mock_patch.return_value = 404
+        with pytest.raises(PCFRejectedError):
+            await update_app_session_context_in_PCF(new, old, subscription_id)
 
@@ -0,0 +1,220 @@
+import asyncio
+import pytest
+from unittest.mock import AsyncMock, patch
+
+from app.helpers import pcf_http2_requests
+from app.helpers.pcf_http2_requests import (PCFCircuitOpenError, PCFConnectFailedError, PCFOverloadedError, PCFReadTimeoutError,
+                                            PCFResponse, pcf_delete_request, pcf_post_request)
+from app.services.db import SUBSCRIPTION_STORE
+from app.utils import limiter
+from app.utils.limiter import (AdaptiveConcurrencyLimiter, CircuitBreaker, CircuitOpen, ConcurrencyLimiter,
+                               KeyedRateLimiter, TokenBucket, retry_after_header)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(limiter.time, "monotonic", lambda: now[0])
+    return now
+
+
+@pytest.fixture(autouse=True)
+def mock_pcf():
+    with patch("app.services.Northbound_apis_svc.create_app_session_context_to_PCF"), \
+         patch("app.services.Northbound_apis_svc.delete_app_session_context_from_PCF"):
+        yield
+
+
+def test_token_bucket_refills_at_its_rate(clock):
+    bucket = TokenBucket(rate=2, burst=3)
+    assert [bucket.take() for _ in range(3)] == [0, 0, 0]
+    assert bucket.take() == pytest.approx(0.5)
+    clock[0] += 0.5
+    assert bucket.take() == 0
+    # A batch larger than the burst waits for a full bucket, then leaves it in debt
+    assert bucket.take(10) == pytest.approx(1.5)
+    clock[0] += 1.5
+    assert bucket.take(10) == 0
+    assert bucket.take() == pytest.approx(4.0)
+
+
+def test_keyed_rate_limiter_overrides(clock):
+    rate_limiter = KeyedRateLimiter(rate=1, burst=1, overrides={"VIP": {"rate": 0}, "SLOW": {"rate": 0.1, "burst": 1}})
+    assert rate_limiter.take("AS1") == 0 and rate_limiter.take("AS1") == pytest.approx(1.0)
+    assert rate_limiter.take("AS2") == 0
+    assert all(rate_limiter.take("VIP") == 0 for _ in range(100))
+    assert rate_limiter.take("SLOW") == 0 and rate_limiter.take("SLOW") == pytest.approx(10.0)
+    assert retry_after_header(0.2) == "1" and retry_after_header(10.0) == "10"
+
+
+def test_rate_limited_scs_as_gets_429_with_retry_after(client, example_subscription, clock):
+    strict = KeyedRateLimiter(rate=0.5, burst=1)
+    with patch("app.services.Northbound_apis_svc.rate_limiter", strict):
+        url = "/3gpp-as-session-with-qos/v1/AS1586/subscriptions"
+        assert client.post(url, json=example_subscription).status_code == 201
+        resp = client.post(url, json=example_subscription)
+        assert resp.status_code == 429
+        assert resp.headers["retry-after"] == "2"
+        assert resp.json()["retryAfter"] == "2"
+        # Other SCS/ASs and reads are not affected
+        assert client.get(url).status_code == 200
+        other = {**example_subscription, "ueIpv4Addr": "10.45.0.9"}
+        assert client.post("/3gpp-as-session-with-qos/v1/AS9/subscriptions", json=other).status_code == 201
+
+        # A bulk request is charged per item: two items empty the bucket into debt
+        clock[0] += 2
+        bulk = {"subscriptions": [{**example_subscription, "ueIpv4Addr": ue} for ue in ("10.45.0.7", "10.45.0.8")]}
+        assert client.post(f"{url}/bulk", json=bulk).status_code == 200
+        assert client.delete(f"{url}/any").headers["retry-after"] == "4"
+
+
+@pytest.mark.asyncio
+async def test_pcf_requests_over_the_in_flight_cap_are_refused(monkeypatch):
+    admission = ConcurrencyLimiter(1)
+    admission.average_hold = 2.5
+    monkeypatch.setattr(pcf_http2_requests, "pcf_admission", admission)
+    assert admission.try_acquire()
+    with pytest.raises(PCFOverloadedError) as refused:
+        await pcf_post_request(b"{}")
+    assert refused.value.retry_after == 2.5
+
+    admission.release(2.5)
+    with patch("app.helpers.pcf_http2_requests.pcf_pool") as pool:
+        pool.request = AsyncMock(return_value=PCFResponse(201, {"location": "http://pcf/app-sessions/1"}, b""))
+        assert await pcf_post_request(b"{}") == ("1", 201)
+    assert admission.in_flight == 0
+
+
+def test_pcf_at_capacity_answers_503_with_retry_after(client, example_subscription):
+    with patch("app.services.Northbound_apis_svc.create_app_session_context_to_PCF",
+               side_effect=PCFOverloadedError("512 PCF requests already in flight", retry_after=0.3)):
+        resp = client.post("/3gpp-as-session-with-qos/v1/AS1586/subscriptions", json=example_subscription)
+    assert resp.status_code == 503
+    assert resp.headers["retry-after"] == "1"
+
+
+@pytest.mark.parametrize("refusal", [PCFCircuitOpenError("circuit open", retry_after=5),
+                                     PCFOverloadedError("at capacity", retry_after=0.3),
+                                     PCFConnectFailedError("Cannot connect to PCF pcf:7777: refused")])
+def test_refused_create_leaves_nothing_behind_and_the_retry_succeeds(client, example_subscription, refusal):
+    url = "/3gpp-as-session-with-qos/v1/AS1586/subscriptions"
+    with patch("app.services.Northbound_apis_svc.create_app_session_context_to_PCF", side_effect=refusal):
+        assert client.post(url, json=example_subscription).status_code in (503, 504)
+    assert client.get(url).json() == []
+
+    retry = client.post(url, json=example_subscription)
+    assert retry.status_code == 201
+    assert [sub["subscriptionId"] for sub in client.get(url).json()] == [retry.json()["subscriptionId"]]
+
+
+def test_create_timed_out_at_the_pcf_is_kept_for_the_teardown(client, example_subscription):
+    url = "/3gpp-as-session-with-qos/v1/AS1586/subscriptions"
+    with patch("app.services.Northbound_apis_svc.create_app_session_context_to_PCF",
+               side_effect=PCFReadTimeoutError("PCF sent no response data")), \
+         patch("app.services.Northbound_apis_svc.teardown_manager") as manager:
+        assert client.post(url, json=example_subscription).status_code == 504
+    # The PCF may have created the app-session: the subscription (and its flows) wait for the teardown
+    [kept] = client.get(url).json()
+    assert SUBSCRIPTION_STORE.get_record("AS1586", kept["subscriptionId"]).terminating
+    assert manager.request.call_args[0][0] == kept["subscriptionId"]
+    assert client.post(url, json=example_subscription).status_code == 400
+
+    asyncio.run(manager.request.call_args[0][1]())
+    assert client.get(url).json() == []
+    assert client.post(url, json=example_subscription).status_code == 201
+
+
+def test_adaptive_limit_grows_under_steady_latency_and_shrinks_when_it_rises():
+    adaptive = AdaptiveConcurrencyLimiter(initial=20, min_limit=4, max_limit=100)
+
+    def run(samples, latency, dropped=False):
+        for _ in range(samples):
+            adaptive.in_flight = adaptive.limit
+            adaptive.release(latency, dropped)
+
+    run(100, 0.01)
+    assert adaptive.limit == 100
+    run(40, 0.05)
+    assert adaptive.limit < 30
+    # Latency that stays up becomes the new normal: the limit is probed upwards again
+    run(200, 0.05)
+    assert adaptive.limit == 100
+    run(100, 0.05, dropped=True)
+    assert adaptive.limit == 4
+
+    # Idle: samples far below the limit do not grow it
+    idle = AdaptiveConcurrencyLimiter(initial=20, min_limit=4, max_limit=100)
+    for _ in range(50):
+        idle.in_flight = 1
+        idle.release(0.01)
+    assert idle.limit == 20
+
+
+def test_circuit_breaker_opens_on_failure_rate_and_closes_after_probes(clock):
+    breaker = CircuitBreaker(window=10, min_calls=4, failure_ratio=0.5, open_for=5, probes=2)
+    for success in (True, False, True):
+        breaker.record(success, breaker.acquire())
+    assert breaker.state == "closed"
+    breaker.record(False, breaker.acquire())
+    assert breaker.state == "open" and breaker.trips == 1
+    with pytest.raises(CircuitOpen) as refused:
+        breaker.acquire()
+    assert refused.value.retry_after == pytest.approx(5)
+
+    clock[0] += 5
+    first, second = breaker.acquire(), breaker.acquire()
+    assert first and second and breaker.state == "half_open"
+    with pytest.raises(CircuitOpen):
+        breaker.acquire()
+    breaker.record(True, first)
+    breaker.record(False, second)
+    assert breaker.state == "open" and breaker.trips == 2
+
+    clock[0] += 5
+    probes = [breaker.acquire(), breaker.acquire()]
+    breaker.cancel(probes.pop())
+    probes.append(breaker.acquire())
+    for probe in probes:
+        breaker.record(True, probe)
+    assert breaker.state == "closed"
+    assert breaker.describe() == {"state": "closed", "trips": 2, "failures": 0, "calls": 0}
+
+
+@pytest.mark.asyncio
+async def test_pcf_failures_trip_the_breaker_and_refuse_fast(monkeypatch, clock):
+    breaker = CircuitBreaker(window=4, min_calls=4, failure_ratio=0.5, open_for=10, probes=1)
+    monkeypatch.setattr(pcf_http2_requests, "pcf_breaker", breaker)
+    with patch("app.helpers.pcf_http2_requests.pcf_pool") as pool:
+        pool.request = AsyncMock(return_value=PCFResponse(503, {}, b""))
+        assert await pcf_delete_request("1") == 503
+        pool.request.side_effect = PCFReadTimeoutError("silent PCF")
+        for _ in range(3):
+            with pytest.raises(PCFReadTimeoutError):
+                await pcf_delete_request("1")
+        assert breaker.state == "open"
+
+        pool.request.reset_mock()
+        with pytest.raises(PCFCircuitOpenError) as refused:
+            await pcf_post_request(b"{}")
+        assert refused.value.retry_after == pytest.approx(10)
+        pool.request.assert_not_called()
+
+        clock[0] += 10
+        pool.request.side_effect = None
+        pool.request.return_value = PCFResponse(201, {"location": "http://pcf/app-sessions/2"}, b"")
+        assert await pcf_post_request(b"{}") == ("2", 201)
+        assert breaker.state == "closed"
+
+
+def test_health_reports_the_breaker(client, monkeypatch, clock):
+    breaker = CircuitBreaker(window=1, min_calls=1, failure_ratio=1, open_for=30, probes=1)
+    monkeypatch.setattr(pcf_http2_requests, "pcf_breaker", breaker)
+    assert client.get("/admin/health").json()["status"] == "ok"
+
+    breaker.record(False, breaker.acquire())
+    health = client.get("/admin/health").json()
+    assert health["status"] == "degraded"
+    assert health["pcf"]["circuitBreaker"]["state"] == "open"
+    assert health["pcf"]["circuitBreaker"]["retryAfter"] == 30
+    assert "limit" in health["pcf"]["concurrency"]
+
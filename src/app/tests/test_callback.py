@@ -0,0 +1,240 @@
+import asyncio
+import json
+import httpx
+import pytest
+
+from app.helpers.callback import (
+    NotificationDispatcher,
+    build_notification,
+    destination_origin,
+    parse_retry_after,
+    transaction_url,
+)
+from app.schemas.qos_models import UserPlaneEvent
+
+
+def _dispatcher(handler, **kwargs):
+    options = dict(queue_size=100, workers=4, max_per_origin=2, timeout=1, retry_base_delay=0.01)
+    options.update(kwargs)
+    return NotificationDispatcher(transport=httpx.MockTransport(handler), **options)
+
+
+def test_destination_origin():
+    assert destination_origin("https://example.com/callback") == "https://example.com:443"
+    assert destination_origin("http://af.local:9000/a/b") == "http://af.local:9000"
+
+
+@pytest.mark.asyncio
+async def test_dispatcher_delivers_with_one_client_per_origin():
+    received = []
+
+    def handler(request: httpx.Request):
+        received.append((str(request.url), json.loads(request.content)))
+        return httpx.Response(204)
+
+    dispatcher = _dispatcher(handler)
+    body = build_notification(transaction_url("AS1586", "sub-1"), [UserPlaneEvent.SUCCESSFUL_RESOURCES_ALLOCATION])
+    for path in ("a", "b", "c"):
+        assert dispatcher.enqueue(f"http://af.local:9000/{path}", body)
+    dispatcher.enqueue("http://other-af.local/cb", body)
+    await dispatcher.join()
+    assert len(dispatcher._clients) == 2
+    await dispatcher.stop()
+
+    assert len(received) == 4
+    assert received[0][1]["eventReports"] == [{"event": "SUCCESSFUL_RESOURCES_ALLOCATION"}]
+    assert received[0][1]["transaction"].endswith("/AS1586/subscriptions/sub-1")
+
+
+@pytest.mark.asyncio
+async def test_dispatcher_limits_concurrency_per_origin():
+    in_flight = 0
+    max_in_flight = 0
+
+    async def handler(request: httpx.Request):
+        nonlocal in_flight, max_in_flight
+        in_flight += 1
+        max_in_flight = max(max_in_flight, in_flight)
+        await asyncio.sleep(0.01)
+        in_flight -= 1
+        return httpx.Response(204)
+
+    dispatcher = _dispatcher(handler, workers=8, max_per_origin=2)
+    for _ in range(10):
+        dispatcher.enqueue("http://af.local/cb", b"{}")
+    await dispatcher.join()
+    await dispatcher.stop()
+
+    assert max_in_flight == 2
+
+
+@pytest.mark.asyncio
+async def test_hung_origin_does_not_hold_up_the_others(tmp_path):
+    release = asyncio.Event()
+    received = []
+
+    async def handler(request: httpx.Request):
+        if request.url.host == "hung-af.local":
+            await release.wait()
+        received.append(request.url.host)
+        return httpx.Response(204)
+
+    dispatcher = _dispatcher(handler, workers=4, max_per_origin=2, timeout=5,
+                             dead_letter_file=str(tmp_path / "spool.ndjson"))
+    for _ in range(6):
+        dispatcher.enqueue("http://hung-af.local/cb", b"{}")
+    for _ in range(3):
+        dispatcher.enqueue("http://af.local/cb", b"{}")
+    for _ in range(100):
+        await asyncio.sleep(0.01)
+        if len(received) == 3:
+            break
+    assert received == ["af.local"] * 3
+
+    # The parked notifications go out once the origin answers again
+    release.set()
+    await dispatcher.join()
+    await dispatcher.stop()
+    assert received.count("hung-af.local") == 6
+    assert dispatcher.dead_letters.count() == 0
+
+
+@pytest.mark.asyncio
+async def test_dispatcher_drops_when_queue_is_full():
+    dispatcher = _dispatcher(lambda request: httpx.Response(204), queue_size=1)
+    dispatcher.start()
+    for task in dispatcher._worker_tasks:
+        task.cancel()
+    assert dispatcher.enqueue("http://af.local/cb", b"{}") is True
+    assert dispatcher.enqueue("http://af.local/cb", b"{}") is False
+
+
+@pytest.mark.asyncio
+async def test_dispatcher_coalesces_events_per_subscription_and_destination():
+    received = []
+
+    def handler(request: httpx.Request):
+        received.append(json.loads(request.content))
+        return httpx.Response(204)
+
+    dispatcher = _dispatcher(handler, coalesce_window=0.05)
+    first, second = transaction_url("AS1586", "sub-1"), transaction_url("AS1586", "sub-2")
+    dispatcher.submit("http://af.local/cb", first, UserPlaneEvent.SUCCESSFUL_RESOURCES_ALLOCATION)
+    dispatcher.submit("http://af.local/cb", second, UserPlaneEvent.SUCCESSFUL_RESOURCES_ALLOCATION)
+    dispatcher.submit("http://af.local/cb", first, UserPlaneEvent.SESSION_TERMINATION)
+    await asyncio.sleep(0.1)
+    await dispatcher.join()
+    await dispatcher.stop()
+
+    assert len(received) == 2
+    by_transaction = {r["transaction"]: [e["event"] for e in r["eventReports"]] for r in received}
+    assert by_transaction[first] == ["SUCCESSFUL_RESOURCES_ALLOCATION", "SESSION_TERMINATION"]
+    assert by_transaction[second] == ["SUCCESSFUL_RESOURCES_ALLOCATION"]
+
+
+@pytest.mark.asyncio
+async def test_dispatcher_flushes_full_batch_before_the_window_ends():
+    received = []
+
+    def handler(request: httpx.Request):
+        received.append(json.loads(request.content))
+        return httpx.Response(204)
+
+    dispatcher = _dispatcher(handler, coalesce_window=60, max_events=3)
+    for _ in range(3):
+        dispatcher.submit("http://af.local/cb", transaction_url("AS1586", "sub-1"), UserPlaneEvent.LOSS_OF_BEARER)
+    await dispatcher._queue.join()
+    await dispatcher.stop()
+
+    assert len(received) == 1
+    assert len(received[0]["eventReports"]) == 3
+
+
+def test_parse_retry_after():
+    assert parse_retry_after("3") == 3.0
+    assert parse_retry_after("Wed, 21 Oct 2015 07:28:00 GMT") == 0.0
+    assert parse_retry_after("soon") is None
+    assert parse_retry_after(None) is None
+
+
+@pytest.mark.asyncio
+async def test_dispatcher_retries_transient_failures_honouring_retry_after():
+    statuses = iter([503, 429, 204])
+    seen = []
+
+    def handler(request: httpx.Request):
+        seen.append(asyncio.get_running_loop().time())
+        return httpx.Response(next(statuses), headers={"Retry-After": "0"})
+
+    dispatcher = _dispatcher(handler, max_attempts=5)
+    dispatcher.enqueue("http://af.local/cb", b"{}")
+    for _ in range(50):
+        await asyncio.sleep(0.01)
+        if len(seen) == 3:
+            break
+    await dispatcher.join()
+    await dispatcher.stop()
+
+    assert len(seen) == 3
+    assert dispatcher.dead_letters.count() == 0
+
+
+@pytest.mark.asyncio
+async def test_dispatcher_dead_letters_and_replays(tmp_path):
+    healthy = False
+
+    def handler(request: httpx.Request):
+        return httpx.Response(204 if healthy else 500)
+
+    spool = str(tmp_path / "spool.ndjson")
+    dispatcher = _dispatcher(handler, max_attempts=2, dead_letter_file=spool)
+    dispatcher.enqueue("http://af.local/cb", b'{"transaction": "t"}')
+    for _ in range(50):
+        await asyncio.sleep(0.01)
+        if dispatcher.dead_letters.count():
+            break
+    entry = dispatcher.dead_letters.take_all()
+    assert len(entry) == 1 and entry[0]["attempts"] == 2 and entry[0]["reason"] == "HTTP 500"
+
+    dispatcher.dead_letters.append(entry)
+    healthy = True
+    assert await dispatcher.replay_dead_letters() == 1
+    await dispatcher.join()
+    await dispatcher.stop()
+    assert dispatcher.dead_letters.count() == 0
+
+
+@pytest.mark.asyncio
+async def test_dispatcher_caps_pending_retries(tmp_path):
+    dispatcher = _dispatcher(
+        lambda request: httpx.Response(503, headers={"Retry-After": "30"}),
+        max_pending_retries=2,
+        retry_max_delay=60,
+        dead_letter_file=str(tmp_path / "spool.ndjson"),
+    )
+    for _ in range(5):
+        dispatcher.enqueue("http://af.local/cb", b"{}")
+    await dispatcher.join()
+
+    assert dispatcher.pending_retries == 2
+    assert dispatcher.dead_letters.count() == 3
+    await dispatcher.stop()
+    # Retries still waiting on shutdown are spooled, not lost
+    assert dispatcher.dead_letters.count() == 5
+
+
+@pytest.mark.asyncio
+async def test_dispatcher_clamps_a_long_retry_after(tmp_path):
+    dispatcher = _dispatcher(
+        lambda request: httpx.Response(503, headers={"Retry-After": "3600"}),
+        retry_max_delay=60,
+        dead_letter_file=str(tmp_path / "spool.ndjson"),
+    )
+    assert dispatcher.retry_delay(1, retry_after=3600) == 60
+    dispatcher.enqueue("http://af.local/cb", b"{}")
+    await dispatcher.join()
+
+    # Retried after retry_max_delay instead of dead-lettered at once
+    assert dispatcher.pending_retries == 1
+    assert dispatcher.dead_letters.count() == 0
+    await dispatcher.stop()
@@ -0,0 +1,114 @@
+import asyncio
+import json
+
+import pytest
+from unittest.mock import patch
+
+from app.services.change_feed import ChangeFeed, ResumeTokenExpired, change_feed
+from app.helpers.pcf_http2_requests import PCFRejectedError
+from app.services.Northbound_apis_svc import watch_stream
+
+
+@pytest.fixture
+def mock_pcf():
+    with patch("app.services.Northbound_apis_svc.create_app_session_context_to_PCF"), \
+         patch("app.services.Northbound_apis_svc.delete_app_session_context_from_PCF"):
+        yield
+
+
+def test_resume_from_ring_buffer():
+    feed = ChangeFeed(history_size=3, queue_size=10)
+    for n in range(5):
+        feed.publish("AS1", "deleted", f"sub-{n}")
+    feed.publish("AS2", "deleted", "other")
+
+    watcher = feed.watch("AS1", since=feed.token(3))
+    assert [json.loads(change.payload)["subscriptionId"] for change in watcher.backlog] == ["sub-3", "sub-4"]
+    assert feed.watch("AS1", since=feed.token(2)).backlog[0].seq == 3
+    assert json.loads(watcher.backlog[0].payload)["id"] == watcher.backlog[0].id == feed.token(4)
+    with pytest.raises(ResumeTokenExpired):
+        feed.watch("AS1", since=feed.token(1))  # event 2 fell out of the buffer
+    with pytest.raises(ResumeTokenExpired):
+        feed.watch("AS1", since=feed.token(9))
+    assert feed.watch("AS3", since=feed.token(0)).backlog == []
+    with pytest.raises(ValueError):
+        feed.watch("AS1", since="x")
+
+
+def test_tokens_of_another_feed_instance_are_refused():
+    # A restarted NEF, or another worker process, numbers its events from 1 again
+    before, after = ChangeFeed(history_size=10, queue_size=10), ChangeFeed(history_size=10, queue_size=10)
+    for feed in (before, after):
+        for n in range(5):
+            feed.publish("AS1", "deleted", f"sub-{n}")
+    with pytest.raises(ResumeTokenExpired):
+        after.watch("AS1", since=before.token(3))
+    with pytest.raises(ResumeTokenExpired):
+        after.watch("AS1", since="3")  # issued before tokens carried the epoch
+
+    token = after.token(3)
+    after.clear()
+    with pytest.raises(ResumeTokenExpired):
+        after.watch("AS1", since=token)
+
+
+@pytest.mark.asyncio
+async def test_slow_watcher_is_cut_off():
+    feed = ChangeFeed(history_size=10, queue_size=2)
+    slow, fast = feed.watch("AS1"), feed.watch("AS1")
+    for n in range(3):
+        feed.publish("AS1", "created", f"sub-{n}", subscription_json='{"qosReference": "QOS_L"}')
+        while not fast.queue.empty():
+            fast.queue.get_nowait()
+    assert slow.cut_off and await slow.queue.get() is None
+    assert feed.watcher_count() == 1 and not fast.cut_off
+
+
+@pytest.mark.asyncio
+async def test_watch_stream_formats_server_sent_events():
+    feed = ChangeFeed(history_size=10, queue_size=10)
+    feed.publish("AS1", "created", "sub-1", subscription_json='{"qosReference": "QOS_L"}')
+    with patch("app.services.Northbound_apis_svc.change_feed", feed):
+        watcher = feed.watch("AS1", since=feed.token(0))
+        stream = watch_stream(watcher, ndjson=False, heartbeat_interval=0.01)
+        first = await stream.__anext__()
+        assert first.startswith(f"id: {feed.epoch}-1\nevent: created\ndata: ".encode())
+        assert json.loads(first.split(b"data: ")[1])["subscription"] == {"qosReference": "QOS_L"}
+        assert await stream.__anext__() == b": keep-alive\n\n"
+        feed.publish("AS1", "deleted", "sub-1")
+        assert (await stream.__anext__()).startswith(f"id: {feed.epoch}-2\nevent: deleted".encode())
+        feed.close()
+        with pytest.raises(StopAsyncIteration):
+            await stream.__anext__()
+    assert feed.watcher_count() == 0
+
+
+def test_northbound_operations_feed_the_bus(client, example_subscription, mock_pcf):
+    created = client.post("/3gpp-as-session-with-qos/v1/AS1586/subscriptions", json=example_subscription).json()
+    client.delete(f"/3gpp-as-session-with-qos/v1/AS1586/subscriptions/{created['subscriptionId']}")
+    events = [json.loads(change.payload) for change in change_feed.watch("AS1586", since=change_feed.token(0)).backlog]
+    assert [event["event"] for event in events] == ["created", "pcf_result", "deleted"]
+    assert events[0]["subscription"]["subscriptionId"] == created["subscriptionId"]
+    assert events[1]["result"] == "SUCCESSFUL_RESOURCES_ALLOCATION"
+
+    assert client.get(f"/3gpp-as-session-with-qos/v1/AS1586/subscriptions/watch?since={change_feed.token(99)}").status_code == 410
+    # The feed of another worker numbers events too, but its tokens do not resume this one
+    resp = client.get("/3gpp-as-session-with-qos/v1/AS1586/subscriptions/watch", headers={"Last-Event-ID": "0123abcd-1"})
+    assert resp.status_code == 410
+    assert "another feed instance" in resp.json()["detail"]
+    assert client.get("/3gpp-as-session-with-qos/v1/AS1586/subscriptions/watch",
+                      headers={"Last-Event-ID": "x"}).status_code == 400
+
+
+@patch("app.services.Northbound_apis_svc.notify_failed_resources_allocation")
+def test_failed_allocations_publish_a_pcf_result(mock_notify, client, example_subscription):
+    url = "/3gpp-as-session-with-qos/v1/AS1586/subscriptions"
+    with patch("app.services.Northbound_apis_svc.create_app_session_context_to_PCF",
+               side_effect=PCFRejectedError("PCF resource allocation failed with status 403", 403)):
+        assert client.post(url, json=example_subscription).status_code == 500
+    with patch("app.services.Northbound_apis_svc.create_app_session_context_to_PCF", side_effect=ValueError("bad")):
+        assert client.post(url, json=example_subscription).status_code == 500
+    events = [json.loads(change.payload) for change in change_feed.watch("AS1586", since=change_feed.token(0)).backlog]
+    events = [event for event in events if event["event"] == "pcf_result"]
+    assert [event["result"] for event in events] == ["FAILED_RESOURCES_ALLOCATION"] * 2
+    assert "status 403" in events[0]["reason"]
@@ -0,0 +1,123 @@
+import time
+from unittest.mock import patch
+
+import pytest
+
+from app.helpers.ip_filter_rule import parse_ip_filter_rule
+from app.schemas.qos_models import AsSessionWithQosSubscriptionWithSubscriptionId, FlowInfo
+from app.services.db import SubscriptionStore
+from app.services.flow_conflicts import FlowConflictIndex, IntervalIndex, rules_overlap
+from app.services.persistence import StoreBackend
+
+UE = "10.45.0.3"
+
+
+def _rules(*raw):
+    return [parse_ip_filter_rule(rule) for rule in raw]
+
+
+def test_interval_index_overlap_queries():
+    index = IntervalIndex()
+    handles = {name: index.add(first, last, name) for name, first, last in [
+        ("a", 0, 9), ("b", 10, 10), ("c", 5, 1000), ("d", 2000, 2000),
+    ]}
+    assert sorted(index.overlapping(9, 10)) == ["a", "b", "c"]
+    assert sorted(index.overlapping(1001, 1999)) == []
+    assert sorted(index.overlapping(0, 2 ** 32)) == ["a", "b", "c", "d"]
+    index.remove(5, 1000, handles["c"])
+    assert sorted(index.overlapping(9, 10)) == ["a", "b"]
+    assert len(index) == 3
+
+
+def test_rules_overlap_on_protocol_addresses_and_ports():
+    udp, = _rules("permit out udp from any 5000-5010 to 10.45.0.3")
+    assert rules_overlap(udp, *_rules("permit out ip from any to 10.45.0.0/24"))
+    assert rules_overlap(udp, *_rules("permit out udp from 192.168.1.1 5010 to 10.45.0.3"))
+    assert not rules_overlap(udp, *_rules("permit out tcp from any to 10.45.0.3"))
+    assert not rules_overlap(udp, *_rules("permit out udp from any 5011-6000 to 10.45.0.3"))
+    assert not rules_overlap(udp, *_rules("permit in udp from any 5000 to 10.45.0.3"))
+    assert not rules_overlap(udp, *_rules("permit out udp from any to 2001:db8::1"))
+
+
+def test_conflict_index_per_ue():
+    index = FlowConflictIndex()
+    index.add("s1", UE, _rules("permit out ip from 192.168.1.0/24 to 10.45.0.3"))
+    index.add("s2", UE, _rules("permit out ip from 192.168.2.7 to 10.45.0.3"))
+    index.add("s3", "10.45.0.4", _rules("permit out ip from any to 10.45.0.4"))
+
+    assert index.conflicts(UE, _rules("permit out ip from 192.168.1.9 to 10.45.0.3")) == ["s1"]
+    assert index.conflicts(UE, _rules("permit out ip from any to 10.45.0.3")) == ["s1", "s2"]
+    assert index.conflicts(UE, _rules("permit out ip from 192.168.3.1 to 10.45.0.3")) == []
+    assert index.conflicts(UE, _rules("permit out ip from 192.168.1.9 to 10.45.0.3"), exclude="s1") == []
+
+    index.remove("s1")
+    assert index.conflicts(UE, _rules("permit out ip from any to 10.45.0.3")) == ["s2"]
+
+
+def test_overlap_is_found_whichever_endpoint_holds_the_ue():
+    # The UE is in the source range of the first filter only, so their remote endpoints differ
+    index = FlowConflictIndex()
+    wide, single = _rules("permit out ip from 10.45.0.0/16 to 2.2.2.2"), _rules("permit out ip from 10.45.0.9 to any")
+    assert rules_overlap(wide[0], single[0])
+    index.add("wide", UE, wide)
+    assert index.conflicts(UE, single) == ["wide"]
+    index.clear()
+    index.add("single", UE, single)
+    assert index.conflicts(UE, wide) == ["single"]
+
+
+def test_conflict_check_with_thousands_of_subscriptions_per_ue():
+    index = FlowConflictIndex()
+    for n in range(5000):
+        index.add(f"s{n}", UE, _rules(f"permit out udp from 192.168.{n >> 8}.{n & 255} 443 to {UE}"))
+    rules = _rules(f"permit out udp from 192.168.7.7 to {UE}")
+    assert index.conflicts(UE, rules) == [f"s{7 * 256 + 7}"]
+
+    started = time.perf_counter()
+    for _ in range(100):
+        index.conflicts(UE, rules)
+    assert (time.perf_counter() - started) / 100 < 1e-3
+
+
+def test_restored_subscriptions_are_indexed_on_first_check():
+    store = SubscriptionStore()
+    subscription = AsSessionWithQosSubscriptionWithSubscriptionId(
+        subscriptionId="restored",
+        notificationDestination="https://example.com/callback",
+        qosReference="QOS_L",
+        ueIpv4Addr=UE,
+        flowInfo=[{"flowId": 1, "flowDescriptions": [f"permit out ip from any to {UE}"]}],
+    )
+    store.restore("AS1586", "restored", UE, "QOS_L", subscription.model_dump_json(exclude_unset=True))
+    flows = [FlowInfo(flowId=1, flowDescriptions=[f"permit out tcp from 192.168.1.1 to {UE}"])]
+    assert store.find_flow_conflicts(UE, flows) == ["restored"]
+    assert store.find_flow_conflicts(UE, flows, exclude="restored") == []
+    store.remove("AS1586", "restored")
+    assert store.find_flow_conflicts(UE, flows) == []
+
+
+def test_failed_inserts_leave_nothing_in_the_index():
+    index = FlowConflictIndex()
+    rules = _rules(f"permit out ip from 192.168.1.1 to {UE}", f"permit out ip from 192.168.1.2 to {UE}")
+    with patch("app.services.flow_conflicts._range", side_effect=[(1, 1), (2, 2), RuntimeError("bad rule")]):
+        with pytest.raises(RuntimeError):
+            index.add("half", UE, rules)
+    assert index.conflicts(UE, rules) == []
+
+    class FailingBackend(StoreBackend):
+        def put(self, record):
+            raise OSError("disk full")
+
+    store = SubscriptionStore(FailingBackend())
+    subscription = AsSessionWithQosSubscriptionWithSubscriptionId(
+        subscriptionId="unsaved",
+        notificationDestination="https://example.com/callback",
+        qosReference="QOS_L",
+        ueIpv4Addr=UE,
+        flowInfo=[{"flowId": 1, "flowDescriptions": [f"permit out ip from any to {UE}"]}],
+    )
+    with pytest.raises(OSError):
+        store.add("AS1586", subscription)
+    assert store.get_by_id("unsaved") is None
+    assert not store.has_scs_as("AS1586")
+    assert store.find_flow_conflicts(UE, subscription.flowInfo) == []
@@ -0,0 +1,54 @@
+import pytest
+from pydantic import ValidationError
+
+from app.helpers.ip_filter_rule import AddressRange, parse_ip_filter_rule
+from app.schemas.qos_models import FlowInfo
+
+
+def test_parse_structured_rule():
+    rule = parse_ip_filter_rule("permit out udp from 10.45.0.0/24 5000-5010 to 192.168.1.7 443")
+    assert rule.direction == "out"
+    assert rule.protocol == 17
+    assert rule.src == AddressRange(4, 0x0A2D0000, 0x0A2D00FF)
+    assert rule.src_ports == (5000, 5010)
+    assert rule.dst == AddressRange(4, 0xC0A80107, 0xC0A80107)
+    assert rule.dst_ports == (443, 443)
+
+
+def test_parse_any_and_ipv6():
+    rule = parse_ip_filter_rule("permit in ip from 2001:db8::/32 to any")
+    assert rule.protocol is None
+    assert rule.src.version == 6 and rule.src.last - rule.src.first == 2 ** 96 - 1
+    assert rule.dst is None and rule.src_ports is None and rule.dst_ports is None
+
+
+def test_parsed_rules_are_cached():
+    raw = "permit out ip from any to 10.45.0.4"
+    assert parse_ip_filter_rule(raw) is parse_ip_filter_rule(raw)
+    assert parse_ip_filter_rule(raw).encoded == '"permit out ip from any to 10.45.0.4"'
+
+
+@pytest.mark.parametrize("rule", [
+    "permit in ip from 10.45.0.4 to",
+    "deny in ip from 10.45.0.4 to any",
+    "permit both ip from any to any",
+    "permit in icmp from any to any",
+    "permit in ip from 10.45.0.4 70000 to any",
+    "permit in tcp from any 10-5 to any",
+    "permit in tcp from any 080 to any",
+    "permit in ip from 10.45..4 to any",
+    "permit in ip from 10.45.0.4/255.255.0.0 to any",
+    "permit in ip from 10.45.0.300 to any",
+    "permit in ip from any to any options",
+    "permit in ip from !10.45.0.4 to any",
+    "permit in ip from 10.45.0.4,10.45.0.5 to any",
+    "permit in ip from any to assigned",
+    "permit in  ip from any to any",
+    "permit in tcp from any \u0663 to any",
+    "permit in ip from 10.45.0.0/\u0661\u0666 to any",
+])
+def test_invalid_rules_are_rejected(rule):
+    with pytest.raises(ValueError):
+        parse_ip_filter_rule(rule)
+    with pytest.raises(ValidationError):
+        FlowInfo(flowId=1, flowDescriptions=[rule])
@@ -0,0 +1,43 @@
+import json
+import logging
+import queue
+
+from app.utils.log import JsonFormatter, LazyQueueHandler, SamplingFilter
+
+
+def _record(level=logging.INFO, msg="hello %s", args=("world",), lineno=10, **extra):
+    record = logging.LogRecord("nef_logger", level, "/app/x.py", lineno, msg, args, None)
+    record.__dict__.update(extra)
+    return record
+
+
+def test_json_formatter_writes_one_object_with_extra_fields():
+    line = JsonFormatter().format(_record(subscriptionId="abc"))
+    entry = json.loads(line)
+    assert entry["level"] == "INFO"
+    assert entry["src"] == "x.py:10"
+    assert entry["msg"] == "hello world"
+    assert entry["subscriptionId"] == "abc"
+    assert "\n" not in line
+
+
+def test_sampling_keeps_one_in_n_per_call_site():
+    sampler = SamplingFilter({"info": 3})
+    kept = [sampler.filter(_record()) for _ in range(7)]
+    assert kept == [True, False, False, True, False, False, True]
+    # Another line of the same level has its own count; warnings are never sampled
+    assert sampler.filter(_record(lineno=11)) is True
+    assert all(sampler.filter(_record(level=logging.WARNING)) for _ in range(5))
+
+
+def test_queue_handler_defers_formatting_and_drops_when_full():
+    log_queue = queue.Queue(1)
+    handler = LazyQueueHandler(log_queue)
+    record = _record()
+    handler.handle(record)
+    handler.handle(_record())
+
+    queued = log_queue.get_nowait()
+    assert queued is record and queued.args == ("world",)
+    assert not hasattr(queued, "message")
+    assert handler.dropped == 1
@@ -0,0 +1,88 @@
+import asyncio
+import pytest
+from unittest.mock import AsyncMock, patch
+
+from app.helpers.pcf_http2_requests import PCFResponse, PCFReadTimeoutError, pcf_delete_request, pcf_post_request
+from app.utils.metrics import Counter, EventLoopLagMonitor, EVENT_LOOP_LAG_SECONDS, Gauge, Histogram, PCF_REQUEST_SECONDS
+
+
+def _sample(text: str, line_start: str) -> float:
+    return float(next(line for line in text.splitlines() if line.startswith(line_start)).rsplit(" ", 1)[1])
+
+
+def test_histogram_renders_cumulative_buckets():
+    histogram = Histogram("t_seconds", "test", ("op",), buckets=(0.1, 1.0))
+    child = histogram.labels("a")
+    assert histogram.labels("a") is child
+    for value in (0.05, 0.1, 0.5, 3):
+        child.observe(value)
+
+    assert histogram.render() == [
+        "# HELP t_seconds test",
+        "# TYPE t_seconds histogram",
+        't_seconds_bucket{op="a",le="0.1"} 2',
+        't_seconds_bucket{op="a",le="1.0"} 3',
+        't_seconds_bucket{op="a",le="+Inf"} 4',
+        't_seconds_sum{op="a"} 3.65',
+        't_seconds_count{op="a"} 4',
+    ]
+
+
+def test_counter_and_collected_gauge():
+    counter = Counter("t_failures", "test", ("reason",))
+    counter.labels('say "hi"').inc(2)
+    assert counter.render()[2] == 't_failures_total{reason="say \\"hi\\""} 2'
+    with pytest.raises(ValueError):
+        counter.labels("a", "b")
+
+    gauge = Gauge("t_size", "test", ("scsAsId",), collect=lambda: {("AS1",): 3})
+    assert gauge.render()[2] == 't_size{scsAsId="AS1"} 3'
+
+    collected = Counter("t_dropped", "test", collect=lambda: {(): 7})
+    assert collected.render()[1:] == ["# TYPE t_dropped counter", "t_dropped_total 7"]
+
+
+def test_metrics_endpoint_reports_routes_and_store_sizes(client, example_subscription):
+    with patch("app.services.Northbound_apis_svc.create_app_session_context_to_PCF"):
+        assert client.post("/3gpp-as-session-with-qos/v1/AS1586/subscriptions", json=example_subscription).status_code == 201
+    client.get("/3gpp-as-session-with-qos/v1/AS1586/subscriptions/missing")
+
+    resp = client.get("/metrics")
+    assert resp.status_code == 200
+    assert resp.headers["content-type"].startswith("text/plain; version=0.0.4")
+    text = resp.text
+    route = "/3gpp-as-session-with-qos/v1/{scsAsId}/subscriptions"
+    assert _sample(text, f'nef_http_request_duration_seconds_count{{method="POST",route="{route}",status="201"}}') >= 1
+    assert _sample(text, f'nef_http_request_duration_seconds_count{{method="GET",route="{route}/{{subscriptionId}}",status="404"}}') >= 1
+    assert _sample(text, 'nef_subscriptions{scsAsId="AS1586"}') == 1
+    assert "# TYPE nef_log_records_dropped counter" in text
+    assert _sample(text, "nef_log_records_dropped_total") >= 0
+
+
+@pytest.mark.asyncio
+async def test_pcf_round_trips_are_timed_by_operation_and_status():
+    def count(operation, status):
+        child = PCF_REQUEST_SECONDS.labels(operation, status)
+        return sum(child.counts)
+
+    created, timed_out = count("create", "201"), count("delete", "timeout")
+    with patch("app.helpers.pcf_http2_requests.pcf_pool") as pool:
+        pool.request = AsyncMock(return_value=PCFResponse(201, {"location": "http://pcf/app-sessions/1"}, b""))
+        await pcf_post_request(b"{}")
+        pool.request.side_effect = PCFReadTimeoutError("silent PCF")
+        with pytest.raises(PCFReadTimeoutError):
+            await pcf_delete_request("1")
+
+    assert count("create", "201") == created + 1
+    assert count("delete", "timeout") == timed_out + 1
+
+
+@pytest.mark.asyncio
+async def test_event_loop_lag_is_sampled():
+    lag = EVENT_LOOP_LAG_SECONDS.labels()
+    before = sum(lag.counts)
+    monitor = EventLoopLagMonitor(0.01)
+    monitor.start()
+    await asyncio.sleep(0.05)
+    await monitor.stop()
+    assert sum(lag.counts) > before
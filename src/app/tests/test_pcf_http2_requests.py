@@ -0,0 +1,171 @@
+import asyncio
+import pytest
+from h2.config import H2Configuration
+from h2.connection import H2Connection
+from h2.events import RequestReceived, StreamEnded
+from h2.settings import SettingCodes
+
+from app.helpers.pcf_http2_requests import (
+    PCFConnectionPool,
+    PCFConnectionError,
+    PCFReadTimeoutError,
+    PCFTimeoutError,
+    APP_SESSIONS_PATH,
+)
+
+
+class StubPCF:
+    """Minimal h2c server answering every stream with 201 and a Location header."""
+
+    def __init__(self, max_concurrent_streams=100, delay=0.0, goaway_after=None):
+        self.max_concurrent_streams = max_concurrent_streams
+        self.delay = delay
+        self.goaway_after = goaway_after
+        self.connections = 0
+        self.requests = 0
+        self.max_seen_concurrency = 0
+        self._in_flight = 0
+        self._handlers = set()
+        self.server = None
+
+    async def start(self):
+        self.server = await asyncio.start_server(self._handle, "127.0.0.1", 0)
+        return self.server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        for handler in self._handlers:
+            handler.cancel()
+        await asyncio.gather(*self._handlers, return_exceptions=True)
+        self.server.close()
+        await self.server.wait_closed()
+
+    async def _handle(self, reader, writer):
+        self._handlers.add(asyncio.current_task())
+        self.connections += 1
+        conn = H2Connection(H2Configuration(client_side=False, header_encoding="utf-8"))
+        conn.initiate_connection()
+        conn.update_settings({SettingCodes.MAX_CONCURRENT_STREAMS: self.max_concurrent_streams})
+        writer.write(conn.data_to_send())
+        served_here = 0
+        try:
+            while True:
+                data = await reader.read(65535)
+                if not data:
+                    break
+                for event in conn.receive_data(data):
+                    if isinstance(event, RequestReceived):
+                        self._in_flight += 1
+                        self.max_seen_concurrency = max(self.max_seen_concurrency, self._in_flight)
+                    elif isinstance(event, StreamEnded):
+                        served_here += 1
+                        asyncio.create_task(self._respond(conn, writer, event.stream_id, served_here))
+                writer.write(conn.data_to_send())
+        except (ConnectionError, asyncio.CancelledError):
+            pass
+        finally:
+            writer.close()
+
+    async def _respond(self, conn, writer, stream_id, served_here):
+        await asyncio.sleep(self.delay)
+        self.requests += 1
+        self._in_flight -= 1
+        conn.send_headers(stream_id, [
+            (":status", "201"),
+            ("location", f"http://pcf{APP_SESSIONS_PATH}/{self.requests}"),
+        ], end_stream=True)
+        if self.goaway_after and served_here == self.goaway_after:
+            conn.close_connection(last_stream_id=stream_id)
+        writer.write(conn.data_to_send())
+
+
+def _pool(port, size=2, **timeouts):
+    return PCFConnectionPool("127.0.0.1", port, size=size, max_streams=100, ping_interval=0, **timeouts)
+
+
+@pytest.mark.asyncio
+async def test_pool_multiplexes_concurrent_streams_on_one_connection():
+    pcf = StubPCF(delay=0.05)
+    port = await pcf.start()
+    pool = _pool(port)
+    try:
+        responses = await asyncio.gather(*[
+            pool.request("POST", APP_SESSIONS_PATH, [("content-type", "application/json")], b"{}")
+            for _ in range(20)
+        ])
+    finally:
+        await pool.close()
+        await pcf.stop()
+
+    assert all(r.status_code == 201 for r in responses)
+    assert len({r.location for r in responses}) == 20
+    assert pcf.connections == 1
+    assert pcf.max_seen_concurrency == 20
+
+
+@pytest.mark.asyncio
+async def test_pool_respects_peer_max_concurrent_streams():
+    pcf = StubPCF(max_concurrent_streams=5, delay=0.05)
+    port = await pcf.start()
+    pool = _pool(port, size=1)
+    try:
+        # Let the SETTINGS frame from the peer arrive before fanning out
+        await pool.request("POST", APP_SESSIONS_PATH, [], b"{}")
+        await asyncio.gather(*[pool.request("POST", APP_SESSIONS_PATH, [], b"{}") for _ in range(15)])
+    finally:
+        await pool.close()
+        await pcf.stop()
+
+    assert pcf.connections == 1
+    assert pcf.max_seen_concurrency <= 5
+
+
+@pytest.mark.asyncio
+async def test_pool_reconnects_after_goaway():
+    pcf = StubPCF(goaway_after=1)
+    port = await pcf.start()
+    pool = _pool(port, size=1)
+    try:
+        for _ in range(3):
+            response = await pool.request("POST", APP_SESSIONS_PATH, [], b"{}")
+            assert response.status_code == 201
+    finally:
+        await pool.close()
+        await pcf.stop()
+
+    assert pcf.connections == 3
+
+
+@pytest.mark.asyncio
+async def test_pool_read_timeout_raises_typed_error():
+    pcf = StubPCF(delay=1.0)
+    port = await pcf.start()
+    pool = _pool(port, read_timeout=0.05, total_timeout=5)
+    try:
+        with pytest.raises(PCFReadTimeoutError):
+            await pool.request("POST", APP_SESSIONS_PATH, [], b"{}")
+    finally:
+        await pool.close()
+        await pcf.stop()
+
+
+@pytest.mark.asyncio
+async def test_pool_total_deadline_raises_typed_error():
+    pcf = StubPCF(delay=1.0)
+    port = await pcf.start()
+    pool = _pool(port, read_timeout=5, total_timeout=0.05)
+    try:
+        with pytest.raises(PCFTimeoutError):
+            await pool.request("POST", APP_SESSIONS_PATH, [], b"{}")
+    finally:
+        await pool.close()
+        await pcf.stop()
+
+
+@pytest.mark.asyncio
+async def test_pool_unreachable_pcf_raises_connection_error():
+    pcf = StubPCF()
+    port = await pcf.start()
+    await pcf.stop()
+    pool = _pool(port)
+    with pytest.raises(PCFConnectionError):
+        await pool.request("POST", APP_SESSIONS_PATH, [], b"{}")
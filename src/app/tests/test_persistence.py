@@ -0,0 +1,271 @@
+import asyncio
+import os
+import pytest
+
+from app.schemas.qos_models import AsSessionWithQosSubscriptionWithSubscriptionId
+from app.services.db import SubscriptionStore
+from app.services.persistence import SQLiteBackend, WriteAheadLogBackend, escape, unescape
+
+
+def _subscription(n, qos="QOS_L"):
+    return AsSessionWithQosSubscriptionWithSubscriptionId(
+        subscriptionId=f"sub-{n}",
+        notificationDestination="https://example.com/callback",
+        ueIpv4Addr=f"10.45.0.{n}",
+        qosReference=qos,
+        flowInfo=[{"flowId": 1, "flowDescriptions": [f"permit out ip from any to 10.45.0.{n}"]}],
+    )
+
+
+def _store(directory, snapshot_every=1000):
+    return SubscriptionStore(WriteAheadLogBackend(str(directory), commit_interval=0, snapshot_every=snapshot_every))
+
+
+def test_escape_round_trip():
+    for value in ["AS1586", "tab\there", "new\nline", "back\\slash", None]:
+        assert unescape(escape(value)) == value
+
+
+@pytest.mark.asyncio
+async def test_wal_recovers_subscriptions_indexes_and_app_sessions(tmp_path):
+    store = _store(tmp_path)
+    await store.open()
+    for n in (1, 2, 3):
+        store.add("AS1586", _subscription(n))
+        store.set_app_session_id(f"sub-{n}", f"app-{n}")
+    store.replace("AS1586", _subscription(2, qos="QOS_E"))
+    store.remove("AS1586", "sub-3")
+    store.mark_terminating("sub-1")
+    await store.sync()
+    await store.close()
+
+    recovered = _store(tmp_path)
+    await recovered.open()
+    assert [s.subscriptionId for s in recovered.list("AS1586")] == ["sub-1", "sub-2"]
+    assert recovered.get("AS1586", "sub-2").qosReference == "QOS_E"
+    assert [s.subscriptionId for s in recovered.find_by_qos_reference("AS1586", "QOS_E")] == ["sub-2"]
+    assert recovered.find_by_ue_ipv4("AS1586", "10.45.0.1")[0].subscriptionId == "sub-1"
+    assert [r.subscriptionId for r in recovered.query("AS1586", notification_host="example.com")] == ["sub-1", "sub-2"]
+    assert [r.subscriptionId for r in recovered.query("AS1586", qos_reference="QOS_E", notification_host="example.com")] == ["sub-2"]
+    assert recovered.find_by_app_session_id("app-2").subscriptionId == "sub-2"
+    assert recovered.find_by_app_session_id("app-3") is None
+    assert [r.subscriptionId for r in recovered.terminating_records()] == ["sub-1"]
+    await recovered.close()
+
+
+@pytest.mark.asyncio
+async def test_snapshot_compacts_old_segments(tmp_path):
+    store = _store(tmp_path, snapshot_every=5)
+    await store.open()
+    for n in range(1, 13):
+        store.add("AS1586", _subscription(n))
+        if n == 2:
+            store.mark_terminating("sub-2")
+        await store.sync()
+    await store.close()
+
+    assert os.path.exists(tmp_path / "snapshot.log")
+    segments = sorted(p for p in os.listdir(tmp_path) if p.startswith("wal-"))
+    assert len(segments) <= 2
+
+    recovered = _store(tmp_path, snapshot_every=5)
+    await recovered.open()
+    assert len(recovered) == 12
+    assert [s.subscriptionId for s in recovered.list("AS1586")] == [f"sub-{n}" for n in range(1, 13)]
+    assert [r.subscriptionId for r in recovered.terminating_records()] == ["sub-2"]
+    await recovered.close()
+
+
+@pytest.mark.asyncio
+async def test_torn_last_record_is_ignored(tmp_path):
+    store = _store(tmp_path)
+    await store.open()
+    store.add("AS1586", _subscription(1))
+    await store.sync()
+    await store.close()
+
+    segment = sorted(p for p in os.listdir(tmp_path) if p.startswith("wal-"))[-1]
+    with open(tmp_path / segment, "a", encoding="utf-8") as wal:
+        wal.write("P\tAS1586\tsub-2\t10.45.0.2\tQOS_L\t{\"subscriptionId\": ")
+
+    recovered = _store(tmp_path)
+    await recovered.open()
+    assert len(recovered) == 1
+    assert recovered.get("AS1586", "sub-1").ueIpv4Addr is not None
+    await recovered.close()
+
+
+@pytest.mark.asyncio
+async def test_failed_commit_is_surfaced_and_retried(tmp_path):
+    store = _store(tmp_path)
+    await store.open()
+    backend = store._backend
+    backend.retry_base_delay = 0.001
+    write = backend._write
+
+    def torn_write(batch):
+        # The disk fails halfway through the batch
+        segment = batch[0][0]
+        with open(backend._segment_path(segment), "a", encoding="utf-8") as wal:
+            wal.write(batch[0][1][:20])
+        backend._write = write
+        raise OSError("No space left on device")
+
+    backend._write = torn_write
+    store.add("AS1586", _subscription(1))
+    with pytest.raises(OSError):
+        await store.sync()
+    store.add("AS1586", _subscription(2))
+    await store.sync()
+    assert backend.failed_commits == 1
+    await store.close()
+
+    recovered = _store(tmp_path)
+    await recovered.open()
+    assert [s.subscriptionId for s in recovered.list("AS1586")] == ["sub-1", "sub-2"]
+    await recovered.close()
+
+
+@pytest.mark.asyncio
+async def test_snapshot_taken_while_records_change_recovers_the_latest_state(tmp_path):
+    store = _store(tmp_path, snapshot_every=1000)
+    await store.open()
+    for n in (1, 2):
+        store.add("AS1586", _subscription(n))
+    backend = store._backend
+    backend._begin_snapshot()
+    # Changed before the writer thread got to them: the snapshot may hold either version
+    store.replace("AS1586", _subscription(1, qos="QOS_E"))
+    store.remove("AS1586", "sub-2")
+    await store.sync()
+    await store.close()
+
+    recovered = _store(tmp_path)
+    await recovered.open()
+    assert [s.subscriptionId for s in recovered.list("AS1586")] == ["sub-1"]
+    assert recovered.get("AS1586", "sub-1").qosReference == "QOS_E"
+    await recovered.close()
+
+
+def _worker(path, retention=3600, poll_interval=0):
+    return SubscriptionStore(SQLiteBackend(str(path), commit_interval=0, change_log_retention=retention,
+                                           poll_interval=poll_interval))
+
+
+@pytest.mark.asyncio
+async def test_sqlite_backend_shares_state_between_workers(tmp_path):
+    path = tmp_path / "subscriptions.db"
+    worker_a, worker_b = _worker(path), _worker(path)
+    await worker_a.open()
+    await worker_b.open()
+
+    worker_a.add("AS1586", _subscription(1))
+    worker_a.set_app_session_id("sub-1", "app-1")
+    await worker_a.sync()
+    # Reads only see the in-memory state; other workers' changes arrive with the next poll
+    assert worker_b.get("AS1586", "sub-1") is None
+    await worker_b.refresh()
+    assert worker_b.get("AS1586", "sub-1").qosReference == "QOS_L"
+    assert worker_b.find_by_app_session_id("app-1").subscriptionId == "sub-1"
+
+    worker_b.replace("AS1586", _subscription(1, qos="QOS_E"))
+    await worker_b.sync()
+    await worker_a.refresh()
+    assert [s.subscriptionId for s in worker_a.find_by_qos_reference("AS1586", "QOS_E")] == ["sub-1"]
+    assert worker_a.get_app_session_id("sub-1") == "app-1"
+
+    worker_a.mark_terminating("sub-1")
+    await worker_a.sync()
+    await worker_b.refresh()
+    assert worker_b.get_record("AS1586", "sub-1").terminating
+
+    worker_b.remove("AS1586", "sub-1")
+    await worker_b.sync()
+    await worker_a.refresh()
+    assert worker_a.get("AS1586", "sub-1") is None
+    assert worker_a.find_by_app_session_id("app-1") is None
+
+    await worker_a.close()
+    await worker_b.close()
+
+
+@pytest.mark.asyncio
+async def test_sqlite_misses_read_through_and_locks_see_every_worker(tmp_path):
+    path = tmp_path / "subscriptions.db"
+    worker_a, worker_b = _worker(path), _worker(path)
+    await worker_a.open()
+    await worker_b.open()
+
+    worker_a.add("AS1586", _subscription(1))
+    await worker_a.sync()
+    # No poll yet: a lookup that misses reads through instead of answering 404
+    assert (await worker_b.find_record("AS1586", "sub-1")).qos_reference == "QOS_L"
+    assert not await worker_b.find_scs_as("AS9")
+
+    async def check_flows():
+        async with worker_b.lock("ue:10.45.0.2"):
+            return worker_b.find_flow_conflicts("10.45.0.2", _subscription(2).flowInfo)
+
+    async with worker_a.lock("ue:10.45.0.2"):
+        contender = asyncio.create_task(check_flows())
+        await asyncio.sleep(0.05)
+        assert not contender.done()
+        worker_a.add("AS1586", _subscription(2))
+    # Released only once the write is committed; worker_b then checks against it
+    assert await contender == ["sub-2"]
+
+    await worker_a.close()
+    await worker_b.close()
+
+
+@pytest.mark.asyncio
+async def test_sqlite_worker_reloads_after_change_log_is_pruned(tmp_path):
+    path = tmp_path / "subscriptions.db"
+    worker_a, worker_b = _worker(path, retention=0), _worker(path)
+    await worker_a.open()
+    await worker_b.open()
+
+    for n in (1, 2, 3):
+        worker_a.add("AS1586", _subscription(n))
+        await worker_a.sync()
+    await worker_b.refresh()
+    assert [s.subscriptionId for s in worker_b.list("AS1586")] == ["sub-1", "sub-2", "sub-3"]
+
+    await worker_a.close()
+    await worker_b.close()
+
+
+@pytest.mark.asyncio
+async def test_sqlite_poll_does_not_undo_uncommitted_local_writes(tmp_path):
+    path = tmp_path / "subscriptions.db"
+    worker_a, worker_b = _worker(path), _worker(path, poll_interval=0.01)
+    await worker_a.open()
+    await worker_b.open()
+
+    worker_a.add("AS1586", _subscription(1))
+    await worker_a.sync()
+    await worker_b.refresh()
+    worker_a.replace("AS1586", _subscription(1, qos="QOS_E"))
+    await worker_a.sync()
+
+    # worker_b polls while its own write of sub-1 is not committed: the row it reads is older
+    worker_b.replace("AS1586", _subscription(1, qos="QOS_M"))
+    await worker_b.refresh()
+    assert worker_b.get("AS1586", "sub-1").qosReference == "QOS_M"
+    await worker_b.sync()
+    await worker_b.refresh()
+    assert worker_b.get("AS1586", "sub-1").qosReference == "QOS_M"
+    await worker_a.refresh()
+    assert worker_a.get("AS1586", "sub-1").qosReference == "QOS_M"
+
+    # The timer picks up the changes of the other workers without an explicit refresh
+    worker_a.remove("AS1586", "sub-1")
+    await worker_a.sync()
+    for _ in range(100):
+        if worker_b.get("AS1586", "sub-1") is None:
+            break
+        await asyncio.sleep(0.01)
+    assert worker_b.get("AS1586", "sub-1") is None
+
+    await worker_a.close()
+    await worker_b.close()
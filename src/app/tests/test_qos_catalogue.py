@@ -0,0 +1,46 @@
+import json
+import os
+
+from app.services.qos_catalogue import QosCatalogueManager
+from app.utils.app_config import QOS_MAPPING
+
+
+def _write(path, profiles, bump):
+    path.write_text(json.dumps(profiles))
+    # Make the change visible even on filesystems with coarse mtime resolution
+    os.utime(path, ns=(bump * 10**9, bump * 10**9))
+
+
+def test_catalogue_reload_swaps_in_validated_versions(tmp_path):
+    path = tmp_path / "qos.json"
+    _write(path, {"QOS_L": QOS_MAPPING["QOS_L"]}, bump=1)
+    manager = QosCatalogueManager(str(path), poll_interval=0, fallback={})
+    first = manager.active
+    assert first.version == 1 and first.template("QOS_X") is None
+
+    _write(path, {"QOS_L": QOS_MAPPING["QOS_L"], "QOS_X": {"marBwDl": "2 Mbps", "marBwUl": "1 Mbps", "mediaType": "VIDEO"}}, bump=2)
+    assert manager.reload() is True
+    assert manager.active.version == 2
+    assert manager.active.template("QOS_X") is not None
+    # A request holding the previous version keeps using it
+    assert first.version == 1 and first.template("QOS_X") is None
+
+    assert manager.reload() is False  # unchanged file
+
+    _write(path, {"QOS_L": {"marBwDl": "fast", "marBwUl": "1 Mbps", "mediaType": "VIDEO"}}, bump=3)
+    assert manager.reload() is False
+    _write(path, {"QOS_L": {"marBwDl": "2 Mbps", "marBwUl": "1 Mbps", "mediaType": "HOLOGRAM"}}, bump=4)
+    assert manager.reload() is False
+    path.write_text("{not json")
+    os.utime(path, ns=(5 * 10**9, 5 * 10**9))
+    assert manager.reload() is False
+    assert manager.active.version == 2
+
+
+def test_active_catalogue_endpoint(client):
+    response = client.get("/admin/qos-catalogue")
+    assert response.status_code == 200
+    body = response.json()
+    assert body["version"] >= 1
+    assert set(body["profiles"]) == set(QOS_MAPPING)
+    assert "loadedAt" in body and "digest" in body
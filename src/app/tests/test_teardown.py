@@ -0,0 +1,106 @@
+import asyncio
+import time
+
+import pytest
+from unittest.mock import AsyncMock, patch
+
+from app.helpers.pcf_http2_requests import PCFConnectionError
+from app.schemas.qos_models import AsSessionWithQosSubscriptionWithSubscriptionId
+from app.services.Northbound_apis_svc import resume_teardowns
+from app.services.db import SubscriptionStore
+from app.services.persistence import WriteAheadLogBackend
+from app.services.teardown import TeardownManager
+
+
+def _manager(max_attempts=3):
+    return TeardownManager(workers=2, max_attempts=max_attempts, retry_base_delay=0.001, retry_max_delay=0.01,
+                           reconcile_interval=3600, stuck_after=0)
+
+
+def _flaky(failures):
+    calls = []
+
+    async def run():
+        calls.append(time.monotonic())
+        if len(calls) <= failures:
+            raise PCFConnectionError("Cannot connect to PCF")
+    return run, calls
+
+
+async def _settle(manager, subscription_id):
+    for _ in range(200):
+        if not manager.is_terminating(subscription_id):
+            return
+        await asyncio.sleep(0.005)
+
+
+@pytest.mark.asyncio
+async def test_failed_teardown_is_retried():
+    manager = _manager()
+    run, calls = _flaky(failures=2)
+    assert manager.request("sub-1", run) is True
+    assert manager.request("sub-1", run) is False  # already terminating
+    await _settle(manager, "sub-1")
+    assert not manager.is_terminating("sub-1") and len(calls) == 3
+    await manager.stop()
+
+
+@pytest.mark.asyncio
+async def test_reconciler_redrives_exhausted_teardown():
+    manager = _manager(max_attempts=1)
+    run, calls = _flaky(failures=1)
+    manager.request("sub-1", run)
+    await manager.join()
+    assert manager.describe()["teardowns"][0]["state"] == "exhausted"
+
+    assert manager.reconcile() == 1
+    await _settle(manager, "sub-1")
+    assert not manager.is_terminating("sub-1") and len(calls) == 2
+    await manager.stop()
+
+
+def test_async_delete_answers_before_the_pcf_teardown(client, example_subscription):
+    with patch("app.services.Northbound_apis_svc.create_app_session_context_to_PCF"), \
+         patch("app.services.Northbound_apis_svc.delete_app_session_context_from_PCF") as mock_delete:
+        mock_delete.side_effect = [PCFConnectionError("Cannot connect to PCF"), None]
+        url = "/3gpp-as-session-with-qos/v1/AS1586/subscriptions/" + \
+              client.post("/3gpp-as-session-with-qos/v1/AS1586/subscriptions", json=example_subscription).json()["subscriptionId"]
+
+        resp = client.delete(url, headers={"Prefer": "respond-async"})
+        assert resp.status_code == 202
+        assert resp.headers["Preference-Applied"] == "respond-async"
+
+        for _ in range(200):
+            if client.get(url).status_code == 404:
+                break
+            time.sleep(0.01)
+        assert client.get(url).status_code == 404
+        assert mock_delete.call_count == 2
+        assert client.get("/admin/teardowns").json()["pending"] == 0
+
+
+@pytest.mark.asyncio
+async def test_teardowns_marked_in_the_store_resume_after_a_restart(tmp_path):
+    store = SubscriptionStore(WriteAheadLogBackend(str(tmp_path), commit_interval=0, snapshot_every=1000))
+    await store.open()
+    store.add("AS1586", AsSessionWithQosSubscriptionWithSubscriptionId(
+        subscriptionId="sub-1", notificationDestination="https://example.com/callback", qosReference="QOS_L"))
+    store.mark_terminating("sub-1")
+    await store.sync()
+    await store.close()  # shut down before the teardown ran
+
+    restarted = SubscriptionStore(WriteAheadLogBackend(str(tmp_path), commit_interval=0, snapshot_every=1000))
+    await restarted.open()
+    assert restarted.get_record("AS1586", "sub-1").terminating
+    manager = _manager()
+    with patch("app.services.Northbound_apis_svc.teardown_manager", manager), \
+         patch("app.services.Northbound_apis_svc.delete_app_session_context_from_PCF", new=AsyncMock()) as mock_delete, \
+         patch("app.services.Northbound_apis_svc.send_callback_to_as"):
+        manager.resume = lambda: resume_teardowns(restarted)
+        manager.start()
+        await _settle(manager, "sub-1")
+        assert manager.reconcile() == 0
+    mock_delete.assert_awaited_once_with("sub-1")
+    assert restarted.get_by_id("sub-1") is None
+    await manager.stop()
+    await restarted.close()
@@ -1,12 +1,115 @@
 import os
 import json
 
+# Logging: level, "json" or "text" lines, records the queue to the writer thread holds before dropping new ones,
+# and per-level sampling as {"LEVEL": N} (keep 1 in N records of each call site; WARNING and above are never sampled)
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json")
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", 10000))
+LOG_SAMPLING = json.loads(os.getenv("LOG_SAMPLING", "{}"))
+
 NEF_BASE_URL = os.getenv("NEF_BASE_URL", "http://localhost:8585")
 PCF_BASE_URL = os.getenv("PCF_BASE_URL", "127.0.0.13")
 PCF_PORT = int(os.getenv("PCF_PORT", 7777))
 
+# HTTP/2 (h2c) connection pool towards the PCF
+PCF_POOL_SIZE = int(os.getenv("PCF_POOL_SIZE", 2))
+PCF_MAX_STREAMS_PER_CONNECTION = int(os.getenv("PCF_MAX_STREAMS_PER_CONNECTION", 100))
+PCF_PING_INTERVAL = float(os.getenv("PCF_PING_INTERVAL", 30))
+# PCF requests in flight across the NEF; more are refused at once with 503. The limit adapts to the PCF's latency
+# between PCF_MIN_IN_FLIGHT and PCF_MAX_IN_FLIGHT (equal values make it fixed), starting at PCF_INITIAL_IN_FLIGHT,
+# and shrinks once latency exceeds PCF_LATENCY_TOLERANCE times its long-term average (PCF_MAX_IN_FLIGHT=0: no cap)
+PCF_MAX_IN_FLIGHT = int(os.getenv("PCF_MAX_IN_FLIGHT", 512))
+PCF_MIN_IN_FLIGHT = int(os.getenv("PCF_MIN_IN_FLIGHT", 8))
+PCF_INITIAL_IN_FLIGHT = int(os.getenv("PCF_INITIAL_IN_FLIGHT", 64))
+PCF_LATENCY_TOLERANCE = float(os.getenv("PCF_LATENCY_TOLERANCE", 1.5))
+
+# Circuit breaker on PCF requests: opens when PCF_BREAKER_FAILURE_RATIO of the last PCF_BREAKER_WINDOW requests
+# (at least PCF_BREAKER_MIN_CALLS) failed, timed out or got a 5xx, fails fast with 503 for PCF_BREAKER_OPEN_SECONDS,
+# then closes again once PCF_BREAKER_PROBES probe requests succeed
+PCF_BREAKER_WINDOW = int(os.getenv("PCF_BREAKER_WINDOW", 50))
+PCF_BREAKER_MIN_CALLS = int(os.getenv("PCF_BREAKER_MIN_CALLS", 20))
+PCF_BREAKER_FAILURE_RATIO = float(os.getenv("PCF_BREAKER_FAILURE_RATIO", 0.5))
+PCF_BREAKER_OPEN_SECONDS = float(os.getenv("PCF_BREAKER_OPEN_SECONDS", 10))
+PCF_BREAKER_PROBES = int(os.getenv("PCF_BREAKER_PROBES", 3))
+
+# Deadlines (seconds) for every southbound request towards the PCF
+PCF_CONNECT_TIMEOUT = float(os.getenv("PCF_CONNECT_TIMEOUT", 3))
+PCF_READ_TIMEOUT = float(os.getenv("PCF_READ_TIMEOUT", 5))
+PCF_TOTAL_TIMEOUT = float(os.getenv("PCF_TOTAL_TIMEOUT", 10))
+
+# Background delivery of notifications (callbacks) towards the AF
+CALLBACK_QUEUE_SIZE = int(os.getenv("CALLBACK_QUEUE_SIZE", 10000))
+CALLBACK_WORKERS = int(os.getenv("CALLBACK_WORKERS", 16))
+CALLBACK_MAX_PER_ORIGIN = int(os.getenv("CALLBACK_MAX_PER_ORIGIN", 8))
+CALLBACK_TIMEOUT = float(os.getenv("CALLBACK_TIMEOUT", 5))
+# Events for the same subscription and destination within this window (seconds) go out in one POST
+CALLBACK_COALESCE_WINDOW = float(os.getenv("CALLBACK_COALESCE_WINDOW", 0.05))
+CALLBACK_MAX_EVENTS_PER_NOTIFICATION = int(os.getenv("CALLBACK_MAX_EVENTS_PER_NOTIFICATION", 50))
+# Failed callbacks are retried with exponential backoff and full jitter, then dead-lettered
+CALLBACK_MAX_ATTEMPTS = int(os.getenv("CALLBACK_MAX_ATTEMPTS", 5))
+CALLBACK_RETRY_BASE_DELAY = float(os.getenv("CALLBACK_RETRY_BASE_DELAY", 0.5))
+CALLBACK_RETRY_MAX_DELAY = float(os.getenv("CALLBACK_RETRY_MAX_DELAY", 60))  # also caps an AF's Retry-After
+CALLBACK_MAX_PENDING_RETRIES = int(os.getenv("CALLBACK_MAX_PENDING_RETRIES", 1000))
+CALLBACK_DEAD_LETTER_FILE = os.getenv("CALLBACK_DEAD_LETTER_FILE", "callback_dead_letters.ndjson")
+
+# Subscription store persistence: "memory" (nothing on disk), "wal" (write-ahead log + snapshots in NEF_STORE_DIR)
+# or "sqlite" (NEF_STORE_DIR/subscriptions.db, shared by all worker processes)
+NEF_STORE_BACKEND = os.getenv("NEF_STORE_BACKEND", "memory")
+NEF_STORE_DIR = os.getenv("NEF_STORE_DIR", "nef_store")
+WAL_COMMIT_INTERVAL = float(os.getenv("WAL_COMMIT_INTERVAL", 0.002))  # seconds a group commit waits for more records
+WAL_SNAPSHOT_EVERY = int(os.getenv("WAL_SNAPSHOT_EVERY", 100000))  # WAL records between compact snapshots
+SQLITE_CHANGE_LOG_RETENTION = float(os.getenv("SQLITE_CHANGE_LOG_RETENTION", 3600))  # seconds
+SQLITE_POLL_INTERVAL = float(os.getenv("SQLITE_POLL_INTERVAL", 0.05))  # seconds between reads of the other workers' changes
+SQLITE_LOCK_LEASE = float(os.getenv("SQLITE_LOCK_LEASE", 30))  # seconds until a dead worker's write lock expires
+# Worker processes; more than one requires NEF_STORE_BACKEND=sqlite
+NEF_WORKERS = int(os.getenv("NEF_WORKERS", 1))
+
+
+
+
+# Bulk create/delete: items accepted per request and PCF requests a single bulk request keeps in flight
+BULK_MAX_ITEMS = int(os.getenv("BULK_MAX_ITEMS", 1000))
+BULK_PCF_CONCURRENCY = int(os.getenv("BULK_PCF_CONCURRENCY", 32))
+
+# Per-SCS/AS token buckets on the write operations (create, update, delete, bulk items), answered with 429 when
+# empty: RATE_LIMIT_RATE requests per second (0: no limit) in bursts of RATE_LIMIT_BURST, and
+# RATE_LIMIT_OVERRIDES as {"<scsAsId>": {"rate": ..., "burst": ...}}
+RATE_LIMIT_RATE = float(os.getenv("RATE_LIMIT_RATE", 0))
+RATE_LIMIT_BURST = float(os.getenv("RATE_LIMIT_BURST", 20))
+RATE_LIMIT_OVERRIDES = json.loads(os.getenv("RATE_LIMIT_OVERRIDES", "{}"))
+
+# Subscription listing: largest page for cursor pagination, subscriptions per chunk of a streamed NDJSON listing
+LIST_MAX_PAGE_SIZE = int(os.getenv("LIST_MAX_PAGE_SIZE", 1000))
+LIST_STREAM_CHUNK_SIZE = int(os.getenv("LIST_STREAM_CHUNK_SIZE", 500))
+
+# Deletes: "sync" waits for the PCF teardown, "async" answers 202 and tears down in the background
+# (also chosen per request with "Prefer: respond-async"). Failed teardowns are retried with backoff;
+# the reconciler re-queues those idle for TEARDOWN_STUCK_AFTER seconds.
+DELETE_MODE = os.getenv("DELETE_MODE", "sync")
+TEARDOWN_WORKERS = int(os.getenv("TEARDOWN_WORKERS", 8))
+TEARDOWN_MAX_ATTEMPTS = int(os.getenv("TEARDOWN_MAX_ATTEMPTS", 5))
+TEARDOWN_RETRY_BASE_DELAY = float(os.getenv("TEARDOWN_RETRY_BASE_DELAY", 0.5))
+TEARDOWN_RETRY_MAX_DELAY = float(os.getenv("TEARDOWN_RETRY_MAX_DELAY", 30))
+TEARDOWN_RECONCILE_INTERVAL = float(os.getenv("TEARDOWN_RECONCILE_INTERVAL", 30))
+TEARDOWN_STUCK_AFTER = float(os.getenv("TEARDOWN_STUCK_AFTER", 60))
+
+# Change feed (watch endpoint): events kept per SCS/AS for resuming, events a watcher may fall behind
+# before it is cut off, and seconds between keep-alives on an idle stream
+WATCH_HISTORY_SIZE = int(os.getenv("WATCH_HISTORY_SIZE", 1024))
+WATCH_QUEUE_SIZE = int(os.getenv("WATCH_QUEUE_SIZE", 256))
+WATCH_HEARTBEAT_INTERVAL = float(os.getenv("WATCH_HEARTBEAT_INTERVAL", 15))
+
+# Metrics (/metrics): seconds between the event-loop lag probes
+EVENT_LOOP_LAG_INTERVAL = float(os.getenv("EVENT_LOOP_LAG_INTERVAL", 0.5))
 
+# Parsed Flow-Descriptions (IPFilterRule) kept in an LRU cache keyed by the raw rule
+FLOW_RULE_CACHE_SIZE = int(os.getenv("FLOW_RULE_CACHE_SIZE", 4096))
 
+# QoS profile catalogue: a JSON file (same shape as QOS_MAPPING) watched and hot-reloaded when it changes.
+# Without it, the QOS_MAPPING env var below is used and never reloaded.
+QOS_CATALOGUE_FILE = os.getenv("QOS_CATALOGUE_FILE")
+QOS_CATALOGUE_POLL_INTERVAL = float(os.getenv("QOS_CATALOGUE_POLL_INTERVAL", 2))  # seconds
 
 QOS_MAPPING = json.loads(os.getenv("QOS_MAPPING", json.dumps({
     ## NON-GBR up to UL/DL each profile is configured* example QOS_M max 8 Mbps UL/DL but can be less depending on network conditions
@@ -0,0 +1,254 @@
+import math
+import time
+from collections import deque
+from typing import Deque, Dict, Optional
+
+
+class TokenBucket:
+    """`rate` tokens per second, holding at most `burst`."""
+
+    __slots__ = ("rate", "burst", "tokens", "updated")
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def take(self, cost: float = 1) -> float:
+        """
+        Take `cost` tokens and return 0, or return the seconds until they
+        would be available and take nothing. A cost above `burst` only
+        needs a full bucket and leaves it in debt, which later refills pay off.
+        """
+        now = time.monotonic()
+        tokens = self.tokens + (now - self.updated) * self.rate
+        if tokens > self.burst:
+            tokens = self.burst
+        self.updated = now
+        needed = cost if cost < self.burst else self.burst
+        if tokens >= needed:
+            self.tokens = tokens - cost
+            return 0.0
+        self.tokens = tokens
+        return (needed - tokens) / self.rate
+
+
+class KeyedRateLimiter:
+    """
+    One token bucket per key (scsAsId), created on first use. `overrides`
+    gives some keys their own {"rate": ..., "burst": ...}; a rate of 0
+    means no limit.
+    """
+
+    def __init__(self, rate: float, burst: float, overrides: Optional[Dict[str, dict]] = None):
+        self.rate = rate
+        self.burst = burst
+        self.overrides = overrides or {}
+        self._buckets: Dict[str, Optional[TokenBucket]] = {}
+
+    def _bucket(self, key: str) -> Optional[TokenBucket]:
+        limits = self.overrides.get(key, {})
+        rate = float(limits.get("rate", self.rate))
+        if rate <= 0:
+            return None
+        return TokenBucket(rate, max(1.0, float(limits.get("burst", self.burst))))
+
+    def take(self, key: str, cost: float = 1) -> float:
+        """0 if the request may go ahead, otherwise the seconds to wait before retrying."""
+        try:
+            bucket = self._buckets[key]
+        except KeyError:
+            bucket = self._buckets[key] = self._bucket(key)
+        if bucket is None:
+            return 0.0
+        return bucket.take(cost)
+
+    def clear(self):
+        self._buckets.clear()
+
+
+class ConcurrencyLimiter:
+    """
+    Admission by a cap on requests in flight, without queueing: a request
+    over the cap is refused at once. Holding times are averaged (EWMA) so
+    a refused caller can be told when a slot is likely to be free. A limit
+    of 0 means no cap.
+    """
+
+    def __init__(self, limit: int, smoothing: float = 0.1):
+        self.limit = limit
+        self.smoothing = smoothing
+        self.in_flight = 0
+        self.average_hold = 0.0
+
+    def try_acquire(self) -> bool:
+        if self.limit and self.in_flight >= self.limit:
+            return False
+        self.in_flight += 1
+        return True
+
+    def release(self, held: float, dropped: bool = False):
+        """Give the slot back; `dropped` marks a request that timed out."""
+        self.in_flight -= 1
+        self.average_hold += self.smoothing * (held - self.average_hold)
+
+    def retry_after(self) -> float:
+        return self.average_hold
+
+    def describe(self) -> dict:
+        return {"limit": self.limit, "inFlight": self.in_flight, "averageLatency": round(self.average_hold, 6)}
+
+
+class AdaptiveConcurrencyLimiter(ConcurrencyLimiter):
+    """
+    ConcurrencyLimiter whose limit follows the latency of what it guards
+    (gradient algorithm). A fast and a slow EWMA of the round-trip time are
+    compared: while the fast one stays within `tolerance` of the slow one the
+    limit keeps growing by about its square root, and when latency rises the
+    limit shrinks in proportion to the rise; a timed-out request multiplies
+    it by `backoff`. The limit stays within
+    [min_limit, max_limit] and only grows while at least half of it is in
+    use, so an idle period does not inflate it.
+    """
+
+    def __init__(self, initial: int, min_limit: int, max_limit: int, tolerance: float = 1.5,
+                 backoff: float = 0.9, smoothing: float = 0.2):
+        self.min_limit = max(1, min_limit)
+        self.max_limit = max(self.min_limit, max_limit)
+        super().__init__(min(max(initial, self.min_limit), self.max_limit))
+        self.tolerance = tolerance
+        self.backoff = backoff
+        self.limit_smoothing = smoothing
+        self.estimated_limit = float(self.limit)
+        self.short_rtt = 0.0
+        self.long_rtt = 0.0
+
+    def release(self, held: float, dropped: bool = False):
+        super().release(held)
+        limit = self.estimated_limit
+        if dropped:
+            limit *= self.backoff
+        else:
+            if self.long_rtt:
+                self.short_rtt += 0.1 * (held - self.short_rtt)
+                self.long_rtt += 0.01 * (held - self.long_rtt)
+            else:
+                self.short_rtt = self.long_rtt = held
+            gradient = max(0.5, min(1.0, self.tolerance * self.long_rtt / self.short_rtt)) if self.short_rtt else 1.0
+            if gradient >= 1.0 and self.in_flight + 1 < limit / 2:
+                return
+            limit += self.limit_smoothing * (limit * gradient + math.sqrt(limit) - limit)
+        self.estimated_limit = min(max(limit, self.min_limit), self.max_limit)
+        self.limit = int(self.estimated_limit)
+
+    def describe(self) -> dict:
+        return {
+            **super().describe(),
+            "minLimit": self.min_limit,
+            "maxLimit": self.max_limit,
+            "shortLatency": round(self.short_rtt, 6),
+            "longLatency": round(self.long_rtt, 6),
+        }
+
+
+class CircuitOpen(Exception):
+    """Refused by an open circuit breaker; `retry_after` is the seconds until it lets a probe through."""
+
+    def __init__(self, retry_after: float):
+        super().__init__(f"circuit open, retry in {retry_after:.2f}s")
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """
+    Closed: calls go through and their outcomes fill a window of the last
+    `window` calls. Once it holds `min_calls` and at least `failure_ratio` of
+    them failed, the breaker opens and refuses every call for `open_for`
+    seconds. Then it is half-open: `probes` calls are let through, and the
+    breaker closes when they all succeed, or opens again on the first failure.
+    """
+
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, window: int, min_calls: int, failure_ratio: float, open_for: float, probes: int):
+        self.min_calls = max(1, min_calls)
+        self.failure_ratio = failure_ratio
+        self.open_for = open_for
+        self.probes = max(1, probes)
+        self.state = self.CLOSED
+        self.trips = 0
+        self.opened_at = 0.0
+        self._outcomes: Deque[bool] = deque(maxlen=max(window, self.min_calls))
+        self._failures = 0
+        self._probes_in_flight = 0
+        self._probe_successes = 0
+
+    def acquire(self) -> bool:
+        """Let a call through, or raise CircuitOpen. True when the call is a half-open probe."""
+        if self.state == self.CLOSED:
+            return False
+        if self.state == self.OPEN:
+            remaining = self.opened_at + self.open_for - time.monotonic()
+            if remaining > 0:
+                raise CircuitOpen(remaining)
+            self.state = self.HALF_OPEN
+            self._probes_in_flight = self._probe_successes = 0
+        if self._probes_in_flight + self._probe_successes >= self.probes:
+            raise CircuitOpen(min(1.0, self.open_for))
+        self._probes_in_flight += 1
+        return True
+
+    def record(self, success: bool, probe: bool):
+        if probe:
+            if self.state != self.HALF_OPEN:
+                return
+            self._probes_in_flight -= 1
+            if not success:
+                self._open()
+            else:
+                self._probe_successes += 1
+                if self._probe_successes >= self.probes:
+                    self._close()
+            return
+        if self.state != self.CLOSED:
+            return  # started before the breaker opened
+        outcomes = self._outcomes
+        if len(outcomes) == outcomes.maxlen and not outcomes[0]:
+            self._failures -= 1
+        outcomes.append(success)
+        if not success:
+            self._failures += 1
+            if len(outcomes) >= self.min_calls and self._failures >= self.failure_ratio * len(outcomes):
+                self._open()
+
+    def cancel(self, probe: bool):
+        """A call that ended without an outcome (cancelled, or refused further on)."""
+        if probe and self.state == self.HALF_OPEN:
+            self._probes_in_flight -= 1
+
+    def _open(self):
+        self.state = self.OPEN
+        self.opened_at = time.monotonic()
+        self.trips += 1
+
+    def _close(self):
+        self.state = self.CLOSED
+        self._outcomes.clear()
+        self._failures = 0
+
+    def describe(self) -> dict:
+        described = {
+            "state": self.state,
+            "trips": self.trips,
+            "failures": self._failures,
+            "calls": len(self._outcomes),
+        }
+        if self.state == self.OPEN:
+            described["retryAfter"] = round(max(0.0, self.opened_at + self.open_for - time.monotonic()), 3)
+        return described
+
+
+def retry_after_header(seconds: float) -> str:
+    """Retry-After value: whole seconds, rounded up, at least 1."""
+    return str(max(1, math.ceil(seconds)))
@@ -1,24 +1,110 @@
+import atexit
+import json
 import logging
+import queue
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from app.utils.app_config import LOG_LEVEL, LOG_FORMAT, LOG_QUEUE_SIZE, LOG_SAMPLING
+
+# Attributes every LogRecord has; anything else on a record came in through `extra=` and goes into the JSON line
+_RECORD_ATTRIBUTES = frozenset(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime", "taskName"}
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: time, level, source, message, `extra=` fields and the traceback if any."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "src": f"{record.filename}:{record.lineno}",
+            "msg": record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRIBUTES:
+                entry[key] = value
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Keeps the first and then one in every N records of a level, counted per
+    call site, so a line logged on every request is thinned out while rare
+    lines of the same level still get through. WARNING and above are never sampled.
+    """
+
+    def __init__(self, every: dict):
+        super().__init__()
+        self.every = {logging.getLevelName(level.upper()): int(n) for level, n in every.items()}
+        self._seen = {}
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        every = self.every.get(record.levelno, 1)
+        if every <= 1 or record.levelno >= logging.WARNING:
+            return True
+        key = (record.pathname, record.lineno)
+        seen = self._seen.get(key, 0)
+        self._seen[key] = seen + 1
+        return seen % every == 0
+
+
+class LazyQueueHandler(QueueHandler):
+    """
+    Hands records to the listener thread as they are: the message is only
+    built (msg % args) and written there, never on the event loop. A full
+    queue drops the record instead of blocking the caller.
+    """
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def _formatter() -> logging.Formatter:
+    if LOG_FORMAT == "json":
+        return JsonFormatter()
+    return logging.Formatter(
+        '%(asctime)s,%(msecs)03d %(levelname)-8s [%(filename)s:%(lineno)d] %(message)s',
+        datefmt='%Y-%m-%d:%H:%M:%S'
+    )
+
 
 def get_app_logger():
     """
-    Set up and return the application logger with debug support.
+    Set up and return the application logger.
+
+    Records go through a bounded queue to a listener thread that formats
+    them (JSON by default, LOG_FORMAT=text for the plain format) and writes
+    them to the console, so no log I/O happens on the event loop.
     """
     logger = logging.getLogger('nef_logger')
-    
-    if not logger.hasHandlers():
-        logger.setLevel(logging.DEBUG)  # Allow all log levels from DEBUG and above
 
-        # Define log format
-        formatter = logging.Formatter(
-            '%(asctime)s,%(msecs)03d %(levelname)-8s [%(filename)s:%(lineno)d] %(message)s',
-            datefmt='%Y-%m-%d:%H:%M:%S'
-        )
+    if not logger.hasHandlers():
+        logger.setLevel(LOG_LEVEL.upper())
 
-        # Console stream handler for DEBUG and above
         stream_handler = logging.StreamHandler()
-        stream_handler.setLevel(logging.DEBUG)  # Show debug logs in console too
-        stream_handler.setFormatter(formatter)
-        logger.addHandler(stream_handler)
+        stream_handler.setFormatter(_formatter())
+
+        log_queue = queue.Queue(LOG_QUEUE_SIZE)
+        queue_handler = LazyQueueHandler(log_queue)
+        if LOG_SAMPLING:
+            queue_handler.addFilter(SamplingFilter(LOG_SAMPLING))
+        logger.addHandler(queue_handler)
+
+        listener = QueueListener(log_queue, stream_handler)
+        listener.start()
+        # Write out what is still queued when the process exits
+        atexit.register(listener.stop)
 
     return logger
@@ -0,0 +1,313 @@
+import asyncio
+import time
+from bisect import bisect_left
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+from app.utils.log import get_app_logger
+from app.utils.app_config import EVENT_LOOP_LAG_INTERVAL
+
+logger = get_app_logger()
+
+# Prometheus text exposition format 0.0.4
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _label_text(names: Tuple[str, ...], values: Tuple[str, ...]) -> str:
+    return ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values))
+
+
+def _number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    """
+    A metric family. `labels(*values)` returns the child for one label set,
+    created on first use and cached: hot paths bind their children once (or
+    look them up in a dict) and then only touch a number.
+    """
+
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], object] = {}
+        if not self.labelnames:
+            self._children[()] = self._new_child()
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def labels(self, *values: str):
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"{self.name} takes labels {self.labelnames}, got {values}")
+            child = self._children[values] = self._new_child()
+        return child
+
+    def remove(self, *values: str):
+        self._children.pop(values, None)
+
+    def samples(self) -> Iterable[Tuple[str, str, float]]:
+        raise NotImplementedError
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for suffix, labels, value in self.samples():
+            lines.append(f"{self.name}{suffix}{{{labels}}} {_number(value)}" if labels
+                         else f"{self.name}{suffix} {_number(value)}")
+        return lines
+
+
+class _CounterChild:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount: float = 1):
+        self.value += amount
+
+
+class Counter(_Metric):
+    """A counter, either incremented by the code or read at scrape time from `collect` ({label values: total})."""
+
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = (),
+                 collect: Optional[Callable[[], Dict[Tuple[str, ...], float]]] = None):
+        super().__init__(name, documentation, labelnames)
+        self.collect = collect
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount: float = 1):
+        self._children[()].value += amount
+
+    def samples(self):
+        if self.collect is not None:
+            items = self.collect().items()
+        else:
+            items = ((values, child.value) for values, child in list(self._children.items()))
+        for values, value in items:
+            yield "_total", _label_text(self.labelnames, values), value
+
+
+class _GaugeChild:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0
+
+    def set(self, value: float):
+        self.value = value
+
+    def inc(self, amount: float = 1):
+        self.value += amount
+
+    def dec(self, amount: float = 1):
+        self.value -= amount
+
+
+class Gauge(_Metric):
+    """A gauge, either set by the code or read at scrape time from `collect` ({label values: value})."""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = (),
+                 collect: Optional[Callable[[], Dict[Tuple[str, ...], float]]] = None):
+        super().__init__(name, documentation, labelnames)
+        self.collect = collect
+
+    def _new_child(self):
+        return _GaugeChild()
+
+    def set(self, value: float):
+        self._children[()].value = value
+
+    def samples(self):
+        if self.collect is not None:
+            items = self.collect().items()
+        else:
+            items = ((values, child.value) for values, child in list(self._children.items()))
+        for values, value in items:
+            yield "", _label_text(self.labelnames, values), value
+
+
+class _HistogramChild:
+    __slots__ = ("_bounds", "counts", "sum")
+
+    def __init__(self, bounds: Tuple[float, ...]):
+        self._bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)  # per bucket, not cumulative; last one is +Inf
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self._bounds, value)] += 1
+        self.sum += value
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = (),
+                 buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames)
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value: float):
+        self._children[()].observe(value)
+
+    def samples(self):
+        for values, child in list(self._children.items()):
+            labels = _label_text(self.labelnames, values)
+            prefix = f"{labels}," if labels else ""
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), list(child.counts)):
+                cumulative += count
+                yield "_bucket", f'{prefix}le="{_number(bound)}"', cumulative
+            yield "_sum", labels, child.sum
+            yield "_count", labels, cumulative
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+
+    def register(self, metric: _Metric) -> _Metric:
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric {metric.name} already registered")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics.values():
+            try:
+                lines.extend(metric.render())
+            except Exception as e:
+                logger.error("Could not collect metric %s: %s", metric.name, e)
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+HTTP_REQUEST_SECONDS = REGISTRY.register(Histogram(
+    "nef_http_request_duration_seconds",
+    "Northbound request latency, by method, route template and status",
+    ("method", "route", "status"),
+))
+PCF_REQUEST_SECONDS = REGISTRY.register(Histogram(
+    "nef_pcf_request_duration_seconds",
+    "Round trip of requests to the PCF, by operation and status (timeout/error when there was no answer)",
+    ("operation", "status"),
+))
+CALLBACK_SECONDS = REGISTRY.register(Histogram(
+    "nef_callback_duration_seconds",
+    "Delivery attempts of AF notifications, by outcome",
+    ("outcome",),
+))
+CALLBACK_FAILURES = REGISTRY.register(Counter(
+    "nef_callback_failures",
+    "Failed AF notification attempts, by reason",
+    ("reason",),
+))
+CALLBACK_DEAD_LETTERS = REGISTRY.register(Counter(
+    "nef_callback_dead_letters",
+    "AF notifications given up on and written to the dead-letter spool",
+))
+EVENT_LOOP_LAG_SECONDS = REGISTRY.register(Histogram(
+    "nef_event_loop_lag_seconds",
+    "How late the event loop ran a timer, sampled every EVENT_LOOP_LAG_INTERVAL seconds",
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0),
+))
+ADMISSION_REJECTIONS = REGISTRY.register(Counter(
+    "nef_admission_rejections",
+    "Requests refused by admission control, by reason (rate_limit: 429, pcf_in_flight: 503)",
+    ("reason",),
+))
+LOG_RECORDS_DROPPED = REGISTRY.register(Counter(
+    "nef_log_records_dropped",
+    "Log records dropped because the queue to the log writer thread was full",
+    collect=lambda: {(): sum(getattr(handler, "dropped", 0) for handler in logger.handlers)},
+))
+
+
+class RouteMetricsMiddleware:
+    """
+    ASGI middleware timing every HTTP request into HTTP_REQUEST_SECONDS.
+
+    Requests are labelled with the route template (not the raw path, which
+    holds ids), so the label set stays small; the child of each
+    (method, route, status) is looked up in a dict after the first request.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self._children: Dict[Tuple[str, str, int], _HistogramChild] = {}
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        start = time.perf_counter()
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            route = scope.get("route")
+            key = (scope["method"], route.path if route is not None else "unmatched", status)
+            child = self._children.get(key)
+            if child is None:
+                child = self._children[key] = HTTP_REQUEST_SECONDS.labels(key[0], key[1], str(status))
+            child.observe(time.perf_counter() - start)
+
+
+class EventLoopLagMonitor:
+    """Background task sleeping `interval` seconds at a time and recording how late it wakes up."""
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        lag = EVENT_LOOP_LAG_SECONDS.labels()
+        while True:
+            expected = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            lag.observe(max(0.0, loop.time() - expected))
+
+
+event_loop_lag_monitor = EventLoopLagMonitor(EVENT_LOOP_LAG_INTERVAL)
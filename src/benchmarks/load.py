@@ -0,0 +1,173 @@
+"""
+End-to-end load test of the NEF through the real FastAPI app.
+
+Starts the stub h2c PCF and the AF callback sink (benchmarks.stubs), points
+the NEF at them and runs the application in-process (lifespan included, so
+the PCF pool, callback dispatcher and store behave as in production).
+Concurrent virtual users each loop over create -> get -> list -> delete on
+their own SCS/AS. Throughput and p50/p99/p999 latency per operation are
+printed as JSON, to be compared between releases.
+
+    cd src && python -m benchmarks.load --users 50 --iterations 200 --pcf-latency 0.002 --output load.json
+
+--async-delete sends "Prefer: respond-async", so deletes answer 202 and the
+PCF teardown runs in the background (compare delete p99 at high --pcf-latency).
+"""
+import argparse
+import asyncio
+import json
+import logging
+import math
+import os
+import platform
+import time
+from typing import Dict, List
+
+import httpx
+
+from benchmarks.stubs import CallbackSink, StubPCF
+
+OPERATIONS = ("create", "get", "list", "delete")
+EXPECTED_STATUS = {"create": 201, "get": 200, "list": 200, "delete": 200}
+
+
+def percentile(samples: List[float], fraction: float) -> float:
+    """Nearest-rank percentile of already sorted samples."""
+    if not samples:
+        return 0.0
+    return samples[max(0, math.ceil(fraction * len(samples)) - 1)]
+
+
+def summarize(latencies: List[float], errors: int, elapsed: float) -> dict:
+    latencies = sorted(latencies)
+    return {
+        "count": len(latencies),
+        "errors": errors,
+        "throughput": round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+        "p50Ms": round(percentile(latencies, 0.50) * 1000, 3),
+        "p99Ms": round(percentile(latencies, 0.99) * 1000, 3),
+        "p999Ms": round(percentile(latencies, 0.999) * 1000, 3),
+        "maxMs": round(latencies[-1] * 1000, 3) if latencies else 0.0,
+    }
+
+
+class Recorder:
+    def __init__(self, async_delete: bool = False):
+        self.latencies: Dict[str, List[float]] = {op: [] for op in OPERATIONS}
+        self.errors: Dict[str, int] = {op: 0 for op in OPERATIONS}
+        self.expected_status = dict(EXPECTED_STATUS, delete=202 if async_delete else 200)
+
+    async def timed(self, operation: str, request):
+        started = time.perf_counter()
+        response = await request
+        self.latencies[operation].append(time.perf_counter() - started)
+        if response.status_code != self.expected_status[operation]:
+            self.errors[operation] += 1
+        return response
+
+
+async def virtual_user(client: httpx.AsyncClient, recorder: Recorder, user: int, iterations: int, callback_url: str,
+                       async_delete: bool = False):
+    base = f"/3gpp-as-session-with-qos/v1/AS{user}/subscriptions"
+    ue = f"10.{100 + user // 65536}.{user // 256 % 256}.{user % 256}"
+    delete_headers = {"Prefer": "respond-async"} if async_delete else {}
+    for iteration in range(iterations):
+        # A new port per round: with async deletes the previous round's flow may still be terminating
+        body = {
+            "notificationDestination": callback_url,
+            "ueIpv4Addr": ue,
+            "qosReference": "QOS_L",
+            "flowInfo": [{"flowId": 1, "flowDescriptions": [f"permit out udp from any {1024 + iteration % 60000} to {ue}"]}],
+        }
+        created = await recorder.timed("create", client.post(base, json=body))
+        subscription_id = created.headers.get("location", "").rsplit("/", 1)[-1]
+        if created.status_code != 201 and not subscription_id:
+            continue
+        await recorder.timed("get", client.get(f"{base}/{subscription_id}"))
+        await recorder.timed("list", client.get(base))
+        await recorder.timed("delete", client.delete(f"{base}/{subscription_id}", headers=delete_headers))
+
+
+async def run(args) -> dict:
+    pcf = StubPCF(args.pcf_latency, args.pcf_jitter, args.pcf_error_rate, args.pcf_error_status,
+                  args.pcf_max_concurrent_streams, args.pcf_max_in_flight)
+    sink = CallbackSink()
+    pcf_port = await pcf.start()
+    sink_port = await sink.start()
+
+    # The NEF reads its configuration on import
+    os.environ.update(PCF_BASE_URL="127.0.0.1", PCF_PORT=str(pcf_port))
+    from app import _app, FASTAPI_VERSION
+    from app.utils.log import get_app_logger
+    get_app_logger().setLevel(getattr(logging, args.log_level))
+
+    recorder = Recorder(args.async_delete)
+    callback_url = f"http://127.0.0.1:{sink_port}/callback"
+    try:
+        async with _app.router.lifespan_context(_app):
+            transport = httpx.ASGITransport(app=_app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://nef") as client:
+                if args.warmup:
+                    await asyncio.gather(*[
+                        virtual_user(client, Recorder(args.async_delete), args.users + user, args.warmup, callback_url,
+                                     args.async_delete)
+                        for user in range(args.users)
+                    ])
+                started = time.perf_counter()
+                await asyncio.gather(*[
+                    virtual_user(client, recorder, user, args.iterations, callback_url, args.async_delete)
+                    for user in range(args.users)
+                ])
+                elapsed = time.perf_counter() - started
+            # Leaving the lifespan drains the callback dispatcher towards the sink
+    finally:
+        await pcf.stop()
+        await sink.stop()
+
+    return {
+        "nefVersion": FASTAPI_VERSION,
+        "python": platform.python_version(),
+        "config": {
+            "users": args.users,
+            "iterations": args.iterations,
+            "pcfLatency": args.pcf_latency,
+            "pcfJitter": args.pcf_jitter,
+            "pcfErrorRate": args.pcf_error_rate,
+            "pcfMaxConcurrentStreams": args.pcf_max_concurrent_streams,
+            "pcfMaxInFlight": args.pcf_max_in_flight,
+            "asyncDelete": args.async_delete,
+        },
+        "durationSeconds": round(elapsed, 3),
+        "operations": {
+            op: summarize(recorder.latencies[op], recorder.errors[op], elapsed) for op in OPERATIONS
+        },
+        "pcf": pcf.stats(),
+        "callbacks": sink.stats(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--users", type=int, default=20, help="concurrent virtual users")
+    parser.add_argument("--iterations", type=int, default=100, help="create/get/list/delete rounds per user")
+    parser.add_argument("--warmup", type=int, default=5, help="untimed rounds per user before measuring")
+    parser.add_argument("--pcf-latency", type=float, default=0.0)
+    parser.add_argument("--pcf-jitter", type=float, default=0.0)
+    parser.add_argument("--pcf-error-rate", type=float, default=0.0)
+    parser.add_argument("--pcf-error-status", type=int, default=500)
+    parser.add_argument("--pcf-max-concurrent-streams", type=int, default=100)
+    parser.add_argument("--pcf-max-in-flight", type=int, default=None)
+    parser.add_argument("--async-delete", action="store_true", help='delete with "Prefer: respond-async"')
+    parser.add_argument("--log-level", default="WARNING", choices=["DEBUG", "INFO", "WARNING", "ERROR"])
+    parser.add_argument("--output", help="also write the JSON report to this file")
+    args = parser.parse_args()
+
+    report = json.dumps(asyncio.run(run(args)), indent=2)
+    print(report)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as output:
+            output.write(report + "\n")
+
+
+if __name__ == "__main__":
+    main()
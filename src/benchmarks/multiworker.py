@@ -0,0 +1,116 @@
+"""
+Read throughput of the NEF with 1..N uvicorn workers sharing the SQLite store.
+
+Preloads subscriptions into a fresh SQLite store, starts uvicorn with each
+worker count in turn and drives GET requests for random subscriptions from
+several client processes. Every request must find its subscription, which
+also checks that all workers see the shared state.
+
+    cd src && python -m benchmarks.multiworker --workers 1 2 4 --clients 8
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+from app.schemas.qos_models import AsSessionWithQosSubscriptionWithSubscriptionId
+from app.services.db import SubscriptionStore
+from app.services.persistence import SQLiteBackend
+
+SCS_AS_ID = "AS1586"
+BASE_PATH = f"/3gpp-as-session-with-qos/v1/{SCS_AS_ID}/subscriptions"
+
+
+async def preload(directory: str, subscriptions: int):
+    store = SubscriptionStore(SQLiteBackend(os.path.join(directory, "subscriptions.db"), 0.002, 3600))
+    await store.open()
+    for n in range(subscriptions):
+        store.add(SCS_AS_ID, AsSessionWithQosSubscriptionWithSubscriptionId(
+            subscriptionId=f"sub-{n}",
+            notificationDestination="https://example.com/callback",
+            ueIpv4Addr=f"10.45.{n >> 8 & 255}.{n & 255}",
+            qosReference="QOS_L",
+        ))
+    await store.close()
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_nef(directory: str, workers: int, port: int) -> subprocess.Popen:
+    env = dict(os.environ, NEF_STORE_BACKEND="sqlite", NEF_STORE_DIR=directory)
+    nef = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app:_app", "--port", str(port), "--workers", str(workers),
+         "--log-level", "warning", "--no-access-log"],
+        env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            httpx.get(f"http://127.0.0.1:{port}/docs", timeout=1)
+            return nef
+        except httpx.TransportError:
+            time.sleep(0.2)
+    nef.kill()
+    raise RuntimeError("NEF did not start")
+
+
+def client(args) -> tuple:
+    port, subscriptions, duration = args
+    done = missing = 0
+    with httpx.Client(base_url=f"http://127.0.0.1:{port}") as http:
+        deadline = time.monotonic() + duration
+        while time.monotonic() < deadline:
+            response = http.get(f"{BASE_PATH}/sub-{random.randrange(subscriptions)}")
+            done += 1
+            missing += response.status_code != 200
+    return done, missing
+
+
+def run(workers: int, clients: int, subscriptions: int, duration: float) -> dict:
+    with tempfile.TemporaryDirectory() as directory:
+        asyncio.run(preload(directory, subscriptions))
+        port = free_port()
+        nef = start_nef(directory, workers, port)
+        try:
+            with multiprocessing.Pool(clients) as pool:
+                results = pool.map(client, [(port, subscriptions, duration)] * clients)
+        finally:
+            nef.terminate()
+            nef.wait()
+    requests = sum(done for done, _ in results)
+    return {
+        "workers": workers,
+        "clients": clients,
+        "requestsPerSecond": round(requests / duration),
+        "notFound": sum(missing for _, missing in results),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--clients", type=int, default=8)
+    parser.add_argument("--subscriptions", type=int, default=10_000)
+    parser.add_argument("--duration", type=float, default=10.0)
+    args = parser.parse_args()
+
+    print(json.dumps({"cpus": os.cpu_count()}))
+    for workers in args.workers:
+        print(json.dumps(run(workers, args.clients, args.subscriptions, args.duration)))
+
+
+if __name__ == "__main__":
+    main()
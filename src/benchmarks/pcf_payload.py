@@ -0,0 +1,86 @@
+"""
+CPU cost of building the Npcf create body: pydantic models vs precompiled template.
+
+"models" is the per-request path the templates replaced: build
+MediaSubComponent/MediaComponent/AppSessionContextReqData/AppSessionContext,
+model_dump(mode="json"), then json.dumps. "template" is
+PayloadTemplate.render(). Both produce the same JSON document.
+
+    cd src && python -m benchmarks.pcf_payload --iterations 20000
+"""
+import argparse
+import json
+import time
+
+from app.services.qos_catalogue import get_qos_catalogue
+from app.schemas.qos_models import (
+    AppSessionContext, AppSessionContextReqData, AsSessionWithQosSubscription,
+    FlowStatus, MediaComponent, MediaSubComponent, MediaType,
+)
+from app.utils.app_config import QOS_MAPPING
+
+SUBSCRIPTION = AsSessionWithQosSubscription(
+    notificationDestination="https://example.com/callback",
+    supportedFeatures="003C",
+    qosReference="QOS_L",
+    ueIpv4Addr="10.45.0.3",
+    flowInfo=[{"flowId": 1, "flowDescriptions": [
+        "permit in ip from 10.45.0.4 to any",
+        "permit out ip from any to 10.45.0.4",
+    ]}],
+)
+
+
+def build_with_models(subscription: AsSessionWithQosSubscription) -> bytes:
+    profile = QOS_MAPPING[subscription.qosReference]
+    med_components = {}
+    for flow in subscription.flowInfo or []:
+        med_components["1"] = MediaComponent(
+            medCompN=1,
+            fStatus=FlowStatus.ENABLED,
+            medType=MediaType[profile["mediaType"]],
+            marBwUl=profile["marBwUl"],
+            marBwDl=profile["marBwDl"],
+            medSubComps={str(flow.flowId): MediaSubComponent.from_flow_info(flow)},
+        )
+    req_data = AppSessionContextReqData.from_subscription(
+        from_subscription=subscription,
+        medComponents=med_components,
+        notifUri=subscription.notificationDestination,
+    )
+    return json.dumps(AppSessionContext(ascReqData=req_data).model_dump(mode="json")).encode("utf-8")
+
+
+def build_with_template(subscription: AsSessionWithQosSubscription) -> bytes:
+    return get_qos_catalogue().template(subscription.qosReference).render(subscription)
+
+
+def measure(build, iterations: int) -> float:
+    """Best of three runs, in microseconds per payload."""
+    best = float("inf")
+    for _ in range(3):
+        started = time.perf_counter()
+        for _ in range(iterations):
+            build(SUBSCRIPTION)
+        best = min(best, time.perf_counter() - started)
+    return best / iterations * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--iterations", type=int, default=20_000)
+    args = parser.parse_args()
+
+    assert json.loads(build_with_models(SUBSCRIPTION)) == json.loads(build_with_template(SUBSCRIPTION))
+    models = measure(build_with_models, args.iterations)
+    template = measure(build_with_template, args.iterations)
+    print(json.dumps({
+        "iterations": args.iterations,
+        "modelsUsPerPayload": round(models, 2),
+        "templateUsPerPayload": round(template, 2),
+        "speedup": round(models / template, 1),
+    }))
+
+
+if __name__ == "__main__":
+    main()
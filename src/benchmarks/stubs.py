@@ -0,0 +1,221 @@
+"""
+Stand-ins for the NEF's peers, for load tests.
+
+StubPCF is an h2c Npcf_PolicyAuthorization simulator: creates answer 201
+with a Location header, deletes answer 204, after a configurable latency,
+with a configurable error rate and a limit on concurrently served
+requests. CallbackSink is an HTTP/1.1 server that accepts and counts AF
+notifications.
+
+    cd src && python -m benchmarks.stubs --pcf-port 7777 --latency 0.005 --error-rate 0.01
+"""
+import argparse
+import asyncio
+import itertools
+import random
+from typing import Optional, Set
+
+from h2.config import H2Configuration
+from h2.connection import H2Connection
+from h2.events import ConnectionTerminated, DataReceived, RequestReceived, StreamEnded, StreamReset
+from h2.exceptions import ProtocolError
+from h2.settings import SettingCodes
+
+APP_SESSIONS_PATH = "/npcf-policyauthorization/v1/app-sessions"
+
+
+class StubPCF:
+    """h2c PCF simulator with configurable latency, error rate and concurrency."""
+
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0, error_rate: float = 0.0, error_status: int = 500,
+                 max_concurrent_streams: int = 100, max_in_flight: Optional[int] = None):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.max_concurrent_streams = max_concurrent_streams
+        # Requests beyond max_in_flight wait for a slot, like a saturated PCF
+        self._slots = asyncio.Semaphore(max_in_flight) if max_in_flight else None
+        self._session_ids = itertools.count(1)
+        self._tasks: Set[asyncio.Task] = set()
+        self.server: Optional[asyncio.AbstractServer] = None
+        self.connections = 0
+        self.requests = 0
+        self.errors = 0
+        self.in_flight = 0
+        self.max_seen_in_flight = 0
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> int:
+        self.server = await asyncio.start_server(self._handle, host, port)
+        return self.server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        self.server.close()
+        for task in list(self._tasks):
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        await self.server.wait_closed()
+
+    def stats(self) -> dict:
+        return {
+            "connections": self.connections,
+            "requests": self.requests,
+            "errors": self.errors,
+            "maxInFlight": self.max_seen_in_flight,
+        }
+
+    def _track(self, coro):
+        task = asyncio.create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self._tasks.add(asyncio.current_task())
+        self.connections += 1
+        conn = H2Connection(H2Configuration(client_side=False, header_encoding="utf-8"))
+        conn.initiate_connection()
+        conn.update_settings({SettingCodes.MAX_CONCURRENT_STREAMS: self.max_concurrent_streams})
+        writer.write(conn.data_to_send())
+        requests = {}
+        try:
+            while True:
+                data = await reader.read(65535)
+                if not data:
+                    break
+                for event in conn.receive_data(data):
+                    if isinstance(event, RequestReceived):
+                        headers = dict(event.headers)
+                        requests[event.stream_id] = (headers[":method"], headers[":path"])
+                    elif isinstance(event, DataReceived):
+                        conn.acknowledge_received_data(event.flow_controlled_length, event.stream_id)
+                    elif isinstance(event, StreamEnded):
+                        method, path = requests.pop(event.stream_id)
+                        self._track(self._respond(conn, writer, event.stream_id, method, path))
+                    elif isinstance(event, StreamReset):
+                        requests.pop(event.stream_id, None)
+                    elif isinstance(event, ConnectionTerminated):
+                        return
+                writer.write(conn.data_to_send())
+        except (ConnectionError, ProtocolError, asyncio.CancelledError):
+            pass
+        finally:
+            self._tasks.discard(asyncio.current_task())
+            writer.close()
+
+    async def _respond(self, conn: H2Connection, writer: asyncio.StreamWriter, stream_id: int, method: str, path: str):
+        self.in_flight += 1
+        self.max_seen_in_flight = max(self.max_seen_in_flight, self.in_flight)
+        try:
+            if self._slots is not None:
+                async with self._slots:
+                    await self._wait()
+            else:
+                await self._wait()
+        finally:
+            self.in_flight -= 1
+        self.requests += 1
+
+        if random.random() < self.error_rate:
+            self.errors += 1
+            headers = [(":status", str(self.error_status))]
+        elif method == "POST" and path.rstrip("/") == APP_SESSIONS_PATH:
+            headers = [(":status", "201"), ("location", f"http://pcf{APP_SESSIONS_PATH}/{next(self._session_ids)}")]
+        else:
+            headers = [(":status", "204")]
+        try:
+            conn.send_headers(stream_id, headers, end_stream=True)
+            writer.write(conn.data_to_send())
+        except (ProtocolError, ConnectionError):
+            # The client reset the stream (timeout) or went away
+            pass
+
+    async def _wait(self):
+        delay = self.latency + (random.uniform(0, self.jitter) if self.jitter else 0.0)
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+class CallbackSink:
+    """Minimal HTTP/1.1 server that answers every AF notification with 204 and counts them."""
+
+    def __init__(self, status: int = 204):
+        self.status = status
+        self.received = 0
+        self._tasks: Set[asyncio.Task] = set()
+        self.server: Optional[asyncio.AbstractServer] = None
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> int:
+        self.server = await asyncio.start_server(self._handle, host, port)
+        return self.server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        self.server.close()
+        for task in list(self._tasks):
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        await self.server.wait_closed()
+
+    def stats(self) -> dict:
+        return {"received": self.received}
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self._tasks.add(asyncio.current_task())
+        try:
+            while True:
+                head = await reader.readuntil(b"\r\n\r\n")
+                length = 0
+                for line in head.split(b"\r\n")[1:]:
+                    name, _, value = line.partition(b":")
+                    if name.strip().lower() == b"content-length":
+                        length = int(value)
+                if length:
+                    await reader.readexactly(length)
+                self.received += 1
+                writer.write(f"HTTP/1.1 {self.status} No Content\r\ncontent-length: 0\r\n\r\n".encode())
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError, asyncio.CancelledError):
+            pass
+        finally:
+            self._tasks.discard(asyncio.current_task())
+            writer.close()
+
+
+async def serve(args):
+    pcf = StubPCF(args.latency, args.jitter, args.error_rate, args.error_status,
+                  args.max_concurrent_streams, args.max_in_flight)
+    sink = CallbackSink()
+    pcf_port = await pcf.start(args.host, args.pcf_port)
+    sink_port = await sink.start(args.host, args.sink_port)
+    print(f"Stub PCF (h2c) on {args.host}:{pcf_port}, AF callback sink on http://{args.host}:{sink_port}/callback")
+    try:
+        while True:
+            await asyncio.sleep(10)
+            print({"pcf": pcf.stats(), "callbacks": sink.stats()})
+    finally:
+        await pcf.stop()
+        await sink.stop()
+
+
+def add_pcf_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument("--latency", type=float, default=0.0, help="PCF response latency (seconds)")
+    parser.add_argument("--jitter", type=float, default=0.0, help="extra uniform random latency (seconds)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of PCF requests that fail")
+    parser.add_argument("--error-status", type=int, default=500)
+    parser.add_argument("--max-concurrent-streams", type=int, default=100, help="advertised per connection")
+    parser.add_argument("--max-in-flight", type=int, default=None, help="requests the PCF serves at once")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the stub PCF and AF callback sink")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--pcf-port", type=int, default=7777)
+    parser.add_argument("--sink-port", type=int, default=9000)
+    add_pcf_arguments(parser)
+    try:
+        asyncio.run(serve(parser.parse_args()))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
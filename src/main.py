@@ -4,7 +4,7 @@
 '''
 from app.utils.log import get_app_logger 
 from app import _app
-from app.utils.app_config import NEF_BASE_URL,PCF_BASE_URL,PCF_PORT
+from app.utils.app_config import NEF_BASE_URL,PCF_BASE_URL,PCF_PORT,NEF_WORKERS,NEF_STORE_BACKEND
 
 logger = get_app_logger()
 
@@ -15,4 +15,11 @@ logger.info(f'PCF PORT: {PCF_PORT}')
 
 if __name__ == "__main__":
   import uvicorn
-  uvicorn.run(_app, host="0.0.0.0", port=8585)
+  if NEF_WORKERS > 1:
+    # Workers are separate processes: they only see each other's subscriptions through the shared SQLite store
+    if NEF_STORE_BACKEND != "sqlite":
+      raise SystemExit(f"NEF_WORKERS={NEF_WORKERS} requires NEF_STORE_BACKEND=sqlite (got {NEF_STORE_BACKEND})")
+    logger.info(f'Workers: {NEF_WORKERS}')
+    uvicorn.run("app:_app", host="0.0.0.0", port=8585, workers=NEF_WORKERS)
+  else:
+    uvicorn.run(_app, host="0.0.0.0", port=8585)